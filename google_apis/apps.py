@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GoogleApisConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'google_apis'
+
+    def ready(self):
+        from google_apis import checks  # noqa: F401
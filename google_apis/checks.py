@@ -0,0 +1,19 @@
+from django.core.checks import Warning, register
+
+
+@register()
+def check_credential_encryption_keys(app_configs, **kwargs):
+    """Warn when Google tokens are encrypted with the SECRET_KEY-derived fallback key."""
+    from google_apis.util.CredentialStore import configured_keys
+
+    if configured_keys():
+        return []
+    return [
+        Warning(
+            "GOOGLE_CREDENTIAL_ENCRYPTION_KEYS is not set; Google tokens are encrypted with a key "
+            "derived from SECRET_KEY.",
+            hint="Stored tokens become unreadable if SECRET_KEY changes. Set "
+                 "GOOGLE_CREDENTIAL_ENCRYPTION_KEYS to one or more Fernet keys to rotate them independently.",
+            id="google_apis.W001",
+        )
+    ]
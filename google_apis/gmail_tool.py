@@ -1,3 +1,4 @@
+from google_apis.util.Attachment import AttachmentTooLarge, AttachmentUnavailable
 from google_apis.util.Gmail import Gmail
 from django.http import JsonResponse
 from django.http.request import HttpRequest
@@ -5,6 +6,9 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 import json
 
+# Most messages whose bodies can be requested at once
+MAX_BODY_IDS = 100
+
 
 @csrf_exempt
 @require_POST
@@ -111,7 +115,31 @@ def gmail_api(request: HttpRequest):
                         "status": False,
                         "message": "Email retrieval failed"
                     }, status=400)
-                response = gmail.get_email_messages(email_id, page_size=page_size)
+                include_body = data.get("include_body", True)
+                response = gmail.get_email_messages(email_id, page_size=page_size, include_body=include_body)
+                success_message = "Emails retrieved successfully"
+
+            elif operation == "get_email_bodies":
+                message_ids = data.get("message_ids")
+                if not message_ids:
+                    return JsonResponse({
+                        "error": "Message IDs are missing",
+                        "status": False,
+                        "message": "Email retrieval failed"
+                    }, status=400)
+                if not isinstance(message_ids, list) or not all(isinstance(message_id, str) for message_id in message_ids):
+                    return JsonResponse({
+                        "error": "Message IDs must be a list of strings",
+                        "status": False,
+                        "message": "Email retrieval failed"
+                    }, status=400)
+                if len(message_ids) > MAX_BODY_IDS:
+                    return JsonResponse({
+                        "error": f"At most {MAX_BODY_IDS} message IDs can be requested at once",
+                        "status": False,
+                        "message": "Email retrieval failed"
+                    }, status=400)
+                response = gmail.get_email_bodies(message_ids)
                 success_message = "Emails retrieved successfully"
 
             else:
@@ -126,6 +154,18 @@ def gmail_api(request: HttpRequest):
                 "status": True,
                 "message": success_message
             })     
+    except AttachmentTooLarge as e:
+        return JsonResponse({
+            "error": str(e),
+            "status": False,
+            "message": f"{data.get('operation')} failed"
+        }, status=413)
+    except (AttachmentUnavailable, TimeoutError) as e:
+        return JsonResponse({
+            "error": str(e),
+            "status": False,
+            "message": f"{data.get('operation')} failed"
+        }, status=400)
     except Exception as e:
         operation_name = data.get("operation", "Unknown operation")
         return JsonResponse({
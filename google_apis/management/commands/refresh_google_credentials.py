@@ -0,0 +1,117 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from google.auth.exceptions import RefreshError
+from google.oauth2.credentials import Credentials
+from google_apis.models import GoogleCredential
+from google_apis.util.Auth import Auth, resolve_scopes
+from google_apis.util.CredentialStore import credential_store
+from google_apis.util.TokenRefresher import token_refresher
+
+
+class Command(BaseCommand):
+    help = (
+        "Check every stored Google credential, refresh the ones that are expired or "
+        "about to expire, and record the outcome in GoogleCredential.status."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Credentials loaded per batch")
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent token refreshes")
+        parser.add_argument(
+            "--margin", type=int, default=None,
+            help="Refresh tokens expiring within this many seconds (default GOOGLE_TOKEN_REFRESH_MARGIN)",
+        )
+        parser.add_argument("--apps", default="", help="Comma separated apps whose scopes must be granted")
+        parser.add_argument("--dry-run", action="store_true", help="Only report, do not refresh")
+
+    def handle(self, *args, **options):
+        self.margin = options["margin"] if options["margin"] is not None else token_refresher.margin
+        self.dry_run = options["dry_run"]
+        apps = [app.strip() for app in options["apps"].split(",") if app.strip()]
+        self.apps = apps or ["all"]
+        self.required_scopes = resolve_scopes(tuple(apps)) if apps else frozenset()
+
+        totals = Counter()
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            batch = []
+            for row in credential_store.bulk_load(batch_size=options["batch_size"]):
+                batch.append(row)
+                if len(batch) >= options["batch_size"]:
+                    totals.update(self.process_batch(executor, batch))
+                    batch = []
+            if batch:
+                totals.update(self.process_batch(executor, batch))
+
+        elapsed = time.monotonic() - started
+        checked = sum(totals.values())
+        summary = ", ".join(f"{status}={count}" for status, count in sorted(totals.items()))
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {checked} credential(s) in {elapsed:.1f}s "
+            f"({checked / elapsed if elapsed else 0:.1f}/s): {summary or 'nothing to do'}"
+        ))
+
+    def process_batch(self, executor, batch):
+        statuses = {}
+        due = []
+        for uid, info, meta_info in batch:
+            status = self.classify(info)
+            if status == "due":
+                due.append(uid)
+            else:
+                statuses[uid] = status
+
+        for uid, status in zip(due, executor.map(self.refresh, due)):
+            statuses[uid] = status
+
+        self.record(statuses)
+        self.stdout.write(f"Processed batch of {len(batch)} credential(s), {len(due)} due for refresh")
+        return Counter(statuses.values())
+
+    def classify(self, info):
+        """Status that needs no network call, or "due" when a refresh is needed."""
+        try:
+            creds = Credentials.from_authorized_user_info(info, info.get("scopes"))
+        except ValueError:
+            return "invalid"
+
+        if self.required_scopes - set(creds.scopes or ()):
+            return "missing_scopes"
+        if creds.expiry and token_refresher.seconds_left(creds.expiry) > self.margin:
+            return "valid"
+        if not creds.refresh_token:
+            return "expired"
+        return "expiring" if self.dry_run else "due"
+
+    def refresh(self, uid):
+        """
+        Refresh one credential. Revoked credentials are kept so their status
+        shows who has to authorize again; one failure never stops the run.
+        """
+        try:
+            auth = Auth(uid, apps=self.apps)
+            refreshed, error = auth.refresh_token(), auth.refresh_error
+        except Exception as e:
+            refreshed, error = False, e
+        finally:
+            close_old_connections()
+
+        if refreshed:
+            return "refreshed"
+        if isinstance(error, RefreshError) and "invalid_grant" in str(error):
+            return "revoked"
+        self.stderr.write(f"Refreshing {uid} failed: {error}")
+        return "error"
+
+    def record(self, statuses):
+        checked_at = timezone.now()
+        by_status = {}
+        for uid, status in statuses.items():
+            by_status.setdefault(status, []).append(uid)
+        for status, uids in by_status.items():
+            GoogleCredential.objects.filter(uuid__in=uids).update(status=status, checked_at=checked_at)
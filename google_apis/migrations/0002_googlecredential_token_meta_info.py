@@ -0,0 +1,94 @@
+import base64
+import hashlib
+import json
+import os
+from cryptography.fernet import Fernet, MultiFernet
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copies of the google_apis.util.CredentialStore helpers as they were when
+# this migration was written, so later changes there cannot break it
+TOKEN_FIELDS = ("token", "refresh_token", "token_uri", "client_id", "client_secret", "scopes", "expiry", "rapt_token")
+TOKEN_DEFAULTS = {"universe_domain": "googleapis.com", "account": ""}
+
+
+def get_fernet():
+    keys = [key.strip() for key in (os.getenv("GOOGLE_CREDENTIAL_ENCRYPTION_KEYS") or "").split(",") if key.strip()]
+    if not keys:
+        keys = [base64.urlsafe_b64encode(hashlib.sha256(settings.SECRET_KEY.encode()).digest())]
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+def encrypt_token(fernet, info):
+    compact = {
+        key: info[key]
+        for key in info
+        if info[key] not in (None, "", [])
+        and (key in TOKEN_FIELDS or (key in TOKEN_DEFAULTS and info[key] != TOKEN_DEFAULTS[key]))
+    }
+    return fernet.encrypt(json.dumps(compact, separators=(",", ":")).encode())
+
+
+def decrypt_token(fernet, blob):
+    return json.loads(fernet.decrypt(bytes(blob)))
+
+
+def forwards(apps, schema_editor):
+    fernet = get_fernet()
+    GoogleCredential = apps.get_model('google_apis', 'GoogleCredential')
+    seen = set()
+    # Newest row wins when a uid was stored more than once; the older duplicates
+    # are deleted so uuid can be made unique. Rows without a uid are all kept.
+    for row in GoogleCredential.objects.order_by('-id').iterator():
+        if row.uuid is not None:
+            if row.uuid in seen:
+                row.delete()
+                continue
+            seen.add(row.uuid)
+
+        credential = dict(row.credential or {})
+        row.meta_info = credential.pop('meta_info', None) or {}
+        row.token = encrypt_token(fernet, credential) if credential else None
+        row.save(update_fields=['token', 'meta_info'])
+
+
+def backwards(apps, schema_editor):
+    fernet = get_fernet()
+    GoogleCredential = apps.get_model('google_apis', 'GoogleCredential')
+    for row in GoogleCredential.objects.iterator():
+        credential = decrypt_token(fernet, row.token) if row.token else {}
+        if row.meta_info:
+            credential['meta_info'] = row.meta_info
+        row.credential = credential
+        row.save(update_fields=['credential'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_apis', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='googlecredential',
+            name='token',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='googlecredential',
+            name='meta_info',
+            field=models.JSONField(default=dict, null=True),
+        ),
+        migrations.RunPython(forwards, backwards),
+        migrations.RemoveField(
+            model_name='googlecredential',
+            name='credential',
+        ),
+        migrations.AlterField(
+            model_name='googlecredential',
+            name='uuid',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+    ]
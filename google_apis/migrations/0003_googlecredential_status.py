@@ -0,0 +1,23 @@
+# Generated by Django 4.2.5 on 2026-10-19 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_apis', '0002_googlecredential_token_meta_info'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='googlecredential',
+            name='checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='googlecredential',
+            name='status',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.5 on 2026-10-19 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_apis', '0003_googlecredential_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GmailMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.CharField(max_length=255)),
+                ('message_id', models.CharField(max_length=64)),
+                ('thread_id', models.CharField(blank=True, max_length=64, null=True)),
+                ('history_id', models.BigIntegerField(blank=True, null=True)),
+                ('headers', models.JSONField(default=dict)),
+                ('body', models.TextField(blank=True, null=True)),
+                ('labels', models.JSONField(default=list)),
+                ('cached_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['uuid', 'cached_at'], name='google_apis_uuid_a3d6e5_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='gmailmessage',
+            constraint=models.UniqueConstraint(fields=('uuid', 'message_id'), name='unique_gmail_message_per_user'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.5 on 2026-10-19 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_apis', '0004_gmailmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GmailSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.CharField(max_length=255, unique=True)),
+                ('email_address', models.CharField(blank=True, max_length=255, null=True)),
+                ('history_id', models.BigIntegerField()),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-19 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_apis', '0005_gmailsyncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gmailmessage',
+            name='snippet',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-19 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('google_apis', '0007_googlecredential_refresh_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gmailsyncstate',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
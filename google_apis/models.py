@@ -2,8 +2,15 @@ from django.db import models
 
 
 class GoogleCredential(models.Model):
-    uuid = models.CharField(max_length=255, null=True, blank=True)
-    credential = models.JSONField(default=dict, null=True)
+    uuid = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    # Encrypted, compact authorized-user token (see google_apis.util.CredentialStore)
+    token = models.BinaryField(null=True)
+    meta_info = models.JSONField(default=dict, null=True)
+    # Outcome of the last refresh_google_credentials health check
+    status = models.CharField(max_length=32, null=True, blank=True)
+    checked_at = models.DateTimeField(null=True, blank=True)
+    # Set while one process refreshes the token (see Auth.claim_refresh)
+    refresh_claimed_at = models.DateTimeField(null=True, blank=True)
     
     def __str__(self):
         return f'{self.uuid}'
@@ -11,5 +18,47 @@ class GoogleCredential(models.Model):
     def to_dict(self):
         return {
             'uuid': self.uuid,
-            'credential': self.credential
+            'meta_info': self.meta_info,
+            'status': self.status,
+            'checked_at': self.checked_at
         }
+
+
+class GmailMessage(models.Model):
+    """Parsed copy of a Gmail message (see google_apis.util.MessageCache)."""
+    uuid = models.CharField(max_length=255)
+    message_id = models.CharField(max_length=64)
+    thread_id = models.CharField(max_length=64, null=True, blank=True)
+    # historyId the labels below are current as of
+    history_id = models.BigIntegerField(null=True, blank=True)
+    headers = models.JSONField(default=dict)
+    # Null when only the metadata profile has been fetched
+    body = models.TextField(null=True, blank=True)
+    snippet = models.TextField(null=True, blank=True)
+    labels = models.JSONField(default=list)
+    cached_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["uuid", "message_id"], name="unique_gmail_message_per_user"),
+        ]
+        indexes = [
+            models.Index(fields=["uuid", "cached_at"]),
+        ]
+
+    def __str__(self):
+        return f'{self.uuid}:{self.message_id}'
+
+
+class GmailSyncState(models.Model):
+    """Last Gmail historyId processed for an account (see Gmail.sync_messages)."""
+    uuid = models.CharField(max_length=255, unique=True)
+    email_address = models.CharField(max_length=255, null=True, blank=True)
+    # 0 until the first sync has completed
+    history_id = models.BigIntegerField()
+    synced_at = models.DateTimeField(auto_now=True)
+    # Set while one process syncs the account (see Gmail.claim_sync)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.uuid}:{self.history_id}'
@@ -1,10 +1,21 @@
+import csv
+import itertools
 import json
-from google_apis.util.Sheet import Sheet
-from django.http import JsonResponse
+import logging
+from google_apis.util.A1 import parse_range, split_tab
+from google_apis.util.Sheet import Sheet, TAG_ROWS
+from google_apis.util.SheetSnapshot import FILTER_OPERATORS, AGGREGATIONS
+from google_apis.util.WriteBuffer import append_buffer
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
 
+logger = logging.getLogger('django')
+# Developer metadata key for rows written on behalf of an agent session
+SESSION_TAG = "session_id"
+
+
 @csrf_exempt
 @require_POST
 def google_sheets_api(request):
@@ -16,6 +27,9 @@ def google_sheets_api(request):
     - search_by_keyword: Search for a keyword in rows or columns
     - update_cell_by_keyword: Update a cell based on a keyword search
     - delete_by_keyword: Delete rows or cells based on a keyword search
+    - aggregate_values: Filter, search, sort and group a range by its header columns
+    - export_values: Stream a large range as NDJSON or CSV
+    - pipeline: Run an ordered list of the operations above (`steps`) with one Sheet
     
     Request Parameters:
     - `operation` (str): The operation to perform (required)
@@ -43,24 +57,9 @@ def google_sheets_api(request):
             return JsonResponse({"error": f"Please provide the following fields: {', '.join(missing_fields)}"}, status=400)
         
         with Sheet(tool_id) as sheet:
-            if operation == "append_values" or operation == "update_values":
-                return handle_write_values(sheet, data)
-            elif operation == "get_values":
-                return handle_get_values(sheet, data)
-            elif operation == "search_by_keyword":
-                return handle_search_by_keyword(sheet, data)
-            elif operation == "update_cell_by_keyword":
-                return handle_update_cell_by_keyword(sheet, data)
-            elif operation == "update_row_by_keyword":
-                return handle_update_row_by_keyword(sheet, data)
-            elif operation == "delete_by_keyword":
-                return handle_delete_by_keyword(sheet, data)
-            else:
-                return JsonResponse({
-                    "error": f"Invalid operation: {operation}",
-                    "status": False,
-                    "message": "Operation failed"
-                }, status=400)
+            if operation == "pipeline":
+                return handle_pipeline(sheet, data)
+            return dispatch_operation(sheet, data)
     except Exception as e:
         return JsonResponse({
             "error": str(e),
@@ -69,6 +68,95 @@ def google_sheets_api(request):
         }, status=500)
 
 
+def dispatch_operation(sheet: Sheet, data):
+    """Run a single operation and return its response."""
+    handler = OPERATION_HANDLERS.get(data.get("operation"))
+    if handler is None:
+        return JsonResponse({
+            "error": f"Invalid operation: {data.get('operation')}",
+            "status": False,
+            "message": "Operation failed"
+        }, status=400)
+    return handler(sheet, data)
+
+
+def handle_pipeline(sheet: Sheet, data):
+    """
+    Handle pipeline operation: run `steps`, a list of operation requests, in
+    order against one spreadsheet with the same authenticated Sheet. Reads are
+    shared between steps through the range cache, and consecutive
+    update_values steps are merged into one values.batchUpdate.
+    Stops at the first failing step unless `stop_on_error` is false.
+    """
+    sheet_id = data.get("sheet_id")
+    steps = data.get("steps") or []
+    stop_on_error = data.get("stop_on_error", True)
+
+    if not isinstance(steps, list) or not steps:
+        return JsonResponse({
+            "error": "Missing required field (steps)",
+            "status": False,
+            "message": "Pipeline failed"
+        }, status=400)
+    unsupported = [step.get("operation") for step in steps if step.get("operation") in PIPELINE_EXCLUDED]
+    if unsupported:
+        return JsonResponse({
+            "error": f"Operations not allowed in a pipeline: {', '.join(unsupported)}",
+            "status": False,
+            "message": "Pipeline failed"
+        }, status=400)
+
+    results = []
+    position = 0
+    while position < len(steps):
+        run = _mergeable_writes(steps, position)
+        if len(run) > 1:
+            results.extend(_run_merged_writes(sheet, sheet_id, run))
+            position += len(run)
+        else:
+            step = {**steps[position], "sheet_id": sheet_id}
+            try:
+                response = dispatch_operation(sheet, step)
+                results.append({"operation": step.get("operation"), "status_code": response.status_code, **json.loads(response.content)})
+            except Exception as e:
+                results.append({"operation": step.get("operation"), "status_code": 500, "error": str(e), "status": False})
+            position += 1
+        if stop_on_error and results[-1]["status_code"] >= 400:
+            break
+
+    succeeded = len(results) == len(steps) and all(result["status_code"] < 400 for result in results)
+    return JsonResponse({
+        "result": results,
+        "status": succeeded,
+        "message": "Pipeline completed successfully" if succeeded else "Pipeline failed"
+    }, status=200 if succeeded else 207)
+
+
+def _mergeable_writes(steps, start):
+    """The run of consecutive update_values steps from `start` that can share one batchUpdate."""
+    run = []
+    for step in steps[start:]:
+        if step.get("operation") != "update_values" or not step.get("range_name") or not step.get("values"):
+            break
+        if run and step.get("value_input_option", "USER_ENTERED") != run[0].get("value_input_option", "USER_ENTERED"):
+            break
+        run.append(step)
+    return run
+
+
+def _run_merged_writes(sheet: Sheet, sheet_id, run):
+    data = [{"range": step["range_name"], "values": step["values"]} for step in run]
+    value_input_option = run[0].get("value_input_option", "USER_ENTERED")
+    try:
+        responses = sheet.batch_write_values(sheet_id, data, value_input_option).get("responses", [])
+    except Exception as e:
+        return [{"operation": "update_values", "status_code": 500, "error": str(e), "status": False} for _ in run]
+    return [
+        {"operation": "update_values", "status_code": 200, "result": response, "status": True, "message": "Values updated successfully"}
+        for response in responses
+    ]
+
+
 def handle_write_values(sheet, data):
     """Handle append_values and update_values operations"""
     operation = data.get("operation", None)
@@ -76,6 +164,7 @@ def handle_write_values(sheet, data):
     value_input_option = data.get("value_input_option", "USER_ENTERED")
     values = data.get("values", [])
     sheet_id = data.get("sheet_id", None)
+    buffered = data.get("buffered", False)  # Coalesce appends with other callers' rows
     
     if not range_name or not values or not sheet_id or not operation:
         return JsonResponse({
@@ -84,7 +173,23 @@ def handle_write_values(sheet, data):
             "message": "Operation failed"
         }, status=400)
     
-    if operation == "append_values":
+    if operation == "append_values" and buffered:
+        # Earlier queued rows were already answered with 202, so report their loss here
+        failures = append_buffer.take_failures(sheet.uid, sheet_id)
+        if failures:
+            return JsonResponse({
+                "error": f"{sum(failure['rows'] for failure in failures)} previously queued rows were not appended: {failures[-1]['error']}",
+                "failures": failures,
+                "status": False,
+                "message": "Values not queued for append"
+            }, status=500)
+        append_buffer.append(sheet.uid, sheet_id, range_name, value_input_option, values)
+        return JsonResponse({
+            "result": {"queued_rows": len(values)},
+            "status": True,
+            "message": "Values queued for append"
+        }, status=202)
+    elif operation == "append_values":
         response = sheet.append_values(sheet_id, range_name, value_input_option, values)
     else:  # update_values
         response = sheet.update_values(sheet_id, range_name, value_input_option, values)
@@ -108,7 +213,14 @@ def handle_get_values(sheet, data):
             "message": "Values retrieval failed"
         }, status=400)
     
-    response = sheet.get_values(sheet_id, range_name)
+    try:
+        response = sheet.get_values(sheet_id, range_name, **_read_options(data))
+    except ValueError as e:
+        return JsonResponse({
+            "error": str(e),
+            "status": False,
+            "message": "Values retrieval failed"
+        }, status=400)
     return JsonResponse({
         "result": response,
         "status": True,
@@ -116,11 +228,22 @@ def handle_get_values(sheet, data):
     })
 
 
+def _read_options(data):
+    """Optional read parameters of a request, as accepted by Sheet.get_values."""
+    return {
+        "major_dimension": data.get("major_dimension"),
+        "value_render_option": data.get("value_render_option"),
+        "date_time_render_option": data.get("date_time_render_option"),
+        "fields": data.get("fields"),
+    }
+
+
 def handle_search_by_keyword(sheet: Sheet, data):
     """Handle search_by_keyword operation"""
     sheet_id = data.get("sheet_id")
     search_keyword = data.get("search_keyword", "").lower()  # Convert to lowercase for case-insensitive search
     search_type = data.get("search_type", "row")  # "row" or "column"
+    match_mode = data.get("match_mode", "substring")  # "substring", "prefix" or "exact"
     _range_name = data.get("range_name", None)
     
     if not search_keyword or not _range_name:
@@ -132,8 +255,15 @@ def handle_search_by_keyword(sheet: Sheet, data):
 
     sheet_name = _range_name.split("!")[0] if "!" in _range_name else "Sheet1"
 
+    if match_mode not in ("substring", "prefix", "exact"):
+        return JsonResponse({
+            "error": "Invalid match_mode. Use 'substring', 'prefix' or 'exact'.",
+            "status": False,
+            "message": "Search failed"
+        }, status=400)
+
     if search_type == "row":
-        row_numbers = sheet.find_row(sheet_id, search_keyword, _range_name)
+        row_numbers = sheet.find_row(sheet_id, search_keyword, _range_name, mode=match_mode)
         if not row_numbers:
             return JsonResponse({
                 "error": "Keyword not found in any row",
@@ -214,11 +344,11 @@ def handle_update_cell_by_keyword(sheet: Sheet, data):
 
     sheet_name = _range_name.split("!")[0] if "!" in _range_name else "Sheet1"
 
-    responses = []
-    for row_number in row_numbers:
-        range_name = f"{sheet_name}!{column}{row_number}"
-        response = sheet.update_values(sheet_id, range_name, "USER_ENTERED", [[new_value]])
-        responses.append({f"{column}{row_number}": response})
+    # One values.batchUpdate for all matches instead of a request per row
+    labels = [f"{column}{row_number}" for row_number in row_numbers]
+    updates = [{"range": f"{sheet_name}!{label}", "values": [[new_value]]} for label in labels]
+    result = sheet.batch_write_values(sheet_id, updates, "USER_ENTERED")
+    responses = [{label: response} for label, response in zip(labels, result.get("responses", []))]
 
     return JsonResponse({
         "result": responses,
@@ -248,10 +378,24 @@ def handle_update_row_by_keyword(sheet: Sheet, data):
             "message": "Update failed"
         }, status=400)
     
-    row_numbers = sheet.find_row(sheet_id, search_keyword, _range_name)  # Find all matching rows
+    sheet_name = _range_name.split("!")[0] if "!" in _range_name else "Sheet1"
+    tag_session = TAG_ROWS and search_by_session_id
+
+    row_numbers = None
+    if tag_session:
+        # Tagged rows are found without downloading the sheet
+        row_numbers = _find_session_rows(sheet, sheet_id, session_id, split_tab(_range_name)[0])
+    if not row_numbers:
+        row_numbers = sheet.find_row(sheet_id, search_keyword, _range_name)  # Find all matching rows
+        if row_numbers and tag_session:
+            _tag_session_rows(sheet, sheet_id, row_numbers, session_id, sheet_name)
 
     if not row_numbers:
         response = sheet.append_values(sheet_id, _range_name, value_input_option, values)
+        if tag_session:
+            appended = parse_range(response.get("updates", {}).get("updatedRange", ""))
+            if appended is not None and appended.last_row is not None:
+                _tag_session_rows(sheet, sheet_id, range(appended.first_row, appended.last_row + 1), session_id, sheet_name)
         return JsonResponse({
             "result": response,
             "status": True,
@@ -261,32 +405,23 @@ def handle_update_row_by_keyword(sheet: Sheet, data):
     if single_update:
         row_numbers = [row_numbers[0]]  # Keep only the first match
 
-    sheet_name = _range_name.split("!")[0] if "!" in _range_name else "Sheet1"
+    if len(values) > 1:
+        return JsonResponse({
+            "error": "Values should be a single list for row update",
+            "status": False,
+            "message": "Update failed"
+        }, status=400)
+    if len(values[0]) == 0:
+        return JsonResponse({
+            "error": "Values cannot be empty for row update",
+            "status": False,
+            "message": "Update failed"
+        }, status=400)
 
-    responses = []
-    for row_number in row_numbers:
-        range_name = f"{sheet_name}!{row_number}:{row_number}"  # Update the entire row
-        if len(values) == 0:
-            return JsonResponse({
-                "error": "Values cannot be empty for row update",
-                "status": False,
-                "message": "Update failed"
-            })
-        if len(values) > 1:
-            return JsonResponse({
-                "error": "Values should be a single list for row update",
-                "status": False,
-                "message": "Update failed"
-            }, status=400)
-        if len(values[0]) == 0:
-            return JsonResponse({
-                "error": "Values cannot be empty for row update",
-                "status": False,
-                "message": "Update failed"
-            }, status=400)
-            
-        response = sheet.update_values(sheet_id, range_name, value_input_option, values)
-        responses.append({f"{row_number}": response})
+    # One values.batchUpdate for all matched rows instead of a request per row
+    updates = [{"range": f"{sheet_name}!{row_number}:{row_number}", "values": values} for row_number in row_numbers]
+    result = sheet.batch_write_values(sheet_id, updates, value_input_option)
+    responses = [{f"{row_number}": response} for row_number, response in zip(row_numbers, result.get("responses", []))]
         
     if not responses:
         return JsonResponse({
@@ -302,6 +437,23 @@ def handle_update_row_by_keyword(sheet: Sheet, data):
     })
 
 
+def _find_session_rows(sheet: Sheet, sheet_id, session_id, sheet_name):
+    """Row numbers tagged with a session id, or None when the lookup fails."""
+    try:
+        return [row_number for row_number, _ in sheet.find_tagged_rows(sheet_id, SESSION_TAG, session_id, sheet_name)]
+    except Exception as e:
+        logger.info(f"Tagged row lookup failed for {sheet_id}: {e}")
+        return None
+
+
+def _tag_session_rows(sheet: Sheet, sheet_id, row_numbers, session_id, sheet_name):
+    """Tag rows with a session id; the write itself already succeeded, so failures are only logged."""
+    try:
+        sheet.tag_rows(sheet_id, list(row_numbers), SESSION_TAG, session_id, sheet_name)
+    except Exception as e:
+        logger.warning(f"Tagging rows failed for {sheet_id}, developer metadata may be full: {e}")
+
+
 def handle_delete_by_keyword(sheet: Sheet, data):
     """Handle delete_by_keyword operation"""
     sheet_id = data.get("sheet_id")
@@ -340,11 +492,8 @@ def handle_delete_by_keyword(sheet: Sheet, data):
     if delete_type == "row":
         response = sheet.delete_rows(sheet_id, row_numbers, sheet_name)
     elif delete_type == "cell" and column:
-        responses = []
-        for row in row_numbers:
-            _range_name = f"{sheet_name}!{column}{row}"
-            responses.append(sheet.update_values(sheet_id, _range_name, "USER_ENTERED", [[""]]))  # Clear cell
-        response = {"result": responses}
+        updates = [{"range": f"{sheet_name}!{column}{row}", "values": [[""]]} for row in row_numbers]  # Clear cells
+        response = {"result": sheet.batch_write_values(sheet_id, updates, "USER_ENTERED").get("responses", [])}
     else:
         return JsonResponse({
             "error": "Invalid delete_type or missing column for cell deletion",
@@ -356,4 +505,157 @@ def handle_delete_by_keyword(sheet: Sheet, data):
         "result": response,
         "status": True,
         "message": f"{delete_type.capitalize()} deletion successful"
-    })
\ No newline at end of file
+    })
+
+
+def handle_aggregate_values(sheet: Sheet, data):
+    """
+    Handle aggregate_values operation. Columns are referred to by header name.
+
+    - `filters`: [{"column", "operator", "value"}], all of which must match
+    - `search` / `search_columns`: case-insensitive keyword over some or all columns
+    - `sort_by` / `descending`: order of the returned rows
+    - `group_by` / `aggregations`: e.g. "Region" and {"Amount": "sum"}
+    - `limit`: maximum number of rows or groups returned
+    """
+    sheet_id = data.get("sheet_id")
+    range_name = data.get("range_name")
+    header_row = data.get("header_row", 0)
+    filters = data.get("filters", [])
+    group_by = data.get("group_by")
+    aggregations = data.get("aggregations", {})
+    limit = data.get("limit")
+
+    if not range_name:
+        return JsonResponse({
+            "error": "Missing required field (range_name)",
+            "status": False,
+            "message": "Aggregation failed"
+        }, status=400)
+
+    invalid = []
+    if not isinstance(filters, list) or not all(isinstance(f, dict) for f in filters):
+        invalid.append("filters must be a list of objects")
+    if not isinstance(aggregations, dict):
+        invalid.append("aggregations must be an object")
+    if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit < 1):
+        invalid.append("limit must be a positive integer")
+    if not isinstance(header_row, int) or isinstance(header_row, bool) or header_row < 0:
+        invalid.append("header_row must be a non-negative integer")
+    if invalid:
+        return JsonResponse({
+            "error": f"Invalid request: {'; '.join(invalid)}",
+            "status": False,
+            "message": "Aggregation failed"
+        }, status=400)
+
+    invalid_operators = [f.get("operator") for f in filters if f.get("operator") not in FILTER_OPERATORS]
+    invalid_aggregations = [a for a in aggregations.values() if a not in AGGREGATIONS]
+    if invalid_operators or invalid_aggregations:
+        return JsonResponse({
+            "error": f"Invalid operators or aggregations: {', '.join(map(str, invalid_operators + invalid_aggregations))}",
+            "status": False,
+            "message": "Aggregation failed"
+        }, status=400)
+
+    snapshot = sheet.get_snapshot(sheet_id, range_name, header_row)
+    try:
+        for condition in filters:
+            snapshot = snapshot.filter(condition.get("column"), condition.get("operator"), condition.get("value"))
+        if data.get("search"):
+            snapshot = snapshot.search(data["search"], data.get("search_columns"))
+        if data.get("sort_by"):
+            snapshot = snapshot.sort(data["sort_by"], data.get("descending", False))
+
+        if group_by:
+            groups = snapshot.group_by(group_by, aggregations)
+            result = {"groups": groups[:limit] if limit else groups}
+        else:
+            if limit:
+                snapshot = snapshot.head(limit)
+            result = {"values": snapshot.to_rows(), "row_numbers": snapshot.row_numbers.tolist()}
+    except ValueError as e:
+        return JsonResponse({
+            "error": str(e),
+            "status": False,
+            "message": "Aggregation failed"
+        }, status=400)
+
+    return JsonResponse({
+        "result": result,
+        "status": True,
+        "message": "Aggregation successful"
+    })
+
+
+class _Echo:
+    """File-like object whose write returns the line, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def handle_export_values(sheet: Sheet, data):
+    """
+    Handle export_values operation. Rows are read in windows and streamed, one
+    JSON array per line for `format` "ndjson" (default) or as "csv".
+    """
+    sheet_id = data.get("sheet_id")
+    range_name = data.get("range_name")
+    export_format = data.get("format", "ndjson")
+    window = data.get("window")
+    windows_per_request = data.get("windows_per_request", 1)
+
+    if not range_name:
+        return JsonResponse({
+            "error": "Missing required field (range_name)",
+            "status": False,
+            "message": "Export failed"
+        }, status=400)
+    if export_format not in ("ndjson", "csv"):
+        return JsonResponse({
+            "error": "Invalid format. Use 'ndjson' or 'csv'.",
+            "status": False,
+            "message": "Export failed"
+        }, status=400)
+    for name, value in (("window", window), ("windows_per_request", windows_per_request)):
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 1):
+            return JsonResponse({
+                "error": f"Invalid {name}. Use a positive integer.",
+                "status": False,
+                "message": "Export failed"
+            }, status=400)
+
+    rows = sheet.iter_rows(
+        sheet_id, range_name, window=window, windows_per_request=windows_per_request,
+        value_render_option=data.get("value_render_option"),
+        date_time_render_option=data.get("date_time_render_option"),
+    )
+    # Read the first window up front so API errors still produce a JSON error response
+    first = list(itertools.islice(rows, 1))
+    rows = itertools.chain(first, rows)
+
+    if export_format == "csv":
+        writer = csv.writer(_Echo())
+        content = (writer.writerow(row) for row in rows)
+        content_type = "text/csv"
+    else:
+        content = (json.dumps(row) + "\n" for row in rows)
+        content_type = "application/x-ndjson"
+    return StreamingHttpResponse(content, content_type=content_type)
+
+
+OPERATION_HANDLERS = {
+    "append_values": handle_write_values,
+    "update_values": handle_write_values,
+    "get_values": handle_get_values,
+    "search_by_keyword": handle_search_by_keyword,
+    "update_cell_by_keyword": handle_update_cell_by_keyword,
+    "update_row_by_keyword": handle_update_row_by_keyword,
+    "delete_by_keyword": handle_delete_by_keyword,
+    "aggregate_values": handle_aggregate_values,
+    "export_values": handle_export_values,
+}
+
+# Streaming responses cannot be embedded in a pipeline result
+PIPELINE_EXCLUDED = ("pipeline", "export_values")
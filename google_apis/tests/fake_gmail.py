@@ -0,0 +1,219 @@
+import base64
+from googleapiclient.errors import HttpError
+from httplib2 import Response
+
+# historyTypes and the history record field each one fills
+HISTORY_FIELDS = {
+    "messageAdded": "messagesAdded",
+    "messageDeleted": "messagesDeleted",
+    "labelAdded": "labelsAdded",
+    "labelRemoved": "labelsRemoved",
+}
+
+
+def encode(text):
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def make_message(message_id, sender, to, subject, body, date="Mon, 1 Jan 2024 10:00:00 +0000", labels=("INBOX",), history_id=100):
+    return {
+        "id": message_id,
+        "threadId": message_id,
+        "historyId": str(history_id),
+        "labelIds": list(labels),
+        "snippet": body[:20],
+        "payload": {
+            "mimeType": "multipart/alternative",
+            "headers": [
+                {"name": "From", "value": sender},
+                {"name": "To", "value": to},
+                {"name": "Subject", "value": subject},
+                {"name": "Date", "value": date},
+            ],
+            "parts": [
+                {"mimeType": "text/plain", "body": {"data": encode(body)}},
+                {"mimeType": "text/html", "body": {"data": encode(f"<p>{body}</p>")}},
+            ],
+        },
+    }
+
+
+class _Call:
+
+    def __init__(self, service, name, result):
+        self.service = service
+        self.name = name
+        self.result = result
+
+    def execute(self):
+        self.service.calls.append(self.name)
+        return self.result()
+
+
+class _Batch:
+
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.calls = []
+
+    def add(self, call, callback=None, request_id=None):
+        self.calls.append((call, callback or self.callback, request_id))
+
+    def execute(self):
+        self.service.calls.append(f"batch({len(self.calls)})")
+        for call, callback, request_id in self.calls:
+            try:
+                response, exception = call.result(), None
+            except HttpError as e:
+                response, exception = None, e
+            callback(request_id, response, exception)
+
+
+class FakeGmail:
+    """
+    In-memory stand-in for `build("gmail", "v1")` holding a list of messages.
+    Every executed call, and every batch with its size, is recorded in `calls`.
+    Messages arriving through `deliver` and label changes made through
+    `relabel` are recorded as history, served `page_size` records a page;
+    history older than `oldest_history_id` is gone and answers 404.
+    """
+
+    def __init__(self, messages=None):
+        self.store = {message["id"]: message for message in (messages or [])}
+        self.calls = []
+        self.history_id = max([int(m["historyId"]) for m in self.store.values()] or [100])
+        self.oldest_history_id = 1
+        self.records = []
+        self.page_size = 100
+        self.uploads = []
+        # Status every history.list call fails with, when set
+        self.history_error = None
+
+    def deliver(self, message):
+        self.history_id += 1
+        message["historyId"] = str(self.history_id)
+        self.store[message["id"]] = message
+        self.records.append({
+            "id": str(self.history_id),
+            "messagesAdded": [{"message": {"id": message["id"], "threadId": message["threadId"]}}],
+        })
+
+    def relabel(self, message_id, labels):
+        self.history_id += 1
+        message = self.store[message_id]
+        message["labelIds"] = list(labels)
+        message["historyId"] = str(self.history_id)
+        self.records.append({
+            "id": str(self.history_id),
+            "labelsAdded": [{"message": {"id": message_id, "labelIds": list(labels)}, "labelIds": list(labels)}],
+        })
+
+    def header(self, message, name):
+        return next((h["value"] for h in message["payload"]["headers"] if h["name"].lower() == name.lower()), "")
+
+    def matches(self, message, query):
+        for term in (query or "").split():
+            field, _, value = term.partition(":")
+            if field == "from" and value not in self.header(message, "From"):
+                return False
+            if field == "to" and value not in self.header(message, "To"):
+                return False
+        return True
+
+    def not_found(self, message_id):
+        return self.error(404, f"messages/{message_id}")
+
+    def error(self, status, uri):
+        return HttpError(Response({"status": str(status)}), f'{{"error": {{"code": {status}}}}}'.encode(), uri=uri)
+
+    # API surface
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(self, callback)
+
+    def users(self):
+        return self
+
+    def getProfile(self, userId):
+        return _Call(self, "getProfile", lambda: {"emailAddress": "me@example.com", "historyId": str(self.history_id)})
+
+    def messages(self):
+        return _FakeMessages(self)
+
+    def history(self):
+        return _FakeHistory(self)
+
+    def drafts(self):
+        return _FakeDrafts(self)
+
+    def upload(self, name, media_body):
+        """Read a media upload the way the client library would and keep it in `uploads`."""
+        self.uploads.append({
+            "name": name,
+            "mimetype": media_body.mimetype(),
+            "resumable": media_body.resumable(),
+            "chunksize": media_body.chunksize(),
+            "data": media_body.getbytes(0, media_body.size()),
+        })
+        return {"id": f"{name}-{len(self.uploads)}"}
+
+
+class _FakeMessages:
+
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId, q=None, maxResults=100, pageToken=None, **kwargs):
+        def run():
+            # Newest first, like the API
+            found = [message for message in reversed(self.service.store.values()) if self.service.matches(message, q)]
+            return {"messages": [{"id": m["id"], "threadId": m["threadId"]} for m in found[:maxResults]]}
+        return _Call(self.service, "messages.list", run)
+
+    def get(self, userId, id, format="full", metadataHeaders=None, **kwargs):
+        def run():
+            if id not in self.service.store:
+                raise self.service.not_found(id)
+            message = self.service.store[id]
+            if format == "metadata":
+                headers = [h for h in message["payload"]["headers"] if h["name"] in (metadataHeaders or [h["name"]])]
+                return {**{k: v for k, v in message.items() if k != "payload"}, "payload": {"headers": headers}}
+            return message
+        return _Call(self.service, f"messages.get({format})", run)
+
+    def send(self, userId, body=None, media_body=None):
+        return _Call(self.service, "messages.send", lambda: self.service.upload("message", media_body))
+
+
+class _FakeDrafts:
+
+    def __init__(self, service):
+        self.service = service
+
+    def create(self, userId, body=None, media_body=None):
+        return _Call(self.service, "drafts.create", lambda: self.service.upload("draft", media_body))
+
+
+class _FakeHistory:
+
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId, startHistoryId, historyTypes=None, pageToken=None, **kwargs):
+        def run():
+            if self.service.history_error:
+                raise self.service.error(self.service.history_error, "history")
+            if int(startHistoryId) < self.service.oldest_history_id:
+                raise self.service.not_found(f"history/{startHistoryId}")
+            kinds = {HISTORY_FIELDS[kind] for kind in (historyTypes or HISTORY_FIELDS)}
+            records = [
+                record for record in self.service.records
+                if int(record["id"]) > int(startHistoryId) and kinds & set(record)
+            ]
+            offset = int(pageToken or 0)
+            page = {"history": records[offset:offset + self.service.page_size], "historyId": str(self.service.history_id)}
+            if offset + self.service.page_size < len(records):
+                page["nextPageToken"] = str(offset + self.service.page_size)
+            return page
+        return _Call(self.service, "history.list", run)
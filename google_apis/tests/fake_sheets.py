@@ -0,0 +1,191 @@
+import re
+
+
+def _column_index(letters):
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def _column_letter(index):
+    letter = ""
+    index += 1
+    while index > 0:
+        index -= 1
+        letter = chr(index % 26 + ord("A")) + letter
+        index //= 26
+    return letter
+
+
+class _Call:
+
+    def __init__(self, service, name, result):
+        self.service = service
+        self.name = name
+        self.result = result
+
+    def execute(self):
+        self.service.calls.append(self.name)
+        return self.result() if callable(self.result) else self.result
+
+
+class FakeSpreadsheets:
+    """
+    In-memory stand-in for `build("sheets", "v4").spreadsheets()` backed by a
+    single grid. Every executed call is recorded in `calls`.
+    """
+
+    def __init__(self, rows=None, title="Sheet1", gid=0):
+        self.rows = [list(row) for row in (rows or [])]
+        self.title = title
+        self.gid = gid
+        self.calls = []
+        self.metadata = []
+        # (title, gid) of further, empty tabs
+        self.other_tabs = []
+
+    # A1 helpers
+
+    def parse(self, range_name):
+        a1 = range_name.split("!")[-1]
+        match = re.fullmatch(r"([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?", a1)
+        start_col, start_row, end_col, end_row = match.groups()
+        first_row = int(start_row) - 1 if start_row else 0
+        if match.group(3) is None and match.group(4) is None:
+            last_row = first_row if start_row else None
+            end_col = start_col
+        else:
+            last_row = int(end_row) - 1 if end_row else None
+        first_col = _column_index(start_col) if start_col else 0
+        last_col = _column_index(end_col) if end_col else None
+        return first_row, last_row, first_col, last_col
+
+    def read(self, range_name):
+        first_row, last_row, first_col, last_col = self.parse(range_name)
+        rows = self.rows[first_row:None if last_row is None else last_row + 1]
+        values = [row[first_col:None if last_col is None else last_col + 1] for row in rows]
+        while values and not any(values[-1]):
+            values.pop()
+        values = [self._trim(row) for row in values]
+        return {"range": range_name, "majorDimension": "ROWS", "values": values} if values else {"range": range_name, "majorDimension": "ROWS"}
+
+    def write(self, range_name, values):
+        first_row, _, first_col, _ = self.parse(range_name)
+        for offset, row in enumerate(values):
+            index = first_row + offset
+            while len(self.rows) <= index:
+                self.rows.append([])
+            target = self.rows[index]
+            while len(target) < first_col + len(row):
+                target.append("")
+            target[first_col:first_col + len(row)] = row
+        last_row = first_row + len(values)
+        last_col = first_col + max((len(row) for row in values), default=1) - 1
+        return f"{self.title}!{_column_letter(first_col)}{first_row + 1}:{_column_letter(last_col)}{last_row}"
+
+    @staticmethod
+    def _trim(row):
+        row = list(row)
+        while row and row[-1] == "":
+            row.pop()
+        return row
+
+    # API surface
+
+    def values(self):
+        return _FakeValues(self)
+
+    def get(self, spreadsheetId, **kwargs):
+        return _Call(self, "get", lambda: {
+            "spreadsheetId": spreadsheetId,
+            "sheets": [{"properties": {
+                "sheetId": self.gid,
+                "title": self.title,
+                "index": 0,
+                "gridProperties": {"rowCount": max(len(self.rows), 1000), "columnCount": 26},
+            }}] + [{"properties": {
+                "sheetId": gid,
+                "title": title,
+                "index": index,
+                "gridProperties": {"rowCount": 1000, "columnCount": 26},
+            }} for index, (title, gid) in enumerate(self.other_tabs, start=1)],
+        })
+
+    def batchUpdate(self, spreadsheetId, body):
+        def run():
+            replies = []
+            for request in body["requests"]:
+                if "deleteDimension" in request:
+                    dimension = request["deleteDimension"]["range"]
+                    del self.rows[dimension["startIndex"]:dimension["endIndex"]]
+                    removed = dimension["endIndex"] - dimension["startIndex"]
+                    self.metadata = [
+                        (key, value, row if row < dimension["startIndex"] else row - removed)
+                        for key, value, row in self.metadata
+                        if not dimension["startIndex"] <= row < dimension["endIndex"]
+                    ]
+                if "createDeveloperMetadata" in request:
+                    metadata = request["createDeveloperMetadata"]["developerMetadata"]
+                    row = metadata["location"]["dimensionRange"]["startIndex"]
+                    self.metadata.append((metadata["metadataKey"], metadata["metadataValue"], row))
+                replies.append({})
+            return {"spreadsheetId": spreadsheetId, "replies": replies}
+        return _Call(self, "batchUpdate", run)
+
+
+class _FakeValues:
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+
+    def get(self, spreadsheetId, range, **kwargs):
+        return _Call(self.sheet, "values.get", lambda: self.sheet.read(range))
+
+    def batchGet(self, spreadsheetId, ranges, **kwargs):
+        return _Call(self.sheet, "values.batchGet", lambda: {
+            "spreadsheetId": spreadsheetId,
+            "valueRanges": [self.sheet.read(name) for name in ranges],
+        })
+
+    def batchGetByDataFilter(self, spreadsheetId, body, **kwargs):
+        def run():
+            value_ranges = []
+            for data_filter in body["dataFilters"]:
+                lookup = data_filter["developerMetadataLookup"]
+                for key, value, row in sorted(self.sheet.metadata, key=lambda item: item[2]):
+                    if key == lookup["metadataKey"] and value == lookup["metadataValue"]:
+                        value_range = self.sheet.read(f"A{row + 1}:Z{row + 1}")
+                        value_range["range"] = f"{self.sheet.title}!A{row + 1}:Z{row + 1}"
+                        value_ranges.append({"valueRange": value_range, "dataFilters": [data_filter]})
+            return {"spreadsheetId": spreadsheetId, "valueRanges": value_ranges}
+        return _Call(self.sheet, "values.batchGetByDataFilter", run)
+
+    def _response(self, spreadsheetId, updated, include_values):
+        response = {"spreadsheetId": spreadsheetId, "updatedRange": updated}
+        if include_values:
+            response["updatedData"] = {"range": updated, "values": self.sheet.read(updated).get("values", [])}
+        return response
+
+    def update(self, spreadsheetId, range, valueInputOption, body, includeValuesInResponse=False):
+        def run():
+            updated = self.sheet.write(range, body["values"])
+            return self._response(spreadsheetId, updated, includeValuesInResponse)
+        return _Call(self.sheet, "values.update", run)
+
+    def append(self, spreadsheetId, range, valueInputOption, body, insertDataOption=None, includeValuesInResponse=False):
+        def run():
+            next_row = len(self.sheet.rows) + 1
+            first_col = _column_letter(self.sheet.parse(range)[2])
+            updated = self.sheet.write(f"{first_col}{next_row}", body["values"])
+            return {"spreadsheetId": spreadsheetId, "updates": self._response(spreadsheetId, updated, includeValuesInResponse)}
+        return _Call(self.sheet, "values.append", run)
+
+    def batchUpdate(self, spreadsheetId, body):
+        def run():
+            responses = []
+            for value_range in body["data"]:
+                updated = self.sheet.write(value_range["range"], value_range["values"])
+                responses.append(self._response(spreadsheetId, updated, body.get("includeValuesInResponse")))
+            return {"spreadsheetId": spreadsheetId, "responses": responses}
+        return _Call(self.sheet, "values.batchUpdate", run)
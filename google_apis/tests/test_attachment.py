@@ -0,0 +1,111 @@
+import email
+import json
+import os
+import tempfile
+import threading
+import time
+from email import policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from django.test import RequestFactory, SimpleTestCase
+from google_apis.gmail_tool import gmail_api
+from google_apis.tests.test_gmail import make_gmail
+from google_apis.util.Attachment import AttachmentTooLarge, AttachmentUnavailable, load_attachment
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    body = os.urandom(4096)
+
+    def do_GET(self):
+        if "missing" in self.path:
+            self.send_error(404)
+            return
+        if "stalled" in self.path:
+            time.sleep(1)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf; name=report.pdf")
+        if "sized" in self.path:
+            self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class AttachmentTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _FileHandler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(handle, "wb") as fp:
+            fp.write(b"attached notes")
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_url_attachments_are_streamed_and_capped(self):
+        spooled, filename, content_type = load_attachment(self.url + "files/report.pdf?sized=1")
+        with spooled:
+            self.assertEqual(spooled.read(), _FileHandler.body)
+        self.assertEqual((filename, content_type), ("report.pdf", "application/pdf"))
+
+        with self.assertRaises(AttachmentTooLarge):
+            load_attachment(self.url + "sized", max_bytes=1024)
+        with self.assertRaises(AttachmentTooLarge):
+            load_attachment(self.url + "chunked", max_bytes=1024)
+        with self.assertRaises(AttachmentTooLarge):
+            load_attachment(self.path, max_bytes=4)
+
+    def test_failed_downloads_are_unavailable(self):
+        for url, timeout in ((self.url + "missing", None), (self.url + "stalled", 0.2), ("http://127.0.0.1:1/", None)):
+            with self.assertRaises(AttachmentUnavailable, msg=url):
+                load_attachment(url, timeout=timeout)
+
+    def test_messages_are_sent_as_media_uploads(self):
+        gmail = make_gmail([])
+        gmail.send_send_message_with_attachment("See attached", "ada@example.com", "me@example.com", "Notes", self.path)
+        with mock.patch("google_apis.util.Gmail.SIMPLE_UPLOAD_BYTES", 10):
+            draft = gmail.create_draft_with_attachment("See attached", "ada@example.com", "me@example.com", "Notes", self.path)
+
+        sent, drafted = gmail.gmail.uploads
+        self.assertEqual((sent["mimetype"], sent["resumable"], drafted["resumable"]), ("message/rfc822", False, True))
+        # Resumable uploads read the message a few MB at a time, not in one 100 MB chunk
+        self.assertEqual(drafted["chunksize"], 4 * 1024 * 1024)
+        self.assertEqual(gmail.draft_id, draft["id"])
+
+        message = email.message_from_bytes(sent["data"], policy=policy.default)
+        self.assertEqual(message["To"], "ada@example.com")
+        self.assertEqual(message.get_body().get_content().strip(), "See attached")
+        attachment = next(message.iter_attachments())
+        self.assertEqual(attachment.get_filename(), os.path.basename(self.path))
+        self.assertEqual(attachment.get_content(), "attached notes")
+
+    def test_attachment_errors_get_client_status_codes(self):
+        request = RequestFactory().post("/", json.dumps({
+            "operation": "send_message_with_attachment", "tool_id": "uid-1", "message": "hi",
+            "to": "a@example.com", "sender": "b@example.com", "subject": "report", "attachment": self.path,
+        }), content_type="application/json")
+        with mock.patch("google_apis.gmail_tool.Gmail") as gmail_class:
+            send = gmail_class.return_value.__enter__.return_value.send_send_message_with_attachment
+            for error, status in ((AttachmentTooLarge("Attachment is larger than 4 bytes"), 413),
+                                  (TimeoutError("Attachment download took longer than 30s"), 400),
+                                  (AttachmentUnavailable("Attachment could not be downloaded: 404"), 400)):
+                send.side_effect = error
+                response = gmail_api(request)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(json.loads(response.content), {
+                    "error": str(error), "status": False, "message": "send_message_with_attachment failed",
+                })
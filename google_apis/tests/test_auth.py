@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+from django.test import SimpleTestCase, TestCase
+from google.oauth2.credentials import Credentials
+from google_apis.util.Auth import Auth, resolve_scopes
+from google_apis.util.Constants import EXTRA_SCOPES, SHEET_SCOPES, GMAIL_SCOPES
+from google_apis.util.CredentialCache import CredentialCache, credential_cache
+from google_apis.util.CredentialStore import credential_store
+
+
+class AuthScopeTests(SimpleTestCase):
+
+    def test_scopes_are_resolved_once_per_combination(self):
+        scopes = resolve_scopes(("sheet", "gmail"))
+        self.assertIs(scopes, resolve_scopes(("sheet", "gmail")))
+        self.assertEqual(scopes, frozenset(SHEET_SCOPES + GMAIL_SCOPES + EXTRA_SCOPES))
+
+    def test_unknown_apps_only_need_extra_scopes(self):
+        self.assertEqual(resolve_scopes(("sheets",)), frozenset(EXTRA_SCOPES))
+
+
+class AuthCachedCredentialTests(TestCase):
+
+    def setUp(self):
+        expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=1)
+        self.creds = Credentials(
+            token="token",
+            expiry=expiry,
+            scopes=list(resolve_scopes(("sheet",))),
+        )
+        credential_cache.put("cached-uid", self.creds, {"email": "user@example.com"})
+
+    def tearDown(self):
+        credential_cache.clear()
+
+    def test_cached_credentials_skip_database(self):
+        auth = Auth("cached-uid", apps=["sheet"])
+        self.assertIs(auth.creds, self.creds)
+        self.assertEqual(auth.meta_info, {"email": "user@example.com"})
+        self.assertTrue(auth.check_auth())
+
+    def test_cached_credentials_still_need_the_scopes(self):
+        auth = Auth("cached-uid", apps=["gmail"])
+        self.assertFalse(auth.check_auth())
+
+    def stored_info(self, apps):
+        return {
+            "token": "token",
+            "refresh_token": "refresh",
+            "client_id": "client-id",
+            "client_secret": "secret",
+            "token_uri": "https://oauth2.googleapis.com/token",
+            "scopes": list(resolve_scopes(apps)),
+            "expiry": self.creds.expiry.isoformat() + "Z",
+        }
+
+    def test_scope_misses_reread_the_store(self):
+        # Another worker re-authorized with Gmail added
+        credential_store.save("cached-uid", self.stored_info(("sheet", "gmail")), {"email": "user@example.com"})
+        auth = Auth("cached-uid", apps=["gmail"])
+        self.assertTrue(auth.check_auth())
+        self.assertIsNot(auth.creds, self.creds)
+
+    def test_entries_expire_after_max_age(self):
+        cache = CredentialCache(max_entries=10, max_age=-1)
+        cache.put("uid", self.creds)
+        self.assertIsNone(cache.get("uid"))
+
+    def test_refresh_leaves_the_cached_object_alone(self):
+        credential_store.save("cached-uid", self.stored_info(("sheet",)), {"email": "user@example.com"})
+        cached = Credentials.from_authorized_user_info(self.stored_info(("sheet",)))
+        credential_cache.put("cached-uid", cached, {"email": "user@example.com"})
+
+        def refresh(creds, request):
+            creds.token = "fresh"
+
+        auth = Auth("cached-uid", apps=["sheet"])
+        self.assertIs(auth.creds, cached)
+        with mock.patch.object(Credentials, "refresh", autospec=True, side_effect=refresh):
+            self.assertTrue(auth.refresh_token())
+        self.assertEqual(cached.token, "token")
+        self.assertEqual(auth.creds.token, "fresh")
+        self.assertEqual(credential_cache.get("cached-uid").creds.token, "fresh")
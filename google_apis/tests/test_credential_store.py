@@ -0,0 +1,92 @@
+import os
+from unittest import mock
+from cryptography.fernet import Fernet
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.test import TestCase, TransactionTestCase
+from google_apis.checks import check_credential_encryption_keys
+from google_apis.models import GoogleCredential
+from google_apis.util.CredentialStore import credential_store, decrypt_token
+
+
+TOKEN_INFO = {
+    "token": "access-token",
+    "refresh_token": "refresh-token",
+    "token_uri": "https://oauth2.googleapis.com/token",
+    "client_id": "client-id",
+    "client_secret": "client-secret",
+    "scopes": ["https://www.googleapis.com/auth/spreadsheets"],
+    "universe_domain": "googleapis.com",
+    "account": "",
+    "expiry": "2030-01-01T00:00:00Z",
+}
+
+
+class CredentialStoreTests(TestCase):
+
+    def test_round_trip_drops_defaults(self):
+        credential_store.save("uid-1", TOKEN_INFO, {"email": "user@example.com"})
+        info, meta_info = credential_store.load("uid-1")
+
+        self.assertEqual(meta_info, {"email": "user@example.com"})
+        self.assertEqual(info["refresh_token"], "refresh-token")
+        self.assertNotIn("universe_domain", info)
+        self.assertNotIn("account", info)
+
+    def test_tokens_are_encrypted_at_rest(self):
+        credential_store.save("uid-1", TOKEN_INFO)
+        blob = bytes(GoogleCredential.objects.get(uuid="uid-1").token)
+        self.assertNotIn(b"refresh-token", blob)
+        self.assertEqual(decrypt_token(blob)["token"], "access-token")
+
+    def test_save_updates_single_row(self):
+        credential_store.save("uid-1", TOKEN_INFO)
+        credential_store.save("uid-1", {**TOKEN_INFO, "token": "new-token"})
+        self.assertEqual(GoogleCredential.objects.filter(uuid="uid-1").count(), 1)
+        self.assertEqual(credential_store.load("uid-1")[0]["token"], "new-token")
+
+    def test_bulk_load_and_delete(self):
+        for uid in ("uid-1", "uid-2", "uid-3"):
+            credential_store.save(uid, TOKEN_INFO)
+
+        loaded = {uid for uid, _, _ in credential_store.bulk_load(["uid-1", "uid-3"], batch_size=1)}
+        self.assertEqual(loaded, {"uid-1", "uid-3"})
+
+        self.assertTrue(credential_store.delete("uid-2"))
+        self.assertIsNone(credential_store.load("uid-2"))
+
+    def test_rapt_token_is_kept(self):
+        credential_store.save("uid-1", {**TOKEN_INFO, "rapt_token": "rapt"})
+        self.assertEqual(credential_store.load("uid-1")[0]["rapt_token"], "rapt")
+
+    def test_fallback_key_is_a_system_check_warning(self):
+        with mock.patch.dict(os.environ, {"GOOGLE_CREDENTIAL_ENCRYPTION_KEYS": ""}):
+            self.assertEqual([message.id for message in check_credential_encryption_keys(None)], ["google_apis.W001"])
+        with mock.patch.dict(os.environ, {"GOOGLE_CREDENTIAL_ENCRYPTION_KEYS": Fernet.generate_key().decode()}):
+            self.assertEqual(check_credential_encryption_keys(None), [])
+
+
+class CredentialMigrationTests(TransactionTestCase):
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([("google_apis", target)])
+        return executor.loader.project_state([("google_apis", target)]).apps
+
+    def tearDown(self):
+        self.migrate(MigrationLoader(connection).graph.leaf_nodes("google_apis")[0][1])
+
+    def test_duplicates_collapse_to_newest_and_rows_without_uid_are_kept(self):
+        old_apps = self.migrate("0001_initial")
+        OldCredential = old_apps.get_model("google_apis", "GoogleCredential")
+        OldCredential.objects.create(uuid="uid-1", credential={**TOKEN_INFO, "token": "old"})
+        OldCredential.objects.create(uuid="uid-1", credential={**TOKEN_INFO, "meta_info": {"email": "a@example.com"}})
+        OldCredential.objects.create(uuid=None, credential=TOKEN_INFO)
+        OldCredential.objects.create(uuid=None, credential=TOKEN_INFO)
+
+        self.migrate("0002_googlecredential_token_meta_info")
+        self.assertEqual(GoogleCredential.objects.filter(uuid=None).count(), 2)
+        info, meta_info = credential_store.load("uid-1")
+        self.assertEqual((info["token"], meta_info), ("access-token", {"email": "a@example.com"}))
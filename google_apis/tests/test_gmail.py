@@ -0,0 +1,297 @@
+import base64
+import json
+from unittest import mock
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+from google_apis.gmail_tool import gmail_api
+from google_apis.tests.fake_gmail import FakeGmail, encode, make_message
+from google_apis.models import GmailMessage, GmailSyncState
+from google_apis.util.Gmail import Gmail, decode_part, find_text_part, header_index
+from google_apis.util.MessageCache import MessageCache, message_cache
+
+
+def make_gmail(messages, uid="uid-1"):
+    gmail = Gmail.__new__(Gmail)
+    gmail.uid = uid
+    gmail.gmail = FakeGmail(messages)
+    return gmail
+
+
+class GmailMessagesTests(TestCase):
+
+    def setUp(self):
+        self.gmail = make_gmail([
+            make_message("m1", "ada@example.com", "me@example.com", "Hi", "hello there", "Mon, 1 Jan 2024 10:00:00 +0000"),
+            make_message("m2", "me@example.com", "ada@example.com", "Re: Hi", "hi back", "Mon, 1 Jan 2024 11:00:00 +0000"),
+            make_message("m3", "bob@example.com", "me@example.com", "Other", "unrelated"),
+        ])
+
+    def test_lists_and_messages_are_batched(self):
+        result = self.gmail.get_email_messages("ada@example.com")
+        self.assertEqual([m["id"] for m in result["messages"]], ["m1", "m2"])
+        self.assertEqual([m["type"] for m in result["messages"]], ["received", "sent"])
+        self.assertEqual(result["messages"][0]["body"].strip(), "hello there")
+        self.assertEqual(self.gmail.gmail.calls, ["batch(2)", "batch(2)"])
+
+    def test_missing_and_oddly_cased_headers(self):
+        odd = make_message("m4", "ada@example.com", "me@example.com", "Late", "late", "Mon, 1 Jan 2024 12:00:00 -0000")
+        undated = make_message("m5", "ada@example.com", "me@example.com", "No date", "none")
+        undated["payload"]["headers"] = [{"name": "from", "value": "ada@example.com"}, {"name": "SUBJECT", "value": "No date"}]
+        self.gmail.gmail.store.update({"m4": odd, "m5": undated})
+
+        result = self.gmail.get_email_messages("ada@example.com")
+        self.assertEqual([m["id"] for m in result["messages"]], ["m5", "m1", "m2", "m4"])
+        self.assertEqual(result["messages"][0]["subject"], "No date")
+        self.assertIsNone(result["messages"][0]["date"])
+
+    def test_header_index_keeps_first_occurrence(self):
+        index = header_index([{"name": "message-id", "value": "<a>"}, {"name": "Message-ID", "value": "<b>"}, {"name": "X-Other", "value": "x"}])
+        self.assertEqual(index, {"Message-ID": "<a>"})
+
+    def test_failed_fetches_are_skipped(self):
+        results = self.gmail.execute_batch([
+            self.gmail.gmail.users().messages().get(userId="me", id="m1"),
+            self.gmail.gmail.users().messages().get(userId="me", id="missing"),
+        ])
+        self.assertEqual(results[0]["id"], "m1")
+        self.assertIsNone(results[1])
+
+
+class MessageCacheTests(TestCase):
+
+    def setUp(self):
+        self.gmail = make_gmail([
+            make_message("m1", "ada@example.com", "me@example.com", "Hi", "hello there"),
+            make_message("m2", "me@example.com", "ada@example.com", "Re: Hi", "hi back"),
+        ])
+        self.fake = self.gmail.gmail
+
+    def test_cached_messages_are_refreshed_through_history(self):
+        self.gmail.get_messages(["m1", "m2"])
+        self.fake.relabel("m1", ["INBOX", "STARRED"])
+        self.fake.calls.clear()
+
+        messages = self.gmail.get_messages(["m1", "m2"])
+        self.assertEqual([m["id"] for m in messages], ["m1", "m2"])
+        self.assertEqual(messages[0]["labels"], ["INBOX", "STARRED"])
+        self.assertEqual(messages[0]["body"].strip(), "hello there")
+        self.assertEqual(self.fake.calls, ["batch(1)"])
+        self.assertEqual(GmailMessage.objects.get(uuid="uid-1", message_id="m1").history_id, 101)
+
+    def test_expired_history_refetches(self):
+        self.gmail.get_messages(["m1"])
+        self.fake.oldest_history_id = 500
+        self.fake.calls.clear()
+
+        messages = self.gmail.get_messages(["m1", "m2"])
+        self.assertEqual([m["id"] for m in messages], ["m1", "m2"])
+        self.assertEqual(self.fake.calls, ["batch(2)", "batch(1)"])
+        self.assertEqual(GmailMessage.objects.filter(uuid="uid-1").count(), 2)
+
+    def test_transient_history_errors_keep_the_cache(self):
+        self.gmail.get_messages(["m1"])
+        self.fake.history_error = 500
+        self.fake.calls.clear()
+
+        messages = self.gmail.get_messages(["m1"])
+        self.assertEqual(messages[0]["body"].strip(), "hello there")
+        self.assertEqual(self.fake.calls, ["batch(1)"])
+        self.assertTrue(GmailMessage.objects.filter(uuid="uid-1", message_id="m1").exists())
+
+    def test_long_history_is_replaced_by_a_refetch(self):
+        self.gmail.get_messages(["m1", "m2"])
+        self.fake.page_size = 1
+        for labels in (["INBOX", "STARRED"], ["INBOX"], ["STARRED"]):
+            self.fake.relabel("m2", labels)
+        self.fake.calls.clear()
+
+        with mock.patch("google_apis.util.Gmail.MAX_HISTORY_PAGES", 2):
+            messages = self.gmail.get_messages(["m1", "m2"])
+        self.assertEqual(messages[1]["labels"], ["STARRED"])
+        self.assertEqual(self.fake.calls, ["batch(1)", "history.list", "batch(2)"])
+        self.assertEqual(GmailMessage.objects.get(uuid="uid-1", message_id="m2").history_id, 103)
+
+    def test_cache_is_bounded_per_user(self):
+        cache = MessageCache(max_messages=1)
+        cache.put_many("uid-1", [{"id": "m1"}])
+        cache.put_many("uid-1", [{"id": "m2"}])
+        cache.put_many("uid-2", [{"id": "m1"}])
+        self.assertEqual(list(cache.get_many("uid-1", ["m1", "m2"])), ["m2"])
+        self.assertEqual(list(cache.get_many("uid-2", ["m1"])), ["m1"])
+
+
+class GmailSyncTests(TestCase):
+
+    def setUp(self):
+        self.gmail = make_gmail([
+            make_message("m1", "ada@example.com", "me@example.com", "Hi", "hello there"),
+        ])
+        self.fake = self.gmail.gmail
+
+    def test_first_sync_sets_the_cursor_without_reporting_old_mail(self):
+        self.assertEqual(self.gmail.sync_messages(email_address="me@example.com"), [])
+        self.assertEqual(GmailSyncState.objects.get(uuid="uid-1").history_id, 100)
+        # The recent messages were cached by the full sync
+        self.assertEqual(GmailMessage.objects.filter(uuid="uid-1").count(), 1)
+
+    def test_first_notification_reports_only_its_own_change(self):
+        self.fake.deliver(make_message("m2", "bob@example.com", "me@example.com", "One", "first"))
+        messages = self.gmail.sync_messages(history_id=self.fake.history_id)
+        self.assertEqual([m["id"] for m in messages], ["m2"])
+        self.assertEqual(GmailSyncState.objects.get(uuid="uid-1").history_id, 101)
+
+    def test_notifications_return_every_new_message(self):
+        self.gmail.sync_messages()
+        self.fake.page_size = 1
+        self.fake.deliver(make_message("m2", "bob@example.com", "me@example.com", "One", "first"))
+        self.fake.relabel("m1", ["INBOX", "STARRED"])
+        self.fake.deliver(make_message("m3", "bob@example.com", "me@example.com", "Two", "second"))
+        self.fake.calls.clear()
+
+        messages = self.gmail.sync_messages(history_id=self.fake.history_id)
+        self.assertEqual([m["id"] for m in messages], ["m2", "m3"])
+        self.assertEqual(self.fake.calls, ["history.list", "history.list", "batch(2)"])
+        self.assertEqual(GmailSyncState.objects.get(uuid="uid-1").history_id, self.fake.history_id)
+
+        # A notification that was already covered costs nothing
+        self.fake.calls.clear()
+        self.assertEqual(self.gmail.sync_messages(history_id=self.fake.history_id - 1), [])
+        self.assertEqual(self.fake.calls, [])
+
+    def test_expired_cursor_reports_only_the_notified_change(self):
+        self.gmail.sync_messages()
+        self.fake.deliver(make_message("m2", "bob@example.com", "me@example.com", "One", "first"))
+        self.fake.deliver(make_message("m3", "bob@example.com", "me@example.com", "Two", "second"))
+        self.fake.oldest_history_id = 101
+
+        messages = self.gmail.sync_messages(history_id=self.fake.history_id)
+        self.assertEqual([m["id"] for m in messages], ["m3"])
+        self.assertEqual(GmailSyncState.objects.get(uuid="uid-1").history_id, 102)
+
+    def test_cursor_only_moves_forward_and_keeps_the_address(self):
+        GmailSyncState.objects.create(uuid="uid-1", email_address="me@example.com", history_id=500)
+        # A slower delivery that read an older cursor must not move it back
+        self.assertEqual(self.gmail.sync_messages(), [])
+        state = GmailSyncState.objects.get(uuid="uid-1")
+        self.assertEqual((state.history_id, state.email_address), (500, "me@example.com"))
+
+    def test_no_transaction_is_held_during_gmail_calls(self):
+        depth = len(connection.atomic_blocks)
+        seen = []
+        full_sync = self.gmail.full_sync
+
+        def record():
+            seen.append(len(connection.atomic_blocks))
+            return full_sync()
+
+        with mock.patch.object(self.gmail, "full_sync", side_effect=record):
+            self.gmail.sync_messages()
+        self.assertEqual(seen, [depth])
+        self.assertIsNone(GmailSyncState.objects.get(uuid="uid-1").claimed_at)
+
+    def test_waits_for_a_sync_claimed_elsewhere(self):
+        self.gmail.sync_messages()
+        self.fake.deliver(make_message("m2", "bob@example.com", "me@example.com", "One", "first"))
+        GmailSyncState.objects.filter(uuid="uid-1").update(claimed_at=timezone.now())
+
+        def other_sync_finishes(seconds):
+            GmailSyncState.objects.filter(uuid="uid-1").update(history_id=self.fake.history_id, claimed_at=None)
+
+        self.fake.calls.clear()
+        with mock.patch("google_apis.util.Gmail.time.sleep", side_effect=other_sync_finishes) as sleep:
+            self.assertEqual(self.gmail.sync_messages(history_id=self.fake.history_id), [])
+        sleep.assert_called_once()
+        self.assertEqual(self.fake.calls, [])
+
+    def test_claim_is_released_when_the_sync_fails(self):
+        self.gmail.sync_messages()
+        self.fake.history_error = 500
+        with self.assertRaises(Exception):
+            self.gmail.sync_messages(history_id=self.fake.history_id + 1)
+        self.assertIsNone(GmailSyncState.objects.get(uuid="uid-1").claimed_at)
+
+    def test_webhook_returns_all_new_messages(self):
+        self.gmail.sync_messages()
+        self.fake.deliver(make_message("m2", "bob@example.com", "me@example.com", "One", "first"))
+        self.fake.deliver(make_message("m3", "bob@example.com", "me@example.com", "Two", "second"))
+        notification = json.dumps({"emailAddress": "me@example.com", "historyId": self.fake.history_id})
+
+        result = self.gmail.get_email_message_from_webhook({"message": {"data": base64.b64encode(notification.encode()).decode()}})
+        self.assertEqual([m["subject"] for m in result["messages"]], ["One", "Two"])
+        self.assertEqual(GmailSyncState.objects.get(uuid="uid-1").email_address, "me@example.com")
+
+
+class FetchProfileTests(TestCase):
+
+    def setUp(self):
+        self.gmail = make_gmail([
+            make_message("m1", "ada@example.com", "me@example.com", "Hi", "hello there"),
+            make_message("m2", "me@example.com", "ada@example.com", "Re: Hi", "hi back"),
+        ])
+        self.fake = self.gmail.gmail
+
+    def test_listing_without_bodies_fetches_metadata(self):
+        result = self.gmail.get_email_messages("ada@example.com", include_body=False)
+        self.assertEqual([m["subject"] for m in result["messages"]], ["Hi", "Re: Hi"])
+        self.assertEqual([m["body"] for m in result["messages"]], [None, None])
+        self.assertEqual(result["messages"][0]["snippet"], "hello there")
+        self.assertIsNone(GmailMessage.objects.get(uuid="uid-1", message_id="m1").body)
+
+    def test_bodies_are_loaded_on_demand_and_cached(self):
+        self.gmail.get_email_messages("ada@example.com", include_body=False)
+        self.fake.calls.clear()
+
+        bodies = self.gmail.get_email_bodies(["m1"])
+        self.assertEqual(bodies["m1"].strip(), "hello there")
+        self.assertEqual(self.fake.calls, ["batch(1)"])
+
+        # m1 now comes from the cache (with a history check), m2 still needs its body
+        self.fake.calls.clear()
+        result = self.gmail.get_email_messages("ada@example.com")
+        self.assertEqual([m["body"].strip() for m in result["messages"]], ["hello there", "hi back"])
+        self.assertEqual(self.fake.calls, ["batch(2)", "batch(2)"])
+
+    def test_metadata_refetch_keeps_cached_bodies(self):
+        self.gmail.get_email_bodies(["m1"])
+        message_cache.put_many("uid-1", [self.gmail.parse_message(self.fake.store["m1"], "metadata")])
+        self.assertEqual(GmailMessage.objects.get(uuid="uid-1", message_id="m1").body.strip(), "hello there")
+
+    def test_body_requests_are_validated(self):
+        factory = RequestFactory()
+        with mock.patch("google_apis.gmail_tool.Gmail") as gmail_class:
+            gmail = gmail_class.return_value.__enter__.return_value
+            for message_ids in ("m1", ["m1", 2], ["m%d" % i for i in range(101)]):
+                request = factory.post("/", json.dumps({"operation": "get_email_bodies", "tool_id": "uid-1", "message_ids": message_ids}), content_type="application/json")
+                self.assertEqual(gmail_api(request).status_code, 400, message_ids)
+            gmail.get_email_bodies.assert_not_called()
+
+
+class MimeWalkerTests(SimpleTestCase):
+
+    def test_finds_nested_text_and_skips_attachments(self):
+        payload = {
+            "mimeType": "multipart/mixed",
+            "parts": [
+                {"mimeType": "text/plain", "filename": "notes.txt", "body": {"attachmentId": "a1", "size": 10}},
+                {"mimeType": "multipart/alternative", "parts": [
+                    {"mimeType": "text/html", "body": {"data": encode("<p>hello</p>")}},
+                    {"mimeType": "text/plain", "body": {"data": encode("hello")}},
+                ]},
+            ],
+        }
+        self.assertEqual(decode_part(find_text_part(payload)), "hello")
+
+    def test_falls_back_to_html_then_snippet(self):
+        gmail = make_gmail([])
+        html_only = {"payload": {"mimeType": "text/html", "body": {"data": encode("<p>hi</p>")}}, "snippet": "hi"}
+        self.assertEqual(gmail.read_message(html_only), "<p>hi</p>")
+        self.assertEqual(gmail.read_message({"payload": {"mimeType": "multipart/mixed", "parts": []}, "snippet": "hi"}), "hi")
+
+    def test_decodes_declared_charset_and_unpadded_data(self):
+        part = {
+            "mimeType": "text/plain",
+            "headers": [{"name": "Content-Type", "value": 'text/plain; charset="ISO-8859-1"'}],
+            "body": {"data": base64.urlsafe_b64encode("café".encode("latin-1")).decode().rstrip("=")},
+        }
+        self.assertEqual(decode_part(part), "café")
@@ -0,0 +1,88 @@
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase
+from google.auth.exceptions import RefreshError
+from google_apis.models import GoogleCredential
+from google_apis.util.Constants import SHEET_SCOPES, EXTRA_SCOPES
+from google_apis.util.Auth import Auth
+from google_apis.util.CredentialStore import credential_store
+
+
+def token_info(**overrides):
+    info = {
+        "token": "access-token",
+        "refresh_token": "refresh-token",
+        "client_id": "client-id",
+        "client_secret": "client-secret",
+        "scopes": SHEET_SCOPES + EXTRA_SCOPES,
+        "expiry": "2099-01-01T00:00:00Z",
+    }
+    info.update(overrides)
+    return info
+
+
+class RefreshGoogleCredentialsTests(TestCase):
+
+    def setUp(self):
+        credential_store.save("valid", token_info())
+        credential_store.save("expiring", token_info(expiry="2000-01-01T00:00:00Z"))
+        credential_store.save("sheets-only", token_info(scopes=SHEET_SCOPES))
+
+    def status(self, uid):
+        return GoogleCredential.objects.get(uuid=uid).status
+
+    def test_dry_run_records_status_without_refreshing(self):
+        out = StringIO()
+        call_command("refresh_google_credentials", "--dry-run", "--batch-size", "2", stdout=out)
+
+        self.assertEqual(self.status("valid"), "valid")
+        self.assertEqual(self.status("expiring"), "expiring")
+        self.assertIn("Checked 3 credential(s)", out.getvalue())
+
+    def test_missing_scopes_for_requested_apps(self):
+        call_command("refresh_google_credentials", "--dry-run", "--apps", "sheet", stdout=StringIO())
+
+        self.assertEqual(self.status("sheets-only"), "missing_scopes")
+        self.assertIsNotNone(GoogleCredential.objects.get(uuid="valid").checked_at)
+
+    def run_refresh(self, refresh_token):
+        credential_store.save("expiring-2", token_info(expiry="2000-01-01T00:00:00Z"))
+        out = StringIO()
+        with mock.patch.object(Auth, "refresh_token", autospec=True, side_effect=refresh_token) as refresh, \
+                mock.patch.object(Auth, "remove_user_cred", autospec=True) as remove:
+            call_command("refresh_google_credentials", stdout=out, stderr=StringIO())
+        self.assertEqual(sorted(call.args[0].uid for call in refresh.call_args_list), ["expiring", "expiring-2"])
+        remove.assert_not_called()
+        return out.getvalue()
+
+    def test_due_credentials_are_refreshed(self):
+        out = self.run_refresh(lambda auth: True)
+
+        self.assertEqual(self.status("expiring"), "refreshed")
+        self.assertIn("Checked 4 credential(s)", out)
+        self.assertIn("refreshed=2, valid=2", out)
+
+    def test_revoked_credentials_are_kept_and_reported(self):
+        def revoked(auth):
+            if auth.uid == "expiring":
+                raise RefreshError("invalid_grant: Token has been expired or revoked.")
+            return True
+
+        out = self.run_refresh(revoked)
+
+        self.assertEqual(self.status("expiring"), "revoked")
+        self.assertEqual(self.status("expiring-2"), "refreshed")
+        self.assertIn("refreshed=1, revoked=1, valid=2", out)
+
+    def test_other_failures_are_counted_without_stopping_the_run(self):
+        def broken(auth):
+            if auth.uid == "expiring":
+                raise ConnectionError("network down")
+            return True
+
+        out = self.run_refresh(broken)
+
+        self.assertEqual(self.status("expiring"), "error")
+        self.assertEqual(self.status("expiring-2"), "refreshed")
+        self.assertIn("error=1, refreshed=1, valid=2", out)
@@ -0,0 +1,121 @@
+from django.test import SimpleTestCase
+from google_apis.tests.fake_sheets import FakeSpreadsheets
+from google_apis.util.Sheet import Sheet
+from google_apis.util.SheetCache import RangeCache, range_cache
+
+
+def make_sheet(rows, uid="uid-1"):
+    sheet = Sheet.__new__(Sheet)
+    sheet.uid = uid
+    sheet.sheet = FakeSpreadsheets(rows)
+    sheet.drive = None
+    return sheet
+
+
+class RangeCacheTests(SimpleTestCase):
+
+    def test_entries_are_scoped_per_user(self):
+        cache = RangeCache(ttl=30, max_entries=10)
+        cache.put("uid-1", "sheet", "A:Z", {"values": [["a"]]})
+        self.assertEqual(cache.get("uid-1", "sheet", "A:Z"), {"values": [["a"]]})
+        self.assertIsNone(cache.get("uid-2", "sheet", "A:Z"))
+
+    def test_invalidate_drops_every_range_of_the_sheet(self):
+        cache = RangeCache(ttl=30, max_entries=10)
+        cache.put("uid-1", "sheet", "A:Z", {})
+        cache.put("uid-2", "sheet", "A1:B2", {})
+        cache.put("uid-1", "other", "A:Z", {})
+        cache.invalidate("sheet")
+        self.assertIsNone(cache.get("uid-1", "sheet", "A:Z"))
+        self.assertIsNone(cache.get("uid-2", "sheet", "A1:B2"))
+        self.assertIsNotNone(cache.get("uid-1", "other", "A:Z"))
+
+    def test_expired_and_evicted_entries(self):
+        cache = RangeCache(ttl=-1, max_entries=10)
+        self.assertFalse(cache.enabled)
+        cache = RangeCache(ttl=30, max_entries=1)
+        cache.put("uid-1", "sheet", "A:Z", {})
+        cache.put("uid-1", "sheet", "B:B", {})
+        self.assertIsNone(cache.lookup("uid-1", "sheet", "A:Z"))
+
+    def test_ranges_are_indexed_when_searched_again(self):
+        cache = RangeCache(ttl=30, max_entries=10)
+        entry = cache.put("uid-1", "sheet", "A:Z", {"values": [["Ada", "x"], ["Bob", "y"]]})
+        self.assertEqual(cache.find(entry, "bo"), {(2, 0)})
+        self.assertIsNone(entry.index)
+        self.assertEqual(cache.find(entry, "ADA", mode="exact"), {(1, 0)})
+        self.assertIsNotNone(entry.index)
+
+    def test_indexed_cells_are_capped(self):
+        cache = RangeCache(ttl=30, max_entries=10, max_indexed_cells=4)
+        first = cache.put("uid-1", "sheet", "A:Z", {"values": [["a", "b"], ["c"]]})
+        second = cache.put("uid-1", "sheet", "B:B", {"values": [["d", "e"]]})
+        large = cache.put("uid-1", "sheet", "C:C", {"values": [["f", "g", "h", "i", "j"]]})
+        for entry in (first, second, large, first, second, large):
+            cache.find(entry, "a")
+
+        # Indexing the second range evicted the first; the large one never fits
+        self.assertIsNone(first.index)
+        self.assertIsNotNone(second.index)
+        self.assertIsNone(large.index)
+        self.assertEqual(cache.find(large, "j"), {(1, 4)})
+
+
+class SheetReadCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        range_cache.clear()
+        self.sheet = make_sheet([["name", "email"], ["Ada", "ada@example.com"], ["Bob", "bob@example.com"]])
+
+    def tearDown(self):
+        range_cache.clear()
+
+    def test_repeated_lookups_read_once(self):
+        self.assertEqual(self.sheet.find_row("sheet-id", "bob", "Sheet1!A:Z"), [3])
+        self.assertEqual(self.sheet.get_header("sheet-id", "Sheet1!A:Z"), ["name", "email"])
+        self.assertEqual(self.sheet.sheet.calls, ["values.get"])
+
+    def test_writes_are_patched_into_cached_ranges(self):
+        self.sheet.find_row("sheet-id", "bob", "Sheet1!A:Z")
+        response = self.sheet.update_values("sheet-id", "Sheet1!A3", "USER_ENTERED", [["Carl"]])
+
+        self.assertNotIn("updatedData", response)
+        self.assertEqual(self.sheet.find_row("sheet-id", "carl", "Sheet1!A:Z"), [3])
+        self.assertIsNone(self.sheet.find_row("sheet-id", "bob", "Sheet1!A:Z", mode="exact"))
+        self.assertEqual(self.sheet.get_values("sheet-id", "Sheet1!A:Z")["values"][2], ["Carl", "bob@example.com"])
+        self.assertEqual(self.sheet.sheet.calls, ["values.get", "values.update"])
+
+    def test_inserted_rows_invalidate(self):
+        self.sheet.find_row("sheet-id", "bob", "Sheet1!A:Z")
+        response = self.sheet.append_values("sheet-id", "Sheet1!A:Z", "USER_ENTERED", [["Dee", "dee@example.com"]])
+
+        self.assertNotIn("updatedData", response["updates"])
+        self.assertEqual(self.sheet.find_row("sheet-id", "dee@", "Sheet1!A:Z"), [4])
+        self.assertEqual(self.sheet.sheet.calls, ["values.get", "values.append", "values.get"])
+
+    def test_unmapped_writes_invalidate(self):
+        self.sheet.find_row("sheet-id", "bob", "A:Z")
+        self.sheet.update_values("sheet-id", "Sheet1!A3", "USER_ENTERED", [["Carl"]])
+        self.assertEqual(self.sheet.find_row("sheet-id", "carl", "A:Z"), [3])
+        self.assertEqual(self.sheet.sheet.calls, ["values.get", "values.update", "values.get"])
+
+    def test_read_options_are_cached_separately(self):
+        self.sheet.get_values("sheet-id", "Sheet1!A:Z")
+        self.sheet.get_values("sheet-id", "Sheet1!A:Z", value_render_option="FORMATTED_VALUE", major_dimension="ROWS")
+        self.sheet.get_values("sheet-id", "Sheet1!A:Z", value_render_option="UNFORMATTED_VALUE")
+        self.assertEqual(self.sheet.sheet.calls, ["values.get", "values.get"])
+
+        # Writes come back formatted, so unformatted reads are dropped rather than patched
+        self.sheet.update_values("sheet-id", "Sheet1!A3", "USER_ENTERED", [["Carl"]])
+        self.sheet.get_values("sheet-id", "Sheet1!A:Z")
+        self.sheet.get_values("sheet-id", "Sheet1!A:Z", value_render_option="UNFORMATTED_VALUE")
+        self.assertEqual(self.sheet.sheet.calls[2:], ["values.update", "values.get"])
+
+        with self.assertRaises(ValueError):
+            self.sheet.get_values("sheet-id", "Sheet1!A:Z", value_render_option="RAW")
+
+    def test_batch_get_fetches_only_missing_ranges(self):
+        self.sheet.get_values("sheet-id", "Sheet1!2:2")
+        result = self.sheet.batch_get_values("sheet-id", ["Sheet1!2:2", "Sheet1!3:3"])
+        self.assertEqual([item["values"] for item in result["valueRanges"]], [[["Ada", "ada@example.com"]], [["Bob", "bob@example.com"]]])
+        self.assertEqual(self.sheet.sheet.calls, ["values.get", "values.batchGet"])
@@ -0,0 +1,34 @@
+from django.test import SimpleTestCase
+from google_apis.util.SheetIndex import KeywordIndex
+
+
+class KeywordIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = KeywordIndex([
+            ["Name", "Email", "Status"],
+            ["Ada Lovelace", "ada@example.com", "Active"],
+            ["Bob", "bob@example.com", "inactive"],
+        ])
+
+    def test_substring_matches_like_a_scan(self):
+        self.assertEqual(self.index.rows("ACTIVE"), [2, 3])
+        self.assertEqual(self.index.rows("example"), [2, 3])
+        self.assertEqual(self.index.rows("ob"), [3])
+        self.assertEqual(self.index.columns("lovelace"), [0])
+
+    def test_exact_and_prefix(self):
+        self.assertEqual(self.index.rows("active", mode="exact"), [2])
+        self.assertEqual(self.index.rows("bo", mode="prefix"), [3])
+        self.assertEqual(self.index.rows("ada", mode="prefix"), [2])
+        with self.assertRaises(ValueError):
+            self.index.rows("ada", mode="regex")
+
+    def test_incremental_updates(self):
+        self.index.set_cell(3, 0, "Carl")
+        self.assertEqual(self.index.rows("bob", mode="exact"), [])
+        self.assertEqual(self.index.rows("carl"), [3])
+
+        self.index.clear_row(2)
+        self.assertEqual(self.index.rows("ada"), [])
+        self.assertEqual(self.index.rows("example"), [3])
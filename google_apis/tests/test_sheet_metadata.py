@@ -0,0 +1,61 @@
+from django.test import SimpleTestCase
+from google_apis.tests.test_sheet_cache import make_sheet
+from google_apis.util.SheetCache import range_cache
+from google_apis.util.SheetMetadata import MetadataCache, SpreadsheetMetadata, metadata_cache
+
+
+RESPONSE = {"sheets": [
+    {"properties": {"sheetId": 7, "title": "Log", "index": 1, "gridProperties": {"rowCount": 50, "columnCount": 5}}},
+    {"properties": {"sheetId": 0, "title": "Main", "index": 0, "gridProperties": {"rowCount": 100, "columnCount": 26, "frozenRowCount": 1}}},
+]}
+
+
+class MetadataCacheTests(SimpleTestCase):
+
+    def test_tabs_resolve_by_title_and_order(self):
+        metadata = SpreadsheetMetadata.from_response(RESPONSE)
+        self.assertEqual(metadata.tab().title, "Main")
+        self.assertEqual(metadata.tab("Main").header_rows, 1)
+        self.assertEqual(metadata.tab("Log").gid, 7)
+        self.assertIsNone(metadata.tab("Missing"))
+
+    def test_resize_and_invalidate(self):
+        cache = MetadataCache(ttl=30, max_entries=10)
+        cache.put("uid-1", "sheet", SpreadsheetMetadata.from_response(RESPONSE))
+        cache.put("uid-2", "sheet", SpreadsheetMetadata.from_response(RESPONSE))
+        cache.resize("sheet", 7, -3)
+        self.assertEqual(cache.get("uid-2", "sheet").tab("Log").row_count, 47)
+        cache.invalidate("sheet")
+        self.assertIsNone(cache.get("uid-1", "sheet"))
+
+
+class SheetMetadataTests(SimpleTestCase):
+
+    def setUp(self):
+        range_cache.clear()
+        metadata_cache.clear()
+        self.sheet = make_sheet([["name"], ["Ada"], ["Bob"], ["Carl"]])
+
+    def tearDown(self):
+        range_cache.clear()
+        metadata_cache.clear()
+
+    def test_deletes_reuse_cached_gid(self):
+        self.sheet.delete_rows("sheet-id", [4], "Sheet1")
+        self.sheet.delete_rows("sheet-id", [3], "Sheet1")
+        self.assertEqual(self.sheet.sheet.calls, ["get", "batchUpdate", "batchUpdate"])
+        self.assertEqual(self.sheet.sheet.rows, [["name"], ["Ada"]])
+
+    def test_tabs_added_after_caching_are_found(self):
+        self.assertEqual(self.sheet.get_sheet_gid("sheet-id", "Sheet1"), 0)
+        # Another editor adds a tab while the metadata is cached
+        self.sheet.sheet.other_tabs.append(("Log", 42))
+        self.assertEqual(self.sheet.get_sheet_gid("sheet-id", "Log"), 42)
+        self.assertEqual(self.sheet.get_sheet_gid("sheet-id", "Log"), 42)
+        self.assertEqual(self.sheet.sheet.calls.count("get"), 2)
+
+    def test_structural_updates_invalidate(self):
+        self.sheet.get_sheet_gid("sheet-id", "Sheet1")
+        self.sheet.conditional_formatting("sheet-id", [{"addSheet": {"properties": {"title": "New"}}}])
+        self.sheet.get_sheet_gid("sheet-id", "Sheet1")
+        self.assertEqual(self.sheet.sheet.calls.count("get"), 2)
@@ -0,0 +1,60 @@
+from django.test import SimpleTestCase
+from google_apis.util.SheetSnapshot import SheetSnapshot
+
+
+class SheetSnapshotTests(SimpleTestCase):
+
+    def setUp(self):
+        self.snapshot = SheetSnapshot.from_values([
+            ["Region", "Rep", "Amount"],
+            ["North", "Ada", "1,200"],
+            ["South", "Bob", "300"],
+            ["North", "Carl"],
+            ["East", "dana", "50.5", "late"],
+        ], first_row=2)
+
+    def test_columns_from_header(self):
+        self.assertEqual(self.snapshot.header, ["Region", "Rep", "Amount", "D"])
+        self.assertIn("Amount", self.snapshot.numbers)
+        self.assertNotIn("Rep", self.snapshot.numbers)
+        self.assertEqual(self.snapshot.row_numbers.tolist(), [3, 4, 5, 6])
+        self.assertEqual(self.snapshot.to_rows()[3], ["North", "Carl", "", ""])
+
+    def test_filter_search_and_sort(self):
+        self.assertEqual(self.snapshot.filter("Amount", "gt", "100").row_numbers.tolist(), [3, 4])
+        self.assertEqual(self.snapshot.filter("Amount", "is_null").row_numbers.tolist(), [5])
+        self.assertEqual(self.snapshot.filter("Region", "in", ["East", "South"]).row_numbers.tolist(), [4, 6])
+        self.assertEqual(self.snapshot.search("DA").row_numbers.tolist(), [3, 6])
+
+        by_amount = self.snapshot.sort("Amount", descending=True)
+        self.assertEqual(by_amount.row_numbers.tolist(), [3, 4, 6, 5])
+        by_rep = self.snapshot.sort("Rep")
+        self.assertEqual(by_rep.cells["Rep"].tolist(), ["Ada", "Bob", "Carl", "dana"])
+
+        with self.assertRaises(ValueError):
+            self.snapshot.filter("Missing", "eq", "x")
+
+    def test_group_by(self):
+        groups = self.snapshot.group_by("Region", {"Amount": "sum", "Rep": "count"})
+        self.assertEqual(groups, [
+            {"Region": "East", "count": 1, "Amount_sum": 50.5, "Rep_count": 1},
+            {"Region": "North", "count": 2, "Amount_sum": 1200.0, "Rep_count": 2},
+            {"Region": "South", "count": 1, "Amount_sum": 300.0, "Rep_count": 1},
+        ])
+        means = self.snapshot.filter("Region", "eq", "North").group_by("Region", {"Amount": "mean"})
+        self.assertEqual(means[0]["Amount_mean"], 1200.0)
+
+        with self.assertRaises(ValueError):
+            self.snapshot.group_by("Region", {"Rep": "sum"})
+
+    def test_blank_and_repeated_names_are_made_unique(self):
+        snapshot = SheetSnapshot.from_values([["Amount", "", "Amount", "Amount_2"], ["1", "2", "3", "4"]])
+        self.assertEqual(snapshot.header, ["Amount", "B", "Amount_2", "Amount_2_2"])
+        self.assertEqual([snapshot.cells[name][0] for name in snapshot.header], ["1", "2", "3", "4"])
+
+    def test_descending_text_sort_is_stable(self):
+        self.assertEqual(self.snapshot.sort("Region", descending=True).row_numbers.tolist(), [4, 3, 5, 6])
+        self.assertEqual(self.snapshot.sort("Region").row_numbers.tolist(), [6, 3, 5, 4])
+        self.assertEqual(self.snapshot.cells["Rep"].dtype, object)
+        self.assertEqual(self.snapshot.filter("Rep", "startswith", "C").row_numbers.tolist(), [5])
+        self.assertEqual(self.snapshot.filter("Rep", "lt", "Bob").row_numbers.tolist(), [3])
@@ -0,0 +1,206 @@
+import json
+from unittest import mock
+from django.test import SimpleTestCase
+from google_apis.sheet_tool import (
+    handle_update_cell_by_keyword, handle_update_row_by_keyword, handle_delete_by_keyword, handle_export_values,
+    handle_pipeline, handle_write_values, handle_aggregate_values,
+)
+from google_apis.tests.test_sheet_cache import make_sheet
+from google_apis.util.Sheet import TAG_ROWS
+from google_apis.util.SheetCache import range_cache
+from google_apis.util.WriteBuffer import AppendBuffer
+
+
+class KeywordWriteTests(SimpleTestCase):
+
+    def setUp(self):
+        range_cache.clear()
+        self.sheet = make_sheet([
+            ["name", "status"],
+            ["Ada", "open"],
+            ["Bob", "open"],
+            ["Ada", "open"],
+        ])
+
+    def tearDown(self):
+        range_cache.clear()
+
+    def test_cell_updates_take_one_request(self):
+        response = handle_update_cell_by_keyword(self.sheet, {
+            "sheet_id": "sheet-id", "search_keyword": "ada", "column": "B",
+            "value": "closed", "range_name": "Sheet1!A:Z",
+        })
+        result = json.loads(response.content)["result"]
+        self.assertEqual([list(item) for item in result], [["B2"], ["B4"]])
+        self.assertEqual(self.sheet.sheet.calls, ["values.get", "values.batchUpdate"])
+        self.assertEqual([row[1] for row in self.sheet.sheet.rows], ["status", "closed", "open", "closed"])
+
+    def test_row_updates_take_one_request(self):
+        response = handle_update_row_by_keyword(self.sheet, {
+            "sheet_id": "sheet-id", "search_keyword": "ada", "range_name": "Sheet1!A:Z",
+            "values": [["Ada L.", "done"]],
+        })
+        self.assertEqual([list(item) for item in json.loads(response.content)["result"]], [["2"], ["4"]])
+        self.assertEqual(self.sheet.sheet.calls.count("values.batchUpdate"), 1)
+        self.assertEqual(self.sheet.sheet.rows[3], ["Ada L.", "done"])
+
+    def test_row_values_are_validated_before_writing(self):
+        response = handle_update_row_by_keyword(self.sheet, {
+            "sheet_id": "sheet-id", "search_keyword": "ada", "range_name": "Sheet1!A:Z",
+            "values": [["a"], ["b"]],
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn("values.batchUpdate", self.sheet.sheet.calls)
+
+    def test_cell_deletes_take_one_request(self):
+        handle_delete_by_keyword(self.sheet, {
+            "sheet_id": "sheet-id", "search_keyword": "ada", "range_name": "Sheet1!A:Z",
+            "delete_type": "cell", "column": "B",
+        })
+        self.assertEqual(self.sheet.sheet.calls, ["values.get", "values.batchUpdate"])
+        self.assertEqual(self.sheet.find_row("sheet-id", "open", "Sheet1!A:Z"), [3])
+
+
+class SessionRowTests(SimpleTestCase):
+
+    def setUp(self):
+        range_cache.clear()
+        self.sheet = make_sheet([["session", "status"], ["legacy-1", "open"], ["other", "open"]])
+        tagging = mock.patch("google_apis.sheet_tool.TAG_ROWS", True)
+        tagging.start()
+        self.addCleanup(tagging.stop)
+
+    def tearDown(self):
+        range_cache.clear()
+
+    def update(self, session_id, status):
+        return handle_update_row_by_keyword(self.sheet, {
+            "sheet_id": "sheet-id", "search_by_session_id": True, "session_id": session_id,
+            "range_name": "Sheet1!A:Z", "values": [[session_id, status]],
+        })
+
+    def test_appended_rows_are_found_by_tag(self):
+        self.update("session-9", "new")
+        self.assertEqual(self.sheet.sheet.metadata, [("session_id", "session-9", 3)])
+
+        range_cache.clear()
+        self.sheet.sheet.calls.clear()
+        self.update("session-9", "done")
+        self.assertNotIn("values.get", self.sheet.sheet.calls)
+        self.assertEqual(self.sheet.sheet.rows[3], ["session-9", "done"])
+
+    def test_tagging_is_off_by_default(self):
+        with mock.patch("google_apis.sheet_tool.TAG_ROWS", TAG_ROWS):
+            self.update("legacy-1", "done")
+        self.assertFalse(TAG_ROWS)
+        self.assertEqual(self.sheet.sheet.metadata, [])
+        self.assertNotIn("batchGetByDataFilter", self.sheet.sheet.calls)
+
+    def test_legacy_rows_are_tagged_on_first_match(self):
+        self.update("legacy-1", "done")
+        self.assertEqual(self.sheet.sheet.metadata, [("session_id", "legacy-1", 1)])
+        self.assertEqual(self.sheet.find_tagged_rows("sheet-id", "session_id", "legacy-1", "Sheet1"), [(2, ["legacy-1", "done"])])
+
+
+class ExportTests(SimpleTestCase):
+
+    def setUp(self):
+        self.sheet = make_sheet([["id", "name"], ["1", "Ada"], [], [], ["4", "Dee"]] + [[]] * 3)
+
+    def export(self, **params):
+        response = handle_export_values(self.sheet, {"sheet_id": "sheet-id", "range_name": "Sheet1!A:B", **params})
+        return b"".join(response.streaming_content).decode()
+
+    def test_rows_are_streamed_in_windows(self):
+        body = self.export(window=2, windows_per_request=2)
+        self.assertEqual(body.splitlines(), ['["id", "name"]', '["1", "Ada"]', "[]", "[]", '["4", "Dee"]'])
+        self.assertEqual(self.sheet.sheet.calls[0], "get")
+        # 1000 grid rows in windows of 2, two windows per call
+        self.assertEqual(self.sheet.sheet.calls.count("values.batchGet"), 250)
+
+    def test_csv(self):
+        body = self.export(format="csv", window=100)
+        self.assertEqual(body.splitlines(), ["id,name", "1,Ada", "", "", "4,Dee"])
+
+    def test_start_column_is_kept_without_an_end_column(self):
+        body = self.export(range_name="Sheet1!B1:5", window=2)
+        self.assertEqual(body.splitlines(), ['["name"]', '["Ada"]', "[]", "[]", '["Dee"]'])
+
+    def test_invalid_windows_are_rejected(self):
+        for params in ({"window": 0}, {"window": -5}, {"windows_per_request": 0}, {"window": "10"}):
+            response = handle_export_values(self.sheet, {"sheet_id": "sheet-id", "range_name": "Sheet1!A:B", **params})
+            self.assertEqual(response.status_code, 400, params)
+        with self.assertRaises(ValueError):
+            next(self.sheet.iter_rows("sheet-id", "Sheet1!A:B", windows_per_request=0))
+        self.assertEqual(self.sheet.sheet.calls, [])
+
+
+class AggregateTests(SimpleTestCase):
+
+    def test_malformed_parameters_are_rejected(self):
+        sheet = make_sheet([["Region", "Amount"], ["North", "1"]])
+        for params in ({"filters": ["Region"]}, {"filters": {"column": "Region"}}, {"aggregations": ["sum"]},
+                       {"limit": "10"}, {"limit": 0}, {"header_row": -1}):
+            response = handle_aggregate_values(sheet, {"sheet_id": "sheet-id", "range_name": "Sheet1!A:B", **params})
+            self.assertEqual(response.status_code, 400, params)
+        self.assertEqual(sheet.sheet.calls, [])
+
+
+class BufferedAppendTests(SimpleTestCase):
+
+    def test_lost_rows_fail_the_next_append(self):
+        def fail(*args):
+            raise RuntimeError("quota exceeded")
+
+        buffer = AppendBuffer(window=60, max_rows=100, writer=fail, retries=0)
+        request = {"operation": "append_values", "sheet_id": "sheet-id", "range_name": "Log!A:B",
+                   "values": [["a"]], "buffered": True}
+        with mock.patch("google_apis.sheet_tool.append_buffer", buffer):
+            self.assertEqual(handle_write_values(make_sheet([]), request).status_code, 202)
+            buffer.flush()
+            response = handle_write_values(make_sheet([]), request)
+            self.assertEqual(response.status_code, 500)
+            self.assertEqual(json.loads(response.content)["failures"][0]["rows"], 1)
+            self.assertEqual(buffer.pending(), 0)
+            self.assertEqual(handle_write_values(make_sheet([]), request).status_code, 202)
+        buffer._batches.clear()
+
+
+class PipelineTests(SimpleTestCase):
+
+    def setUp(self):
+        range_cache.clear()
+        self.sheet = make_sheet([["name", "status"], ["Ada", "open"], ["Bob", "open"]])
+
+    def tearDown(self):
+        range_cache.clear()
+
+    def run_pipeline(self, steps, **params):
+        response = handle_pipeline(self.sheet, {"sheet_id": "sheet-id", "steps": steps, **params})
+        return response.status_code, json.loads(response.content)
+
+    def test_steps_share_reads_and_merge_writes(self):
+        status, body = self.run_pipeline([
+            {"operation": "search_by_keyword", "search_keyword": "bob", "range_name": "Sheet1!A:Z", "match_mode": "exact"},
+            {"operation": "update_values", "range_name": "Sheet1!B2", "values": [["done"]]},
+            {"operation": "update_values", "range_name": "Sheet1!B3", "values": [["done"]]},
+            {"operation": "get_values", "range_name": "Sheet1!A:Z"},
+        ])
+        self.assertEqual(status, 200)
+        self.assertEqual([step["status_code"] for step in body["result"]], [200, 200, 200, 200])
+        self.assertEqual(body["result"][3]["result"]["values"][1:], [["Ada", "done"], ["Bob", "done"]])
+        self.assertEqual(self.sheet.sheet.calls.count("values.batchUpdate"), 1)
+        self.assertEqual(self.sheet.sheet.calls.count("values.get"), 1)
+
+    def test_stops_at_first_failure(self):
+        status, body = self.run_pipeline([
+            {"operation": "get_values"},
+            {"operation": "get_values", "range_name": "Sheet1!A:Z"},
+        ])
+        self.assertEqual(status, 207)
+        self.assertEqual(len(body["result"]), 1)
+        self.assertEqual(body["result"][0]["status_code"], 400)
+
+    def test_streaming_steps_are_rejected(self):
+        status, _ = self.run_pipeline([{"operation": "export_values", "range_name": "A:Z"}])
+        self.assertEqual(status, 400)
@@ -0,0 +1,110 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase
+from django.utils import timezone
+from google.oauth2.credentials import Credentials
+from google_apis.models import GoogleCredential
+from google_apis.util.Auth import Auth, resolve_scopes
+from google_apis.util.CredentialCache import credential_cache
+from google_apis.util.CredentialStore import credential_store
+from google_apis.util.SingleFlight import SingleFlight
+
+
+def expired_info():
+    return {
+        "token": "stale-token",
+        "refresh_token": "refresh",
+        "client_id": "client-id",
+        "client_secret": "secret",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "scopes": list(resolve_scopes(("all",))),
+        "expiry": "2000-01-01T00:00:00Z",
+    }
+
+
+class RefreshDedupTests(TransactionTestCase):
+
+    def setUp(self):
+        credential_cache.clear()
+        credential_store.save("uid-1", expired_info())
+        self.in_transaction = []
+
+    def tearDown(self):
+        credential_cache.clear()
+
+    def fake_refresh(self, creds, request):
+        self.in_transaction.append(connection.in_atomic_block)
+        time.sleep(0.05)
+        creds.token = "fresh-token"
+        creds.expiry = datetime.utcnow() + timedelta(hours=1)
+
+    def refresh_concurrently(self, callers=8):
+        auths = [Auth("uid-1") for _ in range(callers)]
+        results = []
+        threads = [threading.Thread(target=lambda auth=auth: results.append(auth.refresh_token())) for auth in auths]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return auths, results
+
+    def test_concurrent_callers_refresh_once(self):
+        with mock.patch.object(Credentials, "refresh", autospec=True, side_effect=self.fake_refresh) as refresh:
+            auths, results = self.refresh_concurrently()
+
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(results, [True] * 8)
+        self.assertEqual({auth.creds.token for auth in auths}, {"fresh-token"})
+        self.assertEqual(credential_store.load("uid-1")[0]["token"], "fresh-token")
+
+    @mock.patch("google_apis.util.Auth.CREDENTIAL_ROW_LOCK", True)
+    def test_row_claim_is_released_before_the_network_call(self):
+        with mock.patch.object(Credentials, "refresh", autospec=True, side_effect=self.fake_refresh) as refresh:
+            _, results = self.refresh_concurrently(callers=4)
+
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(results, [True] * 4)
+        self.assertEqual(self.in_transaction, [False])
+        self.assertIsNone(GoogleCredential.objects.get(uuid="uid-1").refresh_claimed_at)
+
+    @mock.patch("google_apis.util.Auth.CREDENTIAL_ROW_LOCK", True)
+    def test_waits_for_a_claim_held_by_another_process(self):
+        GoogleCredential.objects.filter(uuid="uid-1").update(refresh_claimed_at=timezone.now())
+        auth = Auth("uid-1")
+        with mock.patch.object(Credentials, "refresh", autospec=True) as refresh:
+            thread = threading.Thread(target=auth.refresh_token)
+            thread.start()
+            time.sleep(0.1)
+            # The other process finishes its refresh and releases the claim
+            credential_store.save("uid-1", {**expired_info(), "token": "other-token", "expiry": "2099-01-01T00:00:00Z"})
+            GoogleCredential.objects.filter(uuid="uid-1").update(refresh_claimed_at=None)
+            thread.join(timeout=5)
+
+        refresh.assert_not_called()
+        self.assertEqual(auth.creds.token, "other-token")
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def test_locks_are_dropped_when_released(self):
+        flight = SingleFlight()
+        with flight.lock("uid-1"):
+            self.assertEqual(flight.in_flight(), 1)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_different_keys_do_not_block(self):
+        flight = SingleFlight()
+        with flight.lock("uid-1"):
+            acquired = threading.Event()
+
+            def other():
+                with flight.lock("uid-2"):
+                    acquired.set()
+
+            thread = threading.Thread(target=other)
+            thread.start()
+            self.assertTrue(acquired.wait(timeout=1))
+            thread.join()
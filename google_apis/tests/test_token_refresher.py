@@ -0,0 +1,67 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+from django.test import SimpleTestCase
+from google_apis.util.TokenRefresher import TokenRefresher
+
+
+class TokenRefresherTests(SimpleTestCase):
+
+    def setUp(self):
+        self.refresher = TokenRefresher(margin=600)
+        self.now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def test_schedule_coalesces_per_uid(self):
+        self.refresher.schedule("uid-1", self.now + timedelta(hours=2))
+        self.refresher.schedule("uid-1", self.now + timedelta(hours=3))
+        self.assertEqual(self.refresher.pending(), 1)
+        due, _ = self.refresher._scheduled["uid-1"]
+
+        self.refresher.schedule("uid-1", self.now + timedelta(hours=1))
+        self.assertEqual(self.refresher.pending(), 1)
+        self.assertLess(self.refresher._scheduled["uid-1"][0], due)
+
+    def test_cancel_removes_uid(self):
+        self.refresher.schedule("uid-2", self.now + timedelta(hours=2), ["sheet"])
+        self.refresher.cancel("uid-2")
+        self.assertEqual(self.refresher.pending(), 0)
+
+    def test_disabled_with_zero_margin(self):
+        refresher = TokenRefresher(margin=0)
+        refresher.schedule("uid-3", self.now + timedelta(hours=2))
+        self.assertEqual(refresher.pending(), 0)
+        self.assertIsNone(refresher._thread)
+
+    def test_due_refreshes_run_in_the_background(self):
+        refreshed = threading.Event()
+        calls = []
+
+        def refresh(uid, apps):
+            calls.append((uid, apps))
+            refreshed.set()
+
+        refresher = TokenRefresher(margin=600)
+        with mock.patch.object(refresher, "_refresh", side_effect=refresh):
+            # Expires 0.2s after the margin, so the refresh is due in 0.2s
+            refresher.schedule("uid-4", self.now + timedelta(seconds=600.2), ["gmail"])
+            refresher.schedule("uid-5", self.now + timedelta(hours=2))
+            self.assertFalse(refreshed.is_set())
+            self.assertTrue(refreshed.wait(timeout=5))
+
+        self.assertEqual(calls, [("uid-4", ["gmail"])])
+        self.assertEqual(list(refresher._scheduled), ["uid-5"])
+
+    def test_failed_refreshes_do_not_stop_the_thread(self):
+        refreshed = threading.Event()
+
+        def refresh(uid, apps):
+            if uid == "uid-6":
+                raise RuntimeError("token endpoint down")
+            refreshed.set()
+
+        refresher = TokenRefresher(margin=600)
+        with mock.patch.object(refresher, "_refresh", side_effect=refresh):
+            refresher.schedule("uid-6", self.now + timedelta(seconds=600))
+            refresher.schedule("uid-7", self.now + timedelta(seconds=600.1))
+            self.assertTrue(refreshed.wait(timeout=5))
+        self.assertEqual(refresher.pending(), 0)
@@ -0,0 +1,176 @@
+import json
+import threading
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.test import SimpleTestCase
+from django.urls import reverse
+from google.oauth2.credentials import Credentials
+from google_apis.util.RateLimiter import RateLimiter, api_name, rate_limiter
+from google_apis.util.Transport import PooledHttp, batch_size, get_session
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        status = 200 if self.headers.get("Authorization") == "Bearer fresh" else 401
+        body = json.dumps({"status": status}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PooledHttpTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def test_session_is_shared(self):
+        self.assertIs(PooledHttp(Credentials(token="a"))._session, get_session())
+
+    def test_refreshes_and_retries_on_401(self):
+        calls = []
+
+        def refresh():
+            calls.append(1)
+            return Credentials(token="fresh")
+
+        http = PooledHttp(Credentials(token="stale"), refresh=refresh)
+        response, content = http.request(self.url)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response["content-type"], "application/json")
+        self.assertEqual(json.loads(content), {"status": 200})
+
+    def test_gives_up_after_max_refresh_attempts(self):
+        http = PooledHttp(Credentials(token="stale"), refresh=lambda: Credentials(token="still-stale"))
+        response, _ = http.request(self.url)
+        self.assertEqual(response.status, 401)
+
+
+class _ThrottlingHandler(BaseHTTPRequestHandler):
+    responses_left = 0
+    retry_after = "0"
+
+    def do_GET(self):
+        if _ThrottlingHandler.responses_left > 0:
+            _ThrottlingHandler.responses_left -= 1
+            self.send_response(429)
+            self.send_header("Retry-After", _ThrottlingHandler.retry_after)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RateLimitedHttpTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _ThrottlingHandler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/sheets/v4/spreadsheets/abc"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def test_throttled_calls_are_delayed_and_resent(self):
+        limiter = RateLimiter(limits={("sheets", "user"): 600}, max_wait=5)
+        _ThrottlingHandler.responses_left = 2
+        http = PooledHttp(Credentials(token="a", client_id="project"), user="uid", limiter=limiter)
+        response, _ = http.request(self.url)
+
+        self.assertEqual(response.status, 200)
+        [bucket] = limiter.utilization("uid")
+        self.assertEqual((bucket["api"], bucket["user"], bucket["project"]), ("sheets", "uid", "project"))
+        self.assertEqual(bucket["throttled"], 2)
+        self.assertEqual(bucket["granted"], 3)
+        self.assertLess(bucket["rate_per_minute"], 600)
+
+
+    def test_retries_without_buckets_honor_retry_after(self):
+        limiter = RateLimiter(limits={}, max_wait=60)
+        _ThrottlingHandler.responses_left = 2
+        _ThrottlingHandler.retry_after = "5"
+        self.addCleanup(setattr, _ThrottlingHandler, "retry_after", "0")
+        http = PooledHttp(Credentials(token="a"), limiter=limiter)
+        with mock.patch("google_apis.util.Transport.time.sleep") as sleep:
+            response, _ = http.request(self.url)
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [5, 5])
+
+
+class RateLimiterTests(SimpleTestCase):
+
+    def test_api_names(self):
+        self.assertEqual(api_name("https://sheets.googleapis.com/v4/spreadsheets/x"), "sheets")
+        self.assertEqual(api_name("https://www.googleapis.com/calendar/v3/calendars"), "calendar")
+        self.assertEqual(api_name("https://www.googleapis.com/batch/gmail/v1"), "gmail")
+
+    def test_calls_wait_for_tokens(self):
+        limiter = RateLimiter(limits={("sheets", "user"): 600, ("sheets", "project"): 6000}, max_wait=5)
+        keys = limiter.keys("sheets", "uid", "project")
+        self.assertEqual(len(keys), 2)
+        self.assertEqual(limiter.keys("unknown", "uid", "project"), [])
+
+        limiter.throttle(keys, retry_after=0.2)
+        waited = limiter.acquire(keys)
+        self.assertGreaterEqual(waited, 0.2)
+
+    def test_waiting_is_capped(self):
+        limiter = RateLimiter(limits={("sheets", "user"): 60}, max_wait=0)
+        keys = limiter.keys("sheets", "uid", None)
+        limiter.throttle(keys, retry_after=30)
+        self.assertLess(limiter.acquire(keys), 1)
+
+    def test_batches_are_charged_per_call(self):
+        boundary = "===============123=="
+        body = "".join(f"--{boundary}\nContent-Type: application/http\n\nGET /gmail/v1/users/me/messages/{i}\n\n" for i in range(3))
+        body += f"--{boundary}--"
+        headers = {"content-type": f'multipart/mixed; boundary="{boundary}"'}
+        self.assertEqual(batch_size(headers, body), 3)
+        self.assertEqual(batch_size({"content-type": "application/json"}, "{}"), 1)
+
+        limiter = RateLimiter(limits={("gmail", "user"): 60}, max_wait=0)
+        keys = limiter.keys("gmail", "uid", None)
+        limiter.acquire(keys, batch_size(headers, body))
+        [bucket] = limiter.utilization("uid")
+        self.assertEqual(bucket["granted"], 3)
+
+    def test_utilization_is_per_user_and_requires_a_user(self):
+        rate_limiter.reset()
+        self.addCleanup(rate_limiter.reset)
+        rate_limiter.acquire(rate_limiter.keys("sheets", "uid-1", "project"))
+        rate_limiter.acquire(rate_limiter.keys("sheets", "uid-2", "project"))
+
+        response = self.client.get(reverse("rate_limits"))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("rate_limits"), {"tool_id": "uid-1"})
+        self.assertEqual([bucket["user"] for bucket in response.json()["result"]], ["uid-1"])
@@ -0,0 +1,80 @@
+import threading
+from django.test import SimpleTestCase
+from google_apis.util.WriteBuffer import AppendBuffer
+
+
+class RecordingWriter:
+
+    def __init__(self, fail=False, failures=0):
+        self.calls = []
+        self.fail = fail
+        self.failures = failures
+        self.written = threading.Event()
+
+    def __call__(self, uid, sheet_id, range_name, value_input_option, values):
+        self.calls.append((uid, sheet_id, range_name, list(values)))
+        self.written.set()
+        if self.fail or len(self.calls) <= self.failures:
+            raise RuntimeError("quota exceeded")
+        first_row = 10
+        return {"updates": {"updatedRange": f"Log!A{first_row}:B{first_row + len(values) - 1}"}}
+
+
+class AppendBufferTests(SimpleTestCase):
+
+    def test_rows_in_window_are_sent_as_one_append(self):
+        writer = RecordingWriter()
+        buffer = AppendBuffer(window=60, max_rows=100, writer=writer)
+        first = buffer.append("uid", "sheet", "Log!A:B", "RAW", [["a", 1]])
+        second = buffer.append("uid", "sheet", "Log!A:B", "RAW", [["b", 2], ["c", 3]])
+        other = buffer.append("uid", "sheet", "Other!A:B", "RAW", [["d", 4]])
+        self.assertEqual(buffer.pending(), 4)
+
+        buffer.flush()
+        self.assertEqual(len(writer.calls), 2)
+        self.assertEqual(writer.calls[0][3], [["a", 1], ["b", 2], ["c", 3]])
+        self.assertEqual(first.result(timeout=1)["updatedRange"], "Log!A10:B10")
+        self.assertEqual(second.result(timeout=1)["updatedRange"], "Log!A11:B12")
+        self.assertEqual(other.result(timeout=1)["batchedRows"], 1)
+
+    def test_full_batches_flush_in_the_background(self):
+        writer = RecordingWriter()
+        buffer = AppendBuffer(window=60, max_rows=2, writer=writer)
+        delivered = []
+        buffer.append("uid", "sheet", "Log!A:B", "RAW", [["a"]], callback=delivered.append)
+        future = buffer.append("uid", "sheet", "Log!A:B", "RAW", [["b"]])
+        future.result(timeout=5)
+        self.assertEqual(len(writer.calls), 1)
+        self.assertEqual(len(delivered), 1)
+
+    def test_failures_reach_every_caller(self):
+        writer = RecordingWriter(fail=True)
+        buffer = AppendBuffer(window=60, max_rows=100, writer=writer, retries=2, backoff=0)
+        futures = [buffer.append("uid", "sheet", "Log!A:B", "RAW", [[n]]) for n in range(3)]
+        buffer.flush()
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=1)
+        self.assertEqual(len(writer.calls), 3)
+        self.assertEqual(buffer.take_failures("uid", "sheet"), [{"range": "Log!A:B", "rows": 3, "error": "quota exceeded"}])
+        self.assertEqual(buffer.take_failures("uid", "sheet"), [])
+
+    def test_failed_batches_are_retried_in_the_background(self):
+        writer = RecordingWriter(failures=1)
+        buffer = AppendBuffer(window=60, max_rows=1, writer=writer, retries=3, backoff=0.01)
+        future = buffer.append("uid", "sheet", "Log!A:B", "RAW", [["a"]])
+        self.assertEqual(future.result(timeout=5)["updatedRange"], "Log!A10:B10")
+        self.assertEqual(len(writer.calls), 2)
+        self.assertEqual(buffer.take_failures("uid", "sheet"), [])
+
+    def test_requeued_rows_go_ahead_of_newer_rows(self):
+        buffer = AppendBuffer(window=60, max_rows=100, writer=RecordingWriter(), backoff=60)
+        failed = buffer.append("uid", "sheet", "Log!A:B", "RAW", [["a"]])
+        key, batch = ("uid", "sheet", "Log!A:B", "RAW"), buffer._batches.pop(("uid", "sheet", "Log!A:B", "RAW"))
+        newer = buffer.append("uid", "sheet", "Log!A:B", "RAW", [["b"]])
+        buffer._requeue(key, batch)
+
+        buffer.flush()
+        self.assertEqual(buffer.writer.calls[0][3], [["a"], ["b"]])
+        self.assertEqual(failed.result(timeout=1)["updatedRange"], "Log!A10:B10")
+        self.assertEqual(newer.result(timeout=1)["updatedRange"], "Log!A11:B11")
@@ -8,6 +8,7 @@ from .gmail_tool import gmail_api
 urlpatterns = [
     path("auth-url/get/", views.create_auth_url, name="create_auth_url"),
     path("oauth2_callback/", views.oauth2_callback, name="oauth2_callback"),
+    path("rate-limits/", views.rate_limits, name="rate_limits"),
 
     path("sheet/", google_sheets_api, name="google_sheets_api"),
     path("calendar/", google_calender_api, name="google_calender_api"),
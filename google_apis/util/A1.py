@@ -0,0 +1,82 @@
+import re
+from collections import namedtuple
+
+
+# Rows are 1-based and columns 0-based; None means the side is unbounded
+GridRange = namedtuple("GridRange", ["tab", "first_row", "last_row", "first_col", "last_col"])
+
+_CELL = re.compile(r"^([A-Z]{0,3})(\d*)$")
+
+
+def column_letter(index: int) -> str:
+    """Convert a 0-based column index to its letter (0 -> A, 26 -> AA)."""
+    letter = ""
+    index += 1
+    while index > 0:
+        index -= 1
+        letter = chr(index % 26 + ord('A')) + letter
+        index //= 26
+    return letter
+
+
+def column_index(letters: str) -> int:
+    """Convert a column letter to its 0-based index (A -> 0, AA -> 26)."""
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def split_tab(range_name: str):
+    """Split "'My Sheet'!A1:B2" into ("My Sheet", "A1:B2"); the tab is None when absent."""
+    if "!" not in range_name:
+        return None, range_name
+    tab, a1 = range_name.rsplit("!", 1)
+    if len(tab) >= 2 and tab[0] == tab[-1] == "'":
+        tab = tab[1:-1].replace("''", "'")
+    return tab, a1
+
+
+def quote_tab(tab: str) -> str:
+    if re.fullmatch(r"[A-Za-z0-9_]+", tab):
+        return tab
+    return "'" + tab.replace("'", "''") + "'"
+
+
+def parse_range(range_name: str) -> GridRange | None:
+    """
+    Parse an A1 range such as "Sheet1!A2:C", "A:Z", "3:3" or "B5".
+    Returns None for anything else, e.g. named ranges.
+    """
+    tab, a1 = split_tab(range_name)
+    start, _, end = a1.partition(":")
+    start_match = _CELL.match(start)
+    end_match = _CELL.match(end) if end else start_match
+    if not start_match or not end_match or not (start or end):
+        return None
+
+    start_col, start_row = start_match.groups()
+    end_col, end_row = end_match.groups()
+    if not (start_col or start_row) or not (end_col or end_row):
+        return None
+
+    return GridRange(
+        tab=tab,
+        first_row=int(start_row) if start_row else 1,
+        last_row=int(end_row) if end_row else None,
+        first_col=column_index(start_col) if start_col else 0,
+        last_col=column_index(end_col) if end_col else None,
+    )
+
+
+def format_range(tab: str, first_row: int, last_row: int, first_col: int = None, last_col: int = None) -> str:
+    """
+    Build an A1 range; whole rows are used when no columns are given, and
+    rows from `first_col` onwards when there is no `last_col` ("B2:5").
+    """
+    prefix = f"{quote_tab(tab)}!" if tab else ""
+    if first_col is None:
+        return f"{prefix}{first_row}:{last_row}"
+    if last_col is None:
+        return f"{prefix}{column_letter(first_col)}{first_row}:{last_row}"
+    return f"{prefix}{column_letter(first_col)}{first_row}:{column_letter(last_col)}{last_row}"
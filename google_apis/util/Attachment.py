@@ -0,0 +1,123 @@
+import base64
+import mimetypes
+import os
+import time
+import uuid
+from email import policy
+from email.message import EmailMessage
+from tempfile import SpooledTemporaryFile
+import requests
+from utils.constants import get_env_variable
+
+
+# Largest attachment accepted, matching Gmail's own 25 MB limit
+ATTACHMENT_MAX_BYTES = int(get_env_variable("GOOGLE_GMAIL_ATTACHMENT_MAX_BYTES") or 25 * 1024 * 1024)
+# Seconds allowed for downloading a URL attachment, in total
+ATTACHMENT_TIMEOUT = float(get_env_variable("GOOGLE_GMAIL_ATTACHMENT_TIMEOUT") or 30)
+# Attachments and messages stay in memory up to this size, then spill to disk
+SPOOL_BYTES = 1024 * 1024
+CHUNK_BYTES = 64 * 1024
+# 57 raw bytes make one 76 character base64 line
+ENCODE_BYTES = 57 * 1024
+
+
+class AttachmentTooLarge(ValueError):
+    pass
+
+
+class AttachmentUnavailable(ValueError):
+    pass
+
+
+def _spool():
+    return SpooledTemporaryFile(max_size=SPOOL_BYTES)
+
+
+def load_attachment(attachment: str, max_bytes: int = None, timeout: float = None):
+    """
+    Copy a local path or http(s) URL into a spooled temporary file, chunk by
+    chunk, refusing anything over `max_bytes` and downloads running over
+    `timeout` seconds. Returns (file, filename, content_type); the file is
+    positioned at its start and is the caller's to close. A URL that cannot
+    be downloaded raises AttachmentUnavailable.
+    """
+    max_bytes = ATTACHMENT_MAX_BYTES if max_bytes is None else max_bytes
+    timeout = ATTACHMENT_TIMEOUT if timeout is None else timeout
+    spooled = _spool()
+    size = 0
+    try:
+        if attachment.startswith("http://") or attachment.startswith("https://"):
+            deadline = time.monotonic() + timeout
+            with requests.get(attachment, stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                if int(response.headers.get("Content-Length") or 0) > max_bytes:
+                    raise AttachmentTooLarge(f"Attachment is larger than {max_bytes} bytes")
+                for chunk in response.iter_content(CHUNK_BYTES):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise AttachmentTooLarge(f"Attachment is larger than {max_bytes} bytes")
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"Attachment download took longer than {timeout}s")
+                    spooled.write(chunk)
+                filename = attachment.split("?")[0].split("/")[-1]
+                content_type = response.headers.get("Content-Type", "").split(";")[0].strip() or None
+        else:
+            if os.path.getsize(attachment) > max_bytes:
+                raise AttachmentTooLarge(f"Attachment is larger than {max_bytes} bytes")
+            with open(attachment, "rb") as fp:
+                for chunk in iter(lambda: fp.read(CHUNK_BYTES), b""):
+                    spooled.write(chunk)
+            filename = os.path.basename(attachment)
+            content_type, _ = mimetypes.guess_type(attachment)
+    except requests.RequestException as e:
+        spooled.close()
+        raise AttachmentUnavailable(f"Attachment could not be downloaded: {e}") from e
+    except Exception:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled, filename, content_type
+
+
+def _header_block(message: EmailMessage) -> bytes:
+    """A message's headers, folded and encoded, and the blank line ending them."""
+    return b"".join(policy.SMTP.fold_binary(name, value) for name, value in message.items()) + b"\r\n"
+
+
+def write_message(message, to, sender, subject, attachment, filename, content_type):
+    """
+    Write a multipart/mixed message with `message` as its text and the
+    `attachment` file base64-encoded as it is read, so the attachment is never
+    held in memory whole. Returns (file, size) positioned at its start.
+    """
+    boundary = f"==============={uuid.uuid4().hex}=="
+    main_type, sub_type = content_type.split("/", 1) if content_type else ("application", "octet-stream")
+
+    head = EmailMessage()
+    head["To"] = to
+    head["From"] = sender
+    head["Subject"] = subject
+    head["MIME-Version"] = "1.0"
+    head["Content-Type"] = f'multipart/mixed; boundary="{boundary}"'
+
+    text = EmailMessage()
+    text.set_content(message)
+    del text["MIME-Version"]
+
+    part = EmailMessage()
+    part["Content-Type"] = f"{main_type}/{sub_type}"
+    part["Content-Transfer-Encoding"] = "base64"
+    part.add_header("Content-Disposition", "attachment", filename=filename)
+
+    out = _spool()
+    out.write(_header_block(head))
+    out.write(f"--{boundary}\r\n".encode())
+    out.write(text.as_bytes(policy=policy.SMTP))
+    out.write(f"\r\n--{boundary}\r\n".encode())
+    out.write(_header_block(part))
+    for chunk in iter(lambda: attachment.read(ENCODE_BYTES), b""):
+        out.write(base64.encodebytes(chunk).replace(b"\n", b"\r\n"))
+    out.write(f"\r\n--{boundary}--\r\n".encode())
+    size = out.tell()
+    out.seek(0)
+    return out, size
@@ -4,16 +4,43 @@ from google_auth_oauthlib.flow import Flow
 from utils.constants import get_env_variable
 from google_apis.util.Constants import *
 from utils.constants import get_env_variable
+import copy
 import json
+import time
+from datetime import timedelta
 from typing import Optional, Dict, Any
 import logging
-from googleapiclient.discovery import build
+from functools import lru_cache
+from django.db import transaction
+from django.utils import timezone
+from google_apis.util.Service import build_service
 from google_apis.models import GoogleCredential
+from google_apis.util.CredentialCache import credential_cache
+from google_apis.util.CredentialStore import credential_store
+from google_apis.util.SingleFlight import SingleFlight
+from google_apis.util.TokenRefresher import token_refresher
+from google_apis.util.Transport import PooledHttp, get_session
 from .Constants import *
 
 
 logger = logging.getLogger('django')
 API_URL = get_env_variable("API_URL")
+# Also claim the credential row while refreshing, to dedupe across processes
+CREDENTIAL_ROW_LOCK = (get_env_variable("GOOGLE_CREDENTIAL_ROW_LOCK") or "false").lower() == "true"
+# Seconds after which another process's unreleased claim is ignored
+REFRESH_CLAIM_TTL = int(get_env_variable("GOOGLE_CREDENTIAL_REFRESH_CLAIM_TTL") or 30)
+REFRESH_CLAIM_POLL = 0.2
+
+refresh_flight = SingleFlight()
+
+
+@lru_cache(maxsize=None)
+def resolve_scopes(apps: tuple) -> frozenset:
+    """Scopes required by a combination of apps, computed once per combination."""
+    scopes = set(EXTRA_SCOPES)
+    for app in apps:
+        scopes.update(APP_SCOPES.get(app, ()))
+    return frozenset(scopes)
 
 
 class Auth:
@@ -22,44 +49,29 @@ class Auth:
         self.uid = uid
         self.meta_info = meta_info if meta_info else {}
         self.apps = apps
+        self.scope_set = resolve_scopes(tuple(apps or ()))
         self.scopes = self.get_scopes()
         self.credentials = get_env_variable("GOOGLE_API_CREDENTIALS_PATH")
+        self.refresh_error = None
         self.creds = self.get_user_cred()
 
     def get_scopes(self) -> list:
-        scopes = set()
-        for app in self.apps:
-            if app == "sheet":
-                scopes.update(SHEET_SCOPES)
-            elif app == "gmail":
-                scopes.update(GMAIL_SCOPES)
-            elif app == "meet" or app == "calendar":
-                scopes.update(CALENDAR_SCOPES)
-            elif app == "docs":
-                scopes.update(DOCS_SCOPES)
-            elif app == "drive":
-                scopes.update(DRIVE_SCOPES)
-            elif app == "all":
-                scopes.update(SCOPES)
-    
-        extra_scopes = [
-            "https://www.googleapis.com/auth/userinfo.email",
-            "openid",
-            "https://www.googleapis.com/auth/userinfo.profile"
-        ]
-        
-        scopes.update(extra_scopes)
-        scopes = list(scopes)
-        if not scopes or len(scopes) == 0:
-            scopes = SCOPES
-        return scopes
-
-    def get_user_cred(self) -> Optional[Credentials]:
+        return list(self.scope_set)
+
+    def get_user_cred(self, use_cache: bool = True) -> Optional[Credentials]:
+        if use_cache:
+            cached = credential_cache.get(self.uid)
+            if cached:
+                self.meta_info = dict(cached.meta_info)
+                return cached.creds
         try:
-            google_cred = GoogleCredential.objects.get(uuid=self.uid)
-            if "meta_info" in google_cred.credential:
-                self.meta_info = google_cred.credential.pop("meta_info")
-            return Credentials.from_authorized_user_info(google_cred.credential, google_cred.credential.get("scopes", self.scopes))
+            stored = credential_store.load(self.uid)
+            if stored is None:
+                return None
+            info, meta_info = stored
+            if meta_info:
+                self.meta_info = meta_info
+            return Credentials.from_authorized_user_info(info, info.get("scopes", self.scopes))
         except Exception as e:
             logger.error(f"Error getting user credentials: {str(e)}")
             return None
@@ -67,7 +79,7 @@ class Auth:
     def get_user_email(self, credentials: Credentials) -> str:
         """Retrieve the user's email address using the credentials."""
         try:
-            service = build('oauth2', 'v2', credentials=credentials)
+            service = build_service('oauth2', 'v2', http=PooledHttp(credentials))
             user_info = service.userinfo().get().execute()
             email = user_info.get('email', '')
             return email
@@ -78,7 +90,8 @@ class Auth:
     def save_user_cred(self, creds: Credentials | str | Dict[str, Any]) -> None:
         try:
             if isinstance(creds, Credentials):
-                if creds.valid:
+                # The email never changes for a uid, so skip the userinfo round trip once known
+                if creds.valid and not (self.meta_info or {}).get("email"):
                     email = self.get_user_email(creds)
                     if email:
                         if self.meta_info is None:
@@ -87,16 +100,16 @@ class Auth:
                 
                 creds_json = json.loads(creds.to_json())
             else:
-                creds_json = json.loads(creds) if isinstance(creds, str) else creds
+                creds_json = dict(json.loads(creds) if isinstance(creds, str) else creds)
+                if creds_json.get("meta_info"):
+                    self.meta_info = {**(self.meta_info or {}), **creds_json.pop("meta_info")}
 
-            if self.meta_info:
-                creds_json["meta_info"] = self.meta_info
+            credential_store.save(self.uid, creds_json, self.meta_info)
 
-            google_cred, created = GoogleCredential.objects.update_or_create(
-                uuid=self.uid,
-                defaults={"credential": creds_json}
-            )
-            google_cred.save()
+            if isinstance(creds, Credentials) and creds.valid:
+                credential_cache.put(self.uid, creds, self.meta_info)
+            else:
+                credential_cache.discard(self.uid)
         except Exception as e:
             logger.error(f"Error saving user credentials: {str(e)}")
             raise
@@ -104,31 +117,97 @@ class Auth:
     def remove_user_cred(self) -> None:
         """Remove user credentials from the token file."""
         try:
-            google_cred = GoogleCredential.objects.get(uuid=self.uid)
-            google_cred.delete()
+            credential_store.delete(self.uid)
+            credential_cache.discard(self.uid)
+            token_refresher.cancel(self.uid)
         except Exception as e:
             logger.error(f"Error removing user credentials: {str(e)}")
 
+    def claim_refresh(self, stale_token: str) -> Optional[Credentials]:
+        """
+        Return the stored credentials, once this caller may refresh them.
+        With CREDENTIAL_ROW_LOCK the row is locked only long enough to read it
+        and mark it claimed, so no transaction stays open during the OAuth
+        call; callers in other processes wait for an unexpired claim to go.
+        """
+        if not CREDENTIAL_ROW_LOCK:
+            return self.get_user_cred(use_cache=False)
+
+        while True:
+            with transaction.atomic():
+                row = GoogleCredential.objects.select_for_update().filter(uuid=self.uid).only("id", "refresh_claimed_at").first()
+                latest = self.get_user_cred(use_cache=False)
+                if row is None or (latest and latest.valid and latest.token != stale_token):
+                    return latest
+                now = timezone.now()
+                if not row.refresh_claimed_at or now - row.refresh_claimed_at > timedelta(seconds=REFRESH_CLAIM_TTL):
+                    GoogleCredential.objects.filter(id=row.id).update(refresh_claimed_at=now)
+                    return latest
+            time.sleep(REFRESH_CLAIM_POLL)
+
+    def release_refresh(self) -> None:
+        if CREDENTIAL_ROW_LOCK:
+            GoogleCredential.objects.filter(uuid=self.uid).update(refresh_claimed_at=None)
+
     def refresh_token(self) -> bool:
         """Attempt to refresh the token. Returns True if successful, False otherwise."""
         try:
-            if self.creds and self.creds.refresh_token:
-                self.creds.refresh(Request())
-                self.save_user_cred(self.creds)
+            if not (self.creds and self.creds.refresh_token):
+                return False
+
+            stale_token = self.creds.token
+            with refresh_flight.lock(self.uid):
+                # Reuse the result if a concurrent caller refreshed while we waited
+                latest = self.claim_refresh(stale_token)
+                if latest and latest.valid and latest.token != stale_token:
+                    self.creds = latest
+                    credential_cache.put(self.uid, latest, self.meta_info)
+                    return True
+
+                try:
+                    # Refresh a private copy; self.creds may be the cached object other threads are using
+                    creds = latest if latest and latest.refresh_token else copy.copy(self.creds)
+                    creds.refresh(Request(session=get_session()))
+                    self.creds = creds
+                    self.save_user_cred(creds)
+                finally:
+                    self.release_refresh()
                 return True
-            return False
         except Exception as e:
+            self.refresh_error = e
             logger.error(f"Error refreshing token: {str(e)}")
             return False
 
+    def authorized_http(self) -> PooledHttp:
+        """Pooled transport authorized with this user's credentials."""
+        return PooledHttp(self.creds, refresh=self.refreshed_creds, user=self.uid)
+
+    def refreshed_creds(self) -> Credentials:
+        self.refresh_token()
+        return self.creds
+
     def check_auth(self) -> bool:
         """Check if the user is authenticated and handle token refresh if needed."""
         if not self.creds:
             return False
 
-        missing_scopes = [scope for scope in self.scopes if scope not in self.creds.scopes]
+        cached = credential_cache.get(self.uid)
+        if cached and cached.creds is self.creds and self.creds.valid and self.scope_set <= cached.scopes:
+            # Already validated and the token has not expired since
+            token_refresher.schedule(self.uid, self.creds.expiry, self.apps)
+            return True
+
+        missing_scopes = self.scope_set.difference(self.creds.scopes or ())
+        if missing_scopes:
+            # Another worker may have re-authorized with wider scopes since these were cached
+            stored = self.get_user_cred(use_cache=False)
+            if stored is None:
+                credential_cache.discard(self.uid)
+                return False
+            self.creds = stored
+            missing_scopes = self.scope_set.difference(self.creds.scopes or ())
         if missing_scopes:
-            logger.info(f"Missing required scopes: {missing_scopes}")
+            logger.info(f"Missing required scopes: {list(missing_scopes)}")
             return False
 
         if not self.creds.valid:
@@ -136,6 +215,9 @@ class Auth:
                 return self.refresh_token()
             return False
 
+        credential_cache.put(self.uid, self.creds, self.meta_info)
+        if self.creds.refresh_token:
+            token_refresher.schedule(self.uid, self.creds.expiry, self.apps)
         return True
 
     def authorize(self, code: str) -> Dict[str, str]:
@@ -1,4 +1,4 @@
-from googleapiclient.discovery import build
+from google_apis.util.Service import build_service
 from googleapiclient.errors import HttpError
 from google_apis.util.Auth import Auth
 from dateutil import parser 
@@ -18,7 +18,7 @@ class Calendar(Auth):
         if isinstance(creds, dict) and "auth_url" in creds:
             return creds
 
-        self.service = build("calendar", "v3", credentials=creds)
+        self.service = build_service("calendar", "v3", http=self.authorized_http())
         return self
     
     def create_google_calendar_event(self, summary, start_time, end_time, attendees, description=""):
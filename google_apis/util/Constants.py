@@ -35,4 +35,20 @@ GMAIL_SCOPES = [
 
 DOCS_SCOPES = [
     "https://www.googleapis.com/auth/documents.readonly",
-]
\ No newline at end of file
+]
+
+EXTRA_SCOPES = [
+    "https://www.googleapis.com/auth/userinfo.email",
+    "openid",
+    "https://www.googleapis.com/auth/userinfo.profile",
+]
+
+APP_SCOPES = {
+    "sheet": SHEET_SCOPES,
+    "gmail": GMAIL_SCOPES,
+    "meet": CALENDAR_SCOPES,
+    "calendar": CALENDAR_SCOPES,
+    "docs": DOCS_SCOPES,
+    "drive": DRIVE_SCOPES,
+    "all": SCOPES,
+}
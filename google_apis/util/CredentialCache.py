@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from utils.constants import get_env_variable
+
+
+CachedCredential = namedtuple("CachedCredential", ["creds", "meta_info", "scopes", "cached_at"])
+
+
+class CredentialCache:
+    """
+    Bounded in-process LRU of credentials that already passed `Auth.check_auth`.
+    An entry is trusted while its access token stays valid, for at most
+    `max_age` seconds, so repeat requests skip the database load and scope
+    validation while re-authorizations and disconnects made by other workers
+    are picked up quickly.
+    """
+
+    def __init__(self, max_entries: int = None, max_age: float = None):
+        if max_entries is None:
+            max_entries = int(get_env_variable("GOOGLE_CREDENTIAL_CACHE_SIZE") or 10000)
+        if max_age is None:
+            max_age = float(get_env_variable("GOOGLE_CREDENTIAL_CACHE_MAX_AGE") or 60)
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, uid: str) -> CachedCredential | None:
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.cached_at > self.max_age:
+                del self._entries[uid]
+                return None
+            self._entries.move_to_end(uid)
+            return entry
+
+    def put(self, uid: str, creds, meta_info: dict = None) -> None:
+        if self.max_entries <= 0:
+            return
+        entry = CachedCredential(creds, dict(meta_info or {}), frozenset(creds.scopes or ()), time.monotonic())
+        with self._lock:
+            self._entries[uid] = entry
+            self._entries.move_to_end(uid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, uid: str) -> None:
+        with self._lock:
+            self._entries.pop(uid, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+credential_cache = CredentialCache()
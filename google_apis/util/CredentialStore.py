@@ -0,0 +1,97 @@
+import base64
+import hashlib
+import json
+import logging
+from typing import Optional, Dict, Any, Iterable, Iterator, Tuple
+from cryptography.fernet import Fernet, MultiFernet
+from django.conf import settings
+from google_apis.models import GoogleCredential
+from utils.constants import get_env_variable
+
+
+logger = logging.getLogger('django')
+
+# Fields needed to rebuild a Credentials object; everything else is dropped
+TOKEN_FIELDS = ("token", "refresh_token", "token_uri", "client_id", "client_secret", "scopes", "expiry", "rapt_token")
+# Values Credentials falls back to anyway, so they are not worth storing
+TOKEN_DEFAULTS = {"universe_domain": "googleapis.com", "account": ""}
+
+_fernet = None
+
+
+def configured_keys() -> list:
+    """Fernet keys from GOOGLE_CREDENTIAL_ENCRYPTION_KEYS, newest first."""
+    return [key.strip() for key in (get_env_variable("GOOGLE_CREDENTIAL_ENCRYPTION_KEYS") or "").split(",") if key.strip()]
+
+
+def get_fernet() -> MultiFernet:
+    """
+    Cipher for credential blobs. GOOGLE_CREDENTIAL_ENCRYPTION_KEYS holds comma
+    separated Fernet keys, newest first, so keys can be rotated; without it a
+    key is derived from SECRET_KEY, and changing SECRET_KEY then makes every
+    stored token unreadable (system check google_apis.W001 warns about it).
+    """
+    global _fernet
+    if _fernet is None:
+        keys = configured_keys()
+        if not keys:
+            keys = [base64.urlsafe_b64encode(hashlib.sha256(settings.SECRET_KEY.encode()).digest())]
+        _fernet = MultiFernet([Fernet(key) for key in keys])
+    return _fernet
+
+
+def encrypt_token(info: Dict[str, Any]) -> bytes:
+    """Serialize the token fields of an authorized-user dict compactly and encrypt them."""
+    compact = {
+        key: info[key]
+        for key in info
+        if info[key] not in (None, "", [])
+        and (key in TOKEN_FIELDS or (key in TOKEN_DEFAULTS and info[key] != TOKEN_DEFAULTS[key]))
+    }
+    return get_fernet().encrypt(json.dumps(compact, separators=(",", ":")).encode())
+
+
+def decrypt_token(blob: bytes) -> Dict[str, Any]:
+    return json.loads(get_fernet().decrypt(bytes(blob)))
+
+
+class CredentialStore:
+    """
+    Storage for Google OAuth credentials keyed by the unique, indexed uid.
+    Tokens are stored encrypted; meta_info is kept in its own column.
+    """
+
+    def load(self, uid: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Return (token info, meta_info) for a uid, or None when not connected."""
+        row = GoogleCredential.objects.filter(uuid=uid).only("token", "meta_info").first()
+        if row is None or not row.token:
+            return None
+        return decrypt_token(row.token), row.meta_info or {}
+
+    def save(self, uid: str, info: Dict[str, Any], meta_info: Dict[str, Any] = None) -> None:
+        GoogleCredential.objects.update_or_create(
+            uuid=uid,
+            defaults={"token": encrypt_token(info), "meta_info": meta_info or {}},
+        )
+
+    def delete(self, uid: str) -> bool:
+        deleted, _ = GoogleCredential.objects.filter(uuid=uid).delete()
+        return deleted > 0
+
+    def bulk_load(self, uids: Iterable[str] = None, batch_size: int = 1000) -> Iterator[Tuple[str, Dict[str, Any], Dict[str, Any]]]:
+        """
+        Stream (uid, token info, meta_info) for the given uids, or for every
+        stored credential, without materializing the whole table.
+        """
+        queryset = GoogleCredential.objects.exclude(token=None).only("uuid", "token", "meta_info")
+        if uids is not None:
+            queryset = queryset.filter(uuid__in=list(uids))
+
+        for row in queryset.iterator(chunk_size=batch_size):
+            try:
+                yield row.uuid, decrypt_token(row.token), row.meta_info or {}
+            except Exception as e:
+                logger.error(f"Error decrypting credentials for {row.uuid}: {str(e)}")
+
+
+credential_store = CredentialStore()
@@ -1,4 +1,4 @@
-from googleapiclient.discovery import build
+from google_apis.util.Service import build_service
 from googleapiclient.errors import HttpError
 from google_apis.util.Auth import Auth
 
@@ -14,7 +14,7 @@ class Doc(Auth):
         if isinstance(creds, dict) and "auth_url" in creds:
             return creds
 
-        self.doc = build("docs", "v1", credentials=creds).documents()
+        self.doc = build_service("docs", "v1", http=self.authorized_http()).documents()
         return self
 
     def get(self, doc_id):
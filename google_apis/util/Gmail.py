@@ -1,21 +1,110 @@
-import os.path
-from googleapiclient.discovery import build
+from google_apis.util.Service import build_service
 from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
 import base64
-import os
 from email.message import EmailMessage
-import mimetypes
-import requests
 from utils.constants import get_env_variable
 from google_apis.util.Auth import Auth
-import email
-import copy
+from google_apis.util.Attachment import load_attachment, write_message
+from google_apis.util.MessageCache import LABEL_HISTORY_TYPES, message_cache
+from google_apis.models import GmailSyncState
+from django.db import transaction
 from email.utils import parsedate_to_datetime
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import json
 import logging
+import time
 
 logger = logging.getLogger('django')
+# Gmail advises against more than 50 calls per batch request
+BATCH_LIMIT = 50
+# Headers kept with parsed (and cached) messages
+MESSAGE_HEADERS = ("From", "To", "Cc", "Subject", "Date", "Message-ID")
+_HEADER_NAMES = {name.lower(): name for name in MESSAGE_HEADERS}
+UNDATED = datetime.min.replace(tzinfo=timezone.utc)
+# messages.get parameters per fetch profile. "metadata" transfers only the
+# headers we keep and the snippet; bodies are loaded on demand.
+FETCH_PROFILES = {
+    "full": {"format": "full"},
+    "metadata": {
+        "format": "metadata",
+        "metadataHeaders": list(MESSAGE_HEADERS),
+        "fields": "id,threadId,historyId,labelIds,snippet,payload/headers",
+    },
+}
+# Messages with attachments larger than this go through a resumable upload
+SIMPLE_UPLOAD_BYTES = 5 * 1024 * 1024
+# Bytes read and sent per resumable upload request; a multiple of 256 KiB as the API requires
+UPLOAD_CHUNK_BYTES = 4 * 1024 * 1024
+# history.list pages replayed to refresh cached labels before refetching the messages instead
+MAX_HISTORY_PAGES = int(get_env_variable("GOOGLE_GMAIL_HISTORY_PAGES") or 3)
+# Most recent messages returned by a full sync, when there is no usable history cursor
+FULL_SYNC_LIMIT = int(get_env_variable("GOOGLE_GMAIL_FULL_SYNC_LIMIT") or 100)
+# Seconds after which another process's unreleased sync claim is ignored
+SYNC_CLAIM_TTL = int(get_env_variable("GOOGLE_GMAIL_SYNC_CLAIM_TTL") or 60)
+SYNC_CLAIM_POLL = 0.2
+
+
+def header_index(headers) -> dict:
+    """
+    MESSAGE_HEADERS present in a message, in one pass over its headers.
+    Names match case-insensitively and are stored in their MESSAGE_HEADERS
+    spelling; the first occurrence wins.
+    """
+    index = {}
+    for header in headers or []:
+        name = _HEADER_NAMES.get(header.get('name', '').lower())
+        if name and name not in index:
+            index[name] = header.get('value')
+    return index
+
+
+def parse_date(value):
+    """A Date header as an aware datetime (UTC when it has no zone), or None if missing or malformed."""
+    if not value:
+        return None
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+
+def find_text_part(payload):
+    """
+    Walk the MIME tree depth-first, in document order and without copying,
+    for the first text/plain part with inline data, falling back to the first
+    text/html one. Attachments are skipped without looking into them.
+    """
+    html = None
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        body = part.get('body') or {}
+        if part.get('filename') or body.get('attachmentId'):
+            continue
+        mime_type = part.get('mimeType', '')
+        if body.get('data'):
+            if mime_type == 'text/plain':
+                return part
+            if mime_type == 'text/html' and html is None:
+                html = part
+        stack.extend(reversed(part.get('parts') or []))
+    return html
+
+
+def decode_part(part) -> str:
+    """Decode a part's base64url body straight to text in its declared charset."""
+    data = part['body']['data']
+    raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+    charset = 'utf-8'
+    for header in part.get('headers') or []:
+        if header['name'].lower() == 'content-type' and 'charset=' in header['value'].lower():
+            charset = header['value'].lower().split('charset=', 1)[1].split(';')[0].strip(' "\'')
+    try:
+        return raw.decode(charset, errors='replace')
+    except LookupError:
+        return raw.decode('utf-8', errors='replace')
 
 
 class Gmail(Auth):
@@ -31,7 +120,7 @@ class Gmail(Auth):
         if isinstance(creds, dict) and "auth_url" in creds:
             return creds
 
-        self.gmail = build("gmail", "v1", credentials=creds)
+        self.gmail = build_service("gmail", "v1", http=self.authorized_http())
         return self
 
     def create_draft(self, message, to, sender, subject):
@@ -51,45 +140,35 @@ class Gmail(Auth):
         self.draft_id = draft["id"]
         return draft
 
-    def create_draft_with_attachment(self, message, to, sender, subject, attachment):
-        mime_message = EmailMessage()
-        mime_message["To"] = to
-        mime_message["From"] = sender
-        mime_message["Subject"] = subject
-
-        mime_message.set_content(message)
-        if attachment.startswith("http://") or attachment.startswith("https://"):
-            response = requests.get(attachment)
-            attachment_data = response.content
-            filename = attachment.split("/")[-1]
-            content_type = response.headers["Content-Type"]
-        else:
-            filename = os.path.basename(attachment)
-            content_type, _ = mimetypes.guess_type(attachment)
-            with open(attachment, "rb") as fp:
-                attachment_data = fp.read()
-
-        main_type, sub_type = (
-            content_type.split("/", 1)
-            if content_type
-            else ("application", "octet-stream")
-        )
-        mime_message.add_attachment(
-            attachment_data, maintype=main_type, subtype=sub_type, filename=filename
+    def attachment_upload(self, message, to, sender, subject, attachment):
+        """
+        Stream the attachment and the message built around it through spooled
+        temporary files into a media upload, resumable above SIMPLE_UPLOAD_BYTES.
+        Returns the upload and the file behind it, which the caller closes.
+        """
+        attachment_file, filename, content_type = load_attachment(attachment)
+        with attachment_file:
+            message_file, size = write_message(message, to, sender, subject, attachment_file, filename, content_type)
+        upload = MediaIoBaseUpload(
+            message_file, mimetype="message/rfc822", chunksize=UPLOAD_CHUNK_BYTES, resumable=size > SIMPLE_UPLOAD_BYTES
         )
-        encoded_message = base64.urlsafe_b64encode(mime_message.as_bytes()).decode()
-        create_draft_request_body = {"message": {"raw": encoded_message}}
+        return upload, message_file
+
+    def create_draft_with_attachment(self, message, to, sender, subject, attachment):
+        upload, message_file = self.attachment_upload(message, to, sender, subject, attachment)
         try:
             draft = (
                 self.gmail.users()
                 .drafts()
-                .create(userId="me", body=create_draft_request_body)
+                .create(userId="me", body={}, media_body=upload)
                 .execute()
             )
             self.draft_id = draft["id"]
             return draft
         except HttpError as error:
             return None
+        finally:
+            message_file.close()
 
     def send_send_message(self, message, to, sender, subject):
         mime_message = EmailMessage()
@@ -110,40 +189,17 @@ class Gmail(Auth):
     def send_send_message_with_attachment(
         self, message, to, sender, subject, attachment
     ):
-        mime_message = EmailMessage()
-        mime_message["To"] = to
-        mime_message["From"] = sender
-        mime_message["Subject"] = subject
-
-        mime_message.set_content(message)
-        if attachment.startswith("http://") or attachment.startswith("https://"):
-            response = requests.get(attachment)
-            attachment_data = response.content
-            filename = attachment.split("/")[-1]
-            content_type = response.headers["Content-Type"]
-        else:
-            filename = os.path.basename(attachment)
-            content_type, _ = mimetypes.guess_type(attachment)
-            with open(attachment, "rb") as fp:
-                attachment_data = fp.read()
-
-        main_type, sub_type = (
-            content_type.split("/", 1)
-            if content_type
-            else ("application", "octet-stream")
-        )
-        mime_message.add_attachment(
-            attachment_data, maintype=main_type, subtype=sub_type, filename=filename
-        )
-        encoded_message = base64.urlsafe_b64encode(mime_message.as_bytes()).decode()
-        create_message = {"raw": encoded_message}
-        send_message = (
-            self.gmail.users()
-            .messages()
-            .send(userId="me", body=create_message)
-            .execute()
-        )
-        return send_message
+        upload, message_file = self.attachment_upload(message, to, sender, subject, attachment)
+        try:
+            send_message = (
+                self.gmail.users()
+                .messages()
+                .send(userId="me", body={}, media_body=upload)
+                .execute()
+            )
+            return send_message
+        finally:
+            message_file.close()
 
     def send_draft(self, draft_id):
         draft = (
@@ -170,29 +226,220 @@ class Gmail(Auth):
         except HttpError as error:
             return False
         
-    def data_encoder(self, text):
-        if text and len(text)>0:
-            message = base64.urlsafe_b64decode(text.encode('UTF8'))
-            message = str(message, 'utf-8')
-            message = email.message_from_string(message)
-            return message
-        else:
-            return None
-
     def read_message(self, content)->str:
-        if content.get('payload').get('parts', None):
-            parts = content.get('payload').get('parts', None)
-            sub_part = copy.deepcopy(parts[0])
-            while sub_part.get("mimeType", None) != "text/plain":
+        """Text of the message's text/plain part (text/html if there is none), else its snippet."""
+        part = find_text_part(content.get('payload') or {})
+        return decode_part(part) if part else content.get("snippet")
+
+    def execute_batch(self, calls, strict=False, errors=None):
+        """
+        Execute API calls as Google batch requests of up to BATCH_LIMIT calls
+        and return their results in order. Failed calls are logged and give
+        None, or raise their error when `strict`; pass a dict as `errors` to
+        get each failure by its call's index.
+        """
+        results = [None] * len(calls)
+        errors = {} if errors is None else errors
+
+        def collect(request_id, response, exception):
+            if exception is not None:
+                errors[int(request_id)] = exception
+            else:
+                results[int(request_id)] = response
+
+        # Sub-requests carry the token they were serialized with, so make sure it is current
+        http = getattr(self.gmail, "_http", None)
+        if http is not None and hasattr(http, "refresh_credentials") and not http.credentials.valid:
+            http.refresh_credentials()
+
+        for start in range(0, len(calls), BATCH_LIMIT):
+            batch = self.gmail.new_batch_http_request(callback=collect)
+            for index in range(start, min(start + BATCH_LIMIT, len(calls))):
+                batch.add(calls[index], request_id=str(index))
+            batch.execute()
+
+        for index, error in sorted(errors.items()):
+            if strict:
+                raise error
+            logger.error(f"Batched Gmail call {index} failed: {error}")
+        return results
+
+    def parse_message(self, message, profile="full") -> dict:
+        """Reduce a fetched message to what we serve and cache; only "full" carries a body."""
+        headers = header_index(message.get('payload', {}).get('headers'))
+        return {
+            'id': message['id'],
+            'thread_id': message.get('threadId'),
+            'history_id': int(message['historyId']) if message.get('historyId') else None,
+            'headers': headers,
+            'body': self.read_message(content=message) if profile == "full" else None,
+            'snippet': message.get('snippet'),
+            'labels': message.get('labelIds', []),
+        }
+
+    def get_messages(self, message_ids, profile="full"):
+        """
+        Parsed messages for the given ids, in order, fetched with one of
+        FETCH_PROFILES. Cached messages are served from the message cache with
+        their labels brought up to date through history.list; the rest are
+        fetched in one batch and cached.
+        """
+        cached = message_cache.get_many(self.uid, message_ids)
+        if profile == "full":
+            # Metadata-only entries still need their body
+            cached = {message_id: message for message_id, message in cached.items() if message['body'] is not None}
+        start_history_id = message_cache.start_history_id(cached)
+        missing = [message_id for message_id in message_ids if message_id not in cached]
+
+        calls = []
+        if start_history_id:
+            calls.append(self.gmail.users().history().list(
+                userId='me', startHistoryId=start_history_id, historyTypes=LABEL_HISTORY_TYPES
+            ))
+        calls += [self.gmail.users().messages().get(userId='me', id=message_id, **FETCH_PROFILES[profile]) for message_id in missing]
+        errors = {}
+        results = self.execute_batch(calls, errors=errors)
+
+        if start_history_id:
+            page, results = results[0], results[1:]
+            error = errors.get(0)
+            if page is None and not (isinstance(error, HttpError) and error.resp.status == 404):
+                # Labels could not be refreshed this time; serve the cached copies as they are
+                pass
+            elif page is None:
+                # History no longer reaches back that far; fetch the cached messages again
+                message_cache.discard(self.uid, cached)
+                results += self.refetch(list(cached), profile)
+                cached = {}
+            else:
+                pages = [page]
+                while pages[-1].get('nextPageToken') and len(pages) < MAX_HISTORY_PAGES:
+                    pages.append(self.gmail.users().history().list(
+                        userId='me', startHistoryId=start_history_id, historyTypes=LABEL_HISTORY_TYPES,
+                        pageToken=pages[-1]['nextPageToken'],
+                    ).execute())
+                if pages[-1].get('nextPageToken'):
+                    # Too much mailbox history since these were cached; one batch of refetches is cheaper
+                    results += self.refetch(list(cached), profile)
+                    cached = {}
+                else:
+                    cached = message_cache.apply_history(self.uid, cached, pages)
+
+        fetched = [self.parse_message(message, profile) for message in results if message]
+        message_cache.put_many(self.uid, fetched)
+        found = {**cached, **{message['id']: message for message in fetched}}
+        return [found[message_id] for message_id in message_ids if message_id in found]
+
+    def refetch(self, message_ids, profile="full"):
+        """Fetch messages again in one batch, whether cached or not."""
+        return self.execute_batch([
+            self.gmail.users().messages().get(userId='me', id=message_id, **FETCH_PROFILES[profile])
+            for message_id in message_ids
+        ])
+
+    def full_sync(self):
+        """
+        Cache the metadata of the FULL_SYNC_LIMIT most recent messages and
+        return the mailbox historyId to continue from.
+        """
+        profile, listing = self.execute_batch([
+            self.gmail.users().getProfile(userId='me'),
+            self.gmail.users().messages().list(userId='me', maxResults=FULL_SYNC_LIMIT),
+        ], strict=True)
+        self.get_messages([message['id'] for message in listing.get('messages', [])], "metadata")
+        return int(profile['historyId'])
+
+    def messages_since(self, start_history_id):
+        """
+        Messages added after `start_history_id`, oldest first, and the
+        historyId they bring the mailbox to. Raises HttpError 404 when the
+        history no longer reaches back that far.
+        """
+        message_ids = []
+        page = {}
+        while True:
+            params = {'userId': 'me', 'startHistoryId': start_history_id, 'historyTypes': ['messageAdded']}
+            if page.get('nextPageToken'):
+                params['pageToken'] = page['nextPageToken']
+            page = self.gmail.users().history().list(**params).execute()
+            for record in page.get('history', []):
+                message_ids += [added['message']['id'] for added in record.get('messagesAdded', [])]
+            if not page.get('nextPageToken'):
+                break
+        return self.get_messages(list(dict.fromkeys(message_ids))), int(page.get('historyId') or start_history_id)
+
+    def claim_sync(self, history_id=None, email_address=None):
+        """
+        Claim this account's sync state and return its cursor (0 before the
+        first sync), or None when the notified `history_id` is already synced.
+        The row is locked only long enough to read and mark it, so no
+        transaction stays open during the Gmail calls; callers in other
+        processes wait for an unexpired claim to go.
+        """
+        while True:
+            with transaction.atomic():
+                GmailSyncState.objects.get_or_create(
+                    uuid=self.uid, defaults={'history_id': 0, 'email_address': email_address}
+                )
+                state = GmailSyncState.objects.select_for_update().get(uuid=self.uid)
+                if state.history_id and history_id and int(history_id) <= state.history_id:
+                    return None
+                now = datetime.now(timezone.utc)
+                if not state.claimed_at or now - state.claimed_at > timedelta(seconds=SYNC_CLAIM_TTL):
+                    GmailSyncState.objects.filter(id=state.id).update(claimed_at=now)
+                    return state.history_id
+            time.sleep(SYNC_CLAIM_POLL)
+
+    def sync_messages(self, history_id=None, email_address=None):
+        """
+        Messages added since the last sync of this account, oldest first.
+        Pages through history.list from the stored historyId and fetches the
+        new messages in batch. `history_id` is the one announced by a push
+        notification, letting already-synced notifications skip the API.
+
+        Without a usable cursor (first sync, or expired) the recent messages
+        are cached by a full sync but not reported: only the change the
+        notification announces is returned, and the cursor starts from there.
+        One sync per account runs at a time (see claim_sync) and the cursor
+        only moves forward, so concurrent deliveries don't report mail twice.
+        """
+        start = self.claim_sync(history_id, email_address)
+        if start is None:
+            return []
+
+        try:
+            messages = None
+            if start:
                 try:
-                    sub_part = copy.deepcopy(sub_part.get('parts', None)[0])
-                except Exception as e:
-                    break
-            return self.data_encoder(sub_part.get('body', None).get('data', None)).as_string()
-        else:
-            return content.get("snippet")
-
-    def get_email_messages(self, target_email, page_token=None, page_size=10):
+                    messages, cursor = self.messages_since(start)
+                except HttpError as error:
+                    if error.resp.status != 404:
+                        raise
+                    logger.info(f"Gmail history cursor {start} expired for {self.uid}, running a full sync")
+
+            if messages is None:
+                messages, cursor = [], self.full_sync()
+                if history_id:
+                    try:
+                        messages, notified = self.messages_since(int(history_id) - 1)
+                        cursor = max(cursor, notified)
+                    except HttpError as error:
+                        if error.resp.status != 404:
+                            raise
+
+            fields = {'history_id': cursor, 'synced_at': datetime.now(timezone.utc)}
+            if email_address:
+                fields['email_address'] = email_address
+            GmailSyncState.objects.filter(uuid=self.uid, history_id__lt=cursor).update(**fields)
+            return messages
+        finally:
+            GmailSyncState.objects.filter(uuid=self.uid).update(claimed_at=None)
+
+    def get_email_bodies(self, message_ids):
+        """Bodies of messages listed without them, by id."""
+        return {message['id']: message['body'] for message in self.get_messages(message_ids)}
+
+    def get_email_messages(self, target_email, page_token=None, page_size=10, include_body=True):
         try:
             if not target_email:
                 raise ValueError("Sender email is required")
@@ -213,34 +460,34 @@ class Gmail(Auth):
             if page_token and '@' not in page_token:
                 sent_params['pageToken'] = page_token
 
-            messages_data = [] 
-            received_messages = self.gmail.users().messages().list(**received_params).execute().get('messages', [])
-            sent_messages = self.gmail.users().messages().list(**sent_params).execute().get('messages', [])
+            dated = []
+            # Both lists in one round trip, then every message in one more
+            received, sent = self.execute_batch([
+                self.gmail.users().messages().list(**received_params),
+                self.gmail.users().messages().list(**sent_params),
+            ], strict=True)
+            all_messages = received.get('messages', []) + sent.get('messages', [])
+            message_ids = list(dict.fromkeys(email['id'] for email in all_messages))
 
-            all_messages = received_messages + sent_messages
-            
-            for email in all_messages:
-                message = self.gmail.users().messages().get(userId='me', id=email['id'], format="full").execute()
-                if not message:
-                    continue
-                data = self.read_message(content=message)
-                _from = next((h for h in message.get('payload', {}).get('headers', []) if h['name'] == 'From'), None).get('value', None)
-                _to = next((h for h in message.get('payload', {}).get('headers', []) if h['name'] == 'To'), None).get('value', None)
-                date = next((h for h in message.get('payload', {}).get('headers', []) if h['name'] == 'Date'), None).get('value', None)
-                messages_data.append({
-                    'id': email['id'],
-                    'body': data,
+            profile = "full" if include_body else "metadata"
+            for message in self.get_messages(message_ids, profile):
+                headers = message['headers']
+                _from = headers.get('From')
+                dated.append((parse_date(headers.get('Date')) or UNDATED, {
+                    'id': message['id'],
+                    'body': message['body'] if include_body else None,
+                    'snippet': message['snippet'],
                     'type': 'received' if _from == target_email else 'sent',
                     'from': _from,
-                    'to': _to,
-                    'date': date,
-                    'subject': next((h for h in message.get('payload', {}).get('headers', []) if h['name'] == 'Subject'), None).get('value', None),
-                })
+                    'to': headers.get('To'),
+                    'date': headers.get('Date'),
+                    'subject': headers.get('Subject'),
+                }))
             
-            # Sort messages by date
-            messages_data.sort(key=lambda x: parsedate_to_datetime(x['date']) if x['date'] else datetime.min)
+            # Sort messages by date, parsed once per message; undated ones first
+            dated.sort(key=lambda item: item[0])
             return {
-                'messages': messages_data
+                'messages': [data for _, data in dated]
             }
         except HttpError as error:
             logger.error(f"An error occurred: {error}")
@@ -261,13 +508,14 @@ class Gmail(Auth):
 
     def get_email_message_from_webhook(self, webhook_data):
         """
-        Process webhook data from Gmail push notifications and retrieve the email message.
+        Process webhook data from Gmail push notifications and retrieve the
+        messages added since the previous notification.
         
         Args:
             webhook_data (dict): The webhook payload containing message data
             
         Returns:
-            dict: The email message details or None if an error occurs
+            dict: The account, its historyId and the new messages, or None if an error occurs
         """
         try:
             encoded_data = webhook_data.get('message', {}).get('data', '')
@@ -284,54 +532,24 @@ class Gmail(Auth):
             if not history_id:
                 logger.error("No history ID found in decoded webhook data")
                 return None
-                
-            history = self.gmail.users().history().list(
-                userId='me',
-                startHistoryId=history_id,
-                historyTypes=['messageAdded']
-            ).execute()
-            
-            if not history or 'history' not in history:
-                logger.error(f"No history found for history ID: {history_id}")
-                return None
-                
-            message_id = None
-            for item in history.get('history', []):
-                for message_added in item.get('messagesAdded', []):
-                    message_id = message_added.get('message', {}).get('id')
-                    if message_id:
-                        break
-                if message_id:
-                    break
-                    
-            if not message_id:
-                logger.error("No message ID found in history")
-                return None
-                
-            message = self.gmail.users().messages().get(
-                userId='me',
-                id=message_id,
-                format="full"
-            ).execute()
-            
-            if not message:
-                logger.error(f"Could not retrieve message with ID: {message_id}")
-                return None
-                
-            data = self.read_message(content=message)
-            _from = next((h for h in message.get('payload', {}).get('headers', []) if h['name'] == 'From'), None)
-            _to = next((h for h in message.get('payload', {}).get('headers', []) if h['name'] == 'To'), None)
-            date = next((h for h in message.get('payload', {}).get('headers', []) if h['name'] == 'Date'), None)
-            subject = next((h for h in message.get('payload', {}).get('headers', []) if h['name'] == 'Subject'), None)
-            
+
+            messages = self.sync_messages(history_id, email_address)
             return {
-                'id': message_id,
-                'body': data,
-                'from': _from.get('value') if _from else None,
-                'to': _to.get('value') if _to else None,
-                'date': date.get('value') if date else None,
-                'subject': subject.get('value') if subject else None,
-                'raw_message': message
+                'email_address': email_address,
+                'history_id': history_id,
+                'messages': [
+                    {
+                        'id': message['id'],
+                        'thread_id': message['thread_id'],
+                        'body': message['body'],
+                        'from': message['headers'].get('From'),
+                        'to': message['headers'].get('To'),
+                        'date': message['headers'].get('Date'),
+                        'subject': message['headers'].get('Subject'),
+                        'labels': message['labels'],
+                    }
+                    for message in messages
+                ],
             }
             
         except Exception as e:
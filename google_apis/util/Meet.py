@@ -1,4 +1,4 @@
-from googleapiclient.discovery import build
+from google_apis.util.Service import build_service
 from googleapiclient.errors import HttpError
 from google_apis.util.Auth import Auth
 import logging
@@ -20,7 +20,7 @@ class Meet(Auth):
         if isinstance(creds, dict) and "auth_url" in creds:
             return creds
 
-        self.service = build("calendar", "v3", credentials=creds)
+        self.service = build_service("calendar", "v3", http=self.authorized_http())
         return self
 
 
@@ -0,0 +1,138 @@
+import logging
+from typing import Dict, Iterable, List
+from google_apis.models import GmailMessage
+from utils.constants import get_env_variable
+
+
+logger = logging.getLogger('django')
+
+# Label changes and deletions are all that can happen to a message after it is sent
+LABEL_HISTORY_TYPES = ["labelAdded", "labelRemoved", "messageDeleted"]
+
+
+def _to_dict(row: GmailMessage) -> Dict:
+    return {
+        "id": row.message_id,
+        "thread_id": row.thread_id,
+        "history_id": row.history_id,
+        "headers": row.headers or {},
+        "body": row.body,
+        "snippet": row.snippet,
+        "labels": row.labels or [],
+    }
+
+
+class MessageCache:
+    """
+    Bounded database cache of parsed Gmail messages keyed by (uid, message id).
+    Message content never changes, so only labels are kept current, by
+    replaying history.list from the oldest historyId of the messages served.
+    At most `max_messages` messages are kept per user, oldest dropped first;
+    the oldest are pruned once a tenth of that has been written since the
+    last prune, so the table may briefly run that far over.
+    Messages fetched with the metadata profile are cached without a body.
+    """
+
+    def __init__(self, max_messages: int = None):
+        if max_messages is None:
+            max_messages = int(get_env_variable("GOOGLE_GMAIL_CACHE_SIZE") or 5000)
+        self.max_messages = max_messages
+        self.prune_every = max(max_messages // 10, 1)
+        self._written = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_messages > 0
+
+    def get_many(self, uid: str, message_ids: Iterable[str]) -> Dict[str, Dict]:
+        if not self.enabled:
+            return {}
+        rows = GmailMessage.objects.filter(uuid=uid, message_id__in=list(message_ids))
+        return {row.message_id: _to_dict(row) for row in rows}
+
+    def put_many(self, uid: str, messages: List[Dict]) -> None:
+        if not self.enabled or not messages:
+            return
+        with_body = [message for message in messages if message.get("body") is not None]
+        without_body = [message for message in messages if message.get("body") is None]
+        fields = ["thread_id", "history_id", "headers", "snippet", "labels"]
+        self._upsert(uid, with_body, fields + ["body"])
+        # Metadata-only fetches must not clear a body cached earlier
+        self._upsert(uid, without_body, fields)
+        self._written[uid] = self._written.get(uid, 0) + len(messages)
+        if self._written[uid] >= self.prune_every:
+            self.prune(uid)
+
+    def _upsert(self, uid: str, messages: List[Dict], update_fields: List[str]) -> None:
+        if not messages:
+            return
+        GmailMessage.objects.bulk_create(
+            [
+                GmailMessage(
+                    uuid=uid,
+                    message_id=message["id"],
+                    thread_id=message.get("thread_id"),
+                    history_id=message.get("history_id"),
+                    headers=message.get("headers") or {},
+                    body=message.get("body"),
+                    snippet=message.get("snippet"),
+                    labels=message.get("labels") or [],
+                )
+                for message in messages
+            ],
+            update_conflicts=True,
+            unique_fields=["uuid", "message_id"],
+            update_fields=update_fields,
+        )
+
+    def prune(self, uid: str) -> None:
+        self._written[uid] = 0
+        stale = list(
+            GmailMessage.objects.filter(uuid=uid)
+            .order_by("-cached_at", "-id")
+            .values_list("id", flat=True)[self.max_messages:]
+        )
+        if stale:
+            GmailMessage.objects.filter(id__in=stale).delete()
+
+    def discard(self, uid: str, message_ids: Iterable[str]) -> None:
+        GmailMessage.objects.filter(uuid=uid, message_id__in=list(message_ids)).delete()
+
+    def start_history_id(self, cached: Dict[str, Dict]):
+        """historyId to replay label changes from for these cached messages, or None."""
+        history_ids = [message["history_id"] for message in cached.values() if message.get("history_id")]
+        return min(history_ids) if history_ids else None
+
+    def apply_history(self, uid: str, cached: Dict[str, Dict], pages: List[Dict]) -> Dict[str, Dict]:
+        """
+        Apply history.list pages to the cached messages (in place and in the
+        database) and return the ones still present.
+        """
+        deleted = set()
+        for page in pages:
+            for record in page.get("history", []):
+                for change in record.get("labelsAdded", []) + record.get("labelsRemoved", []):
+                    message = change.get("message", {})
+                    if message.get("id") in cached and "labelIds" in message:
+                        cached[message["id"]]["labels"] = message["labelIds"]
+                for change in record.get("messagesDeleted", []):
+                    message_id = change.get("message", {}).get("id")
+                    if message_id in cached:
+                        deleted.add(message_id)
+
+        history_id = max((int(page["historyId"]) for page in pages if page.get("historyId")), default=None)
+        if deleted:
+            self.discard(uid, deleted)
+        alive = {message_id: message for message_id, message in cached.items() if message_id not in deleted}
+        if history_id is not None:
+            for message in alive.values():
+                message["history_id"] = history_id
+            rows = list(GmailMessage.objects.filter(uuid=uid, message_id__in=list(alive)))
+            for row in rows:
+                row.labels = alive[row.message_id]["labels"]
+                row.history_id = history_id
+            GmailMessage.objects.bulk_update(rows, ["labels", "history_id"])
+        return alive
+
+
+message_cache = MessageCache()
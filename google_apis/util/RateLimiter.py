@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+from utils.constants import get_env_variable
+
+
+logger = logging.getLogger('django')
+
+# Requests per minute, per user and per project, mirroring the published default quotas.
+# Override with GOOGLE_RATE_LIMITS, e.g. "sheets:user=60,sheets:project=300,gmail:user=0" (0 = unlimited).
+DEFAULT_LIMITS = {
+    ("sheets", "user"): 60,
+    ("sheets", "project"): 300,
+    ("gmail", "user"): 3000,
+    ("calendar", "user"): 600,
+    ("drive", "user"): 12000,
+    ("docs", "user"): 300,
+    ("docs", "project"): 3000,
+}
+# Never slow a bucket below this share of its configured rate after throttling
+MIN_RATE_FACTOR = 0.1
+# Share of the configured rate regained after every successful call
+RECOVERY_FACTOR = 0.05
+
+
+def parse_limits(spec: str) -> dict:
+    limits = dict(DEFAULT_LIMITS)
+    for item in (spec or "").split(","):
+        if "=" not in item or ":" not in item:
+            continue
+        name, value = item.split("=", 1)
+        api, scope = name.strip().split(":", 1)
+        limits[(api, scope)] = float(value)
+    return limits
+
+
+def api_name(uri: str) -> str:
+    """The API a request belongs to: sheets.googleapis.com -> sheets, www.googleapis.com/calendar/v3 -> calendar."""
+    parts = urlsplit(uri)
+    host = parts.hostname or ""
+    if host.endswith(".googleapis.com") and not host.startswith("www."):
+        return host.split(".")[0]
+    segments = [segment for segment in parts.path.split("/") if segment]
+    if segments and segments[0] in ("upload", "batch"):
+        segments = segments[1:]
+    return segments[0] if segments else host
+
+
+class Bucket:
+    """
+    Token bucket holding up to a minute of quota. Its rate is halved on every
+    throttling response and creeps back towards the configured rate as calls
+    succeed; Retry-After closes it until the given time.
+    """
+
+    def __init__(self, per_minute: float):
+        self.ceiling = per_minute / 60.0
+        self.rate = self.ceiling
+        self.capacity = max(per_minute, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.granted = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+    def _fill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float, cost: int = 1) -> float:
+        """Seconds until `cost` tokens are available (at most a full bucket is waited for)."""
+        self._fill(now)
+        wait = max(self.blocked_until - now, 0.0)
+        needed = min(cost, self.capacity)
+        if self.tokens < needed:
+            wait = max(wait, (needed - self.tokens) / self.rate)
+        return wait
+
+    def take(self, cost: int = 1) -> None:
+        self.tokens -= cost
+        self.granted += cost
+
+    def throttle(self, now: float, retry_after: float = None) -> None:
+        self._fill(now)
+        self.throttled += 1
+        self.rate = max(self.rate / 2, self.ceiling * MIN_RATE_FACTOR)
+        self.tokens = min(self.tokens, 0.0)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def recover(self) -> None:
+        self.rate = min(self.ceiling, self.rate + self.ceiling * RECOVERY_FACTOR)
+
+    def utilization(self) -> float:
+        self._fill(time.monotonic())
+        return round(1 - self.tokens / self.capacity, 4)
+
+
+class RateLimiter:
+    """
+    Client-side quota guard for Google API calls, keyed by (api, user, project).
+    Calls wait for a token of both their user bucket and their project bucket
+    instead of being sent into a 429; throttling responses slow the buckets
+    down. Waiting is capped at `max_wait` seconds, after which the call is sent
+    anyway and left to the API's own quota enforcement.
+    """
+
+    def __init__(self, limits: dict = None, max_wait: float = None):
+        if limits is None:
+            limits = parse_limits(get_env_variable("GOOGLE_RATE_LIMITS"))
+        if max_wait is None:
+            max_wait = float(get_env_variable("GOOGLE_RATE_LIMIT_MAX_WAIT") or 60)
+        self.limits = limits
+        self.max_wait = max_wait
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def keys(self, api: str, user: str, project: str) -> list:
+        """Bucket keys a call is subject to; only APIs with a configured limit get any."""
+        keys = []
+        if user and self.limits.get((api, "user")):
+            keys.append((api, user, project))
+        if self.limits.get((api, "project")):
+            keys.append((api, None, project))
+        return keys
+
+    def _bucket(self, key) -> Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            scope = "user" if key[1] is not None else "project"
+            bucket = self._buckets[key] = Bucket(self.limits[(key[0], scope)])
+        return bucket
+
+    def acquire(self, keys: list, cost: int = 1) -> float:
+        """
+        Block until every bucket in `keys` grants `cost` tokens (one per API
+        call, so a batch request costs the calls it carries); returns the
+        seconds waited.
+        """
+        if not keys:
+            return 0.0
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                buckets = [self._bucket(key) for key in keys]
+                delay = max(bucket.delay(now, cost) for bucket in buckets)
+                waited = now - started
+                if delay <= 0 or waited + delay > self.max_wait:
+                    if delay > 0:
+                        logger.info(f"Rate limit wait for {keys[0][0]} exceeded {self.max_wait}s, sending anyway")
+                    for bucket in buckets:
+                        bucket.take(cost)
+                        bucket.waited += waited
+                    return waited
+            time.sleep(delay)
+
+    def throttle(self, keys: list, retry_after: float = None) -> None:
+        """Record a throttling response for the buckets of a call."""
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                self._bucket(key).throttle(now, retry_after)
+
+    def succeed(self, keys: list) -> None:
+        with self._lock:
+            for key in keys:
+                self._bucket(key).recover()
+
+    def utilization(self, user: str) -> list:
+        """Current state of one user's buckets."""
+        with self._lock:
+            return [
+                {
+                    "api": api,
+                    "user": bucket_user,
+                    "project": project,
+                    "utilization": bucket.utilization(),
+                    "rate_per_minute": round(bucket.rate * 60, 2),
+                    "limit_per_minute": round(bucket.ceiling * 60, 2),
+                    "granted": bucket.granted,
+                    "throttled": bucket.throttled,
+                    "waited_seconds": round(bucket.waited, 3),
+                }
+                for (api, bucket_user, project), bucket in self._buckets.items()
+                if bucket_user == user
+            ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,132 @@
+import json
+import logging
+import threading
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import Resource, build, build_from_document, fix_method_name
+from googleapiclient.http import build_http
+
+
+logger = logging.getLogger('django')
+
+_documents = {}
+_templates = {}
+_documents_lock = threading.Lock()
+
+
+class CachedResource(Resource):
+    """
+    Resource whose methods are created once per section of a cached discovery
+    document and only bound to each new instance. googleapiclient otherwise
+    rebuilds every method, docstring included, whenever a resource such as
+    `spreadsheets().values()` is accessed.
+    """
+
+    _methods = {}
+    _methods_lock = threading.Lock()
+
+    def _set_service_methods(self):
+        for name, function, bind in self._service_methods():
+            self._set_dynamic_attr(name, function.__get__(self, self.__class__) if bind else function)
+
+    def _service_methods(self):
+        key = id(self._resourceDesc)
+        entry = self._methods.get(key)
+        if entry is not None and entry[0] is self._resourceDesc:
+            return entry[1]
+
+        with self._methods_lock:
+            entry = self._methods.get(key)
+            if entry is None or entry[0] is not self._resourceDesc:
+                entry = self._methods[key] = (self._resourceDesc, self._build_methods())
+            return entry[1]
+
+    def _build_methods(self):
+        """(name, function, bind) for every dynamic attribute googleapiclient would set."""
+        plain = Resource(
+            http=None, baseUrl=self._baseUrl, model=self._model, requestBuilder=self._requestBuilder,
+            developerKey=self._developerKey, resourceDesc=self._resourceDesc, rootDesc=self._rootDesc,
+            schema=self._schema, universe_domain=self._universe_domain,
+        )
+        nested = {fix_method_name(name): child for name, child in self._resourceDesc.get("resources", {}).items()}
+        methods = []
+        for name in plain._dynamic_attrs:
+            if name in nested:
+                methods.append((name, _nested_resource(nested[name]), True))
+            else:
+                value = plain.__dict__[name]
+                bound = hasattr(value, "__func__")
+                methods.append((name, value.__func__ if bound else value, bound))
+        return methods
+
+
+def _nested_resource(description: dict):
+    def resource(self):
+        return CachedResource(
+            http=self._http, baseUrl=self._baseUrl, model=self._model, requestBuilder=self._requestBuilder,
+            developerKey=self._developerKey, resourceDesc=description, rootDesc=self._rootDesc,
+            schema=self._schema, universe_domain=self._universe_domain,
+        )
+
+    resource.__doc__ = "A collection resource."
+    resource.__is_resource__ = True
+    return resource
+
+
+def _prepare(resource, description: dict) -> None:
+    """
+    Instantiate every nested resource once. googleapiclient fixes up method
+    parameters in place the first time a method is created, so doing it
+    up front leaves the shared document stable for concurrent requests.
+    """
+    for name, child in description.get("resources", {}).items():
+        _prepare(getattr(resource, fix_method_name(name))(), child)
+
+
+def _load(api: str, version: str):
+    """Parse the static discovery document once and build its method tree."""
+    key = (api, version)
+    template = _templates.get(key)
+    if template is not None or key in _documents:
+        return template
+
+    with _documents_lock:
+        if key not in _documents:
+            content = discovery_cache.get_static_doc(api, version)
+            document = json.loads(content) if content is not None else None
+            if document is not None:
+                root = build_from_document(document, http=build_http())
+                template = _bind(root, root._http)
+                _prepare(template, document)
+                _templates[key] = template
+            _documents[key] = document
+        return _templates.get(key)
+
+
+def _bind(template: Resource, http) -> CachedResource:
+    return CachedResource(
+        http=http, baseUrl=template._baseUrl, model=template._model, requestBuilder=template._requestBuilder,
+        developerKey=template._developerKey, resourceDesc=template._resourceDesc, rootDesc=template._rootDesc,
+        schema=template._schema, universe_domain=template._universe_domain,
+    )
+
+
+def get_discovery_document(api: str, version: str) -> dict | None:
+    """Return the parsed static discovery document for an API, loading it once."""
+    _load(api, version)
+    return _documents.get((api, version))
+
+
+def build_service(api: str, version: str, credentials=None, http=None):
+    """
+    Build a googleapiclient Resource for `api`/`version` from the cached
+    discovery document, bound to the given credentials or http transport.
+    Only the transport is per call; methods are shared across services.
+    """
+    template = _load(api, version)
+    if template is None:
+        logger.info(f"No static discovery document for {api} {version}, falling back to build()")
+        return build(api, version, credentials=credentials, http=http, static_discovery=False)
+    if http is None:
+        http = AuthorizedHttp(credentials, http=build_http())
+    return _bind(template, http)
@@ -1,5 +1,48 @@
-from googleapiclient.discovery import build
+import logging
+from google_apis.util.A1 import column_letter, parse_range, split_tab, format_range
+from google_apis.util.Service import build_service
 from google_apis.util.Auth import Auth
+from google_apis.util.SheetCache import range_cache
+from google_apis.util.SheetMetadata import METADATA_FIELDS, SpreadsheetMetadata, is_structural, metadata_cache
+from google_apis.util.SheetSnapshot import SheetSnapshot
+from utils.constants import get_env_variable
+
+
+logger = logging.getLogger('django')
+# Revalidate expired cache entries against the Drive file version instead of re-reading them
+VALIDATE_REVISIONS = (get_env_variable("GOOGLE_SHEET_CACHE_VALIDATE") or "false").lower() == "true"
+# Tag rows we write with developer metadata so they can be found without downloading the sheet.
+# Off by default: every session lookup then costs a batchGetByDataFilter call and new sessions a
+# metadata write, and a spreadsheet holds at most 30,000 characters of developer metadata per
+# sheet, after which every tag fails. Worth it for sheets too large to scan on each lookup.
+TAG_ROWS = (get_env_variable("GOOGLE_SHEET_ROW_TAGS") or "false").lower() == "true"
+# Rows per window when streaming large ranges
+EXPORT_WINDOW = int(get_env_variable("GOOGLE_SHEET_EXPORT_WINDOW") or 5000)
+
+MAJOR_DIMENSIONS = ("ROWS", "COLUMNS")
+VALUE_RENDER_OPTIONS = ("FORMATTED_VALUE", "UNFORMATTED_VALUE", "FORMULA")
+DATE_TIME_RENDER_OPTIONS = ("SERIAL_NUMBER", "FORMATTED_STRING")
+
+
+def read_options(major_dimension=None, value_render_option=None, date_time_render_option=None, fields=None):
+    """
+    Query parameters for a values read, leaving out defaults so default reads
+    share cache entries. Raises ValueError for unknown option values.
+    """
+    if major_dimension not in (None,) + MAJOR_DIMENSIONS:
+        raise ValueError(f"Invalid major_dimension: {major_dimension}")
+    if value_render_option not in (None,) + VALUE_RENDER_OPTIONS:
+        raise ValueError(f"Invalid value_render_option: {value_render_option}")
+    if date_time_render_option not in (None,) + DATE_TIME_RENDER_OPTIONS:
+        raise ValueError(f"Invalid date_time_render_option: {date_time_render_option}")
+
+    options = {
+        "majorDimension": None if major_dimension == "ROWS" else major_dimension,
+        "valueRenderOption": None if value_render_option == "FORMATTED_VALUE" else value_render_option,
+        "dateTimeRenderOption": None if date_time_render_option == "SERIAL_NUMBER" else date_time_render_option,
+        "fields": fields,
+    }
+    return {name: value for name, value in options.items() if value}
 
 
 class Sheet(Auth):
@@ -7,13 +50,14 @@ class Sheet(Auth):
     def __init__(self, user_id, apps = ['sheets']):
         super().__init__(user_id, apps=apps)
         self.sheet = None
+        self.drive = None
 
 
     def __enter__(self):
         creds = super().__enter__()
         if isinstance(creds, dict):
             return creds
-        self.sheet = build("sheets", "v4", credentials=creds).spreadsheets()
+        self.sheet = build_service("sheets", "v4", http=self.authorized_http()).spreadsheets()
         return self
 
 
@@ -82,6 +126,8 @@ class Sheet(Auth):
                 )
                 .execute()
             )
+            # Inserted rows shift everything below them, which cached ranges cannot follow
+            range_cache.invalidate(sheet_id)
             return result
         except Exception as e:
             raise e
@@ -99,22 +145,84 @@ class Sheet(Auth):
                     spreadsheetId=sheet_id,
                     range=range_name,
                     valueInputOption=value_input_option,
+                    includeValuesInResponse=True,
                     body=body,
                 )
                 .execute()
             )
+            # The echoed cells are only for patching the cache, not for callers
+            updated = result.pop("updatedData", {})
+            range_cache.apply_write(sheet_id, updated.get("range"), updated.get("values"))
             return result
         except Exception as e:
             raise e
 
 
-    def get_values(self, sheet_id, range_name):
+    def get_revision(self, sheet_id):
+        """
+        Drive version of the spreadsheet, which increases on every change.
+        Returns None when it cannot be read (e.g. no Drive scope).
+        """
+        try:
+            if self.drive is None:
+                self.drive = build_service("drive", "v3", http=self.authorized_http()).files()
+            return self.drive.get(fileId=sheet_id, fields="version").execute().get("version")
+        except Exception as e:
+            logger.info(f"Could not read revision of {sheet_id}: {e}")
+            return None
+
+
+    def fetch_entry(self, sheet_id, range_name, options=None):
+        """
+        Read a range through the shared range cache and return its cache entry.
+        `options` are values.get parameters as built by `read_options`.
+        """
+        options = options or {}
+        cache_options = tuple(sorted(options.items()))
+        entry = range_cache.lookup(self.uid, sheet_id, range_name, cache_options)
+        if range_cache.fresh(entry):
+            return entry
+
+        version = None
+        if VALIDATE_REVISIONS and range_cache.enabled:
+            version = self.get_revision(sheet_id)
+            if entry is not None and version is not None and entry.version == version:
+                range_cache.renew(self.uid, sheet_id, range_name, cache_options)
+                return entry
+
         result = (
             self.sheet.values()
-            .get(spreadsheetId=sheet_id, range=range_name)
+            .get(spreadsheetId=sheet_id, range=range_name, **options)
             .execute()
         )
-        return result
+        return range_cache.put(self.uid, sheet_id, range_name, result, version, cache_options)
+
+
+    def fetch_range(self, sheet_id, range_name, options=None):
+        """
+        Read a range through the shared range cache. The result is shared with
+        other callers and must not be mutated.
+        """
+        return self.fetch_entry(sheet_id, range_name, options).result
+
+
+    def get_values(self, sheet_id, range_name, **options):
+        """
+        Read a range. Accepts major_dimension, value_render_option,
+        date_time_render_option and a `fields` mask.
+        """
+        return self.fetch_range(sheet_id, range_name, read_options(**options))
+
+
+    def get_snapshot(self, sheet_id, range_name, header_row=0):
+        """
+        Load a range as a column-oriented SheetSnapshot, using the row at
+        `header_row` (relative to the range) as column names.
+        """
+        result = self.fetch_range(sheet_id, range_name)
+        grid = parse_range(result.get("range") or range_name)
+        first_row = grid.first_row if grid is not None else 1
+        return SheetSnapshot.from_values(result.get("values", []), header_row, first_row)
 
 
     def batch_update(self, sheet_id, title, find, replacement):
@@ -140,28 +248,150 @@ class Sheet(Auth):
         response = self.sheet.batchUpdate(
             spreadsheetId=sheet_id, body=body
         ).execute()
+        range_cache.invalidate(sheet_id)
         return response
 
 
     def batch_update_values(self, sheet_id, range_name, value_input_option, _values):
         values = _values
         data = [{"range": range_name, "values": values}]
-        body = {"valueInputOption": value_input_option, "data": data}
+        return self.batch_write_values(sheet_id, data, value_input_option)
+
+
+    def batch_write_values(self, sheet_id, data, value_input_option):
+        """
+        Write several ranges in one values.batchUpdate call. `data` is a list of
+        {"range": ..., "values": ...}; the result has one entry in `responses`
+        per range, in the same order.
+        """
+        body = {"valueInputOption": value_input_option, "data": data, "includeValuesInResponse": True}
         result = (
             self.sheet.values()
             .batchUpdate(spreadsheetId=sheet_id, body=body)
             .execute()
         )
+        self.apply_batch_write(sheet_id, result)
         return result
 
 
-    def batch_get_values(self, sheet_id, range_names):
-        result = (
-            self.sheet.values()
-            .batchGet(spreadsheetId=sheet_id, ranges=range_names)
-            .execute()
-        )
-        return result
+    def apply_batch_write(self, sheet_id, result):
+        """
+        Patch the ranges written by a values.batchUpdate into the range cache,
+        removing the echoed cells from `result` so callers get the usual response.
+        """
+        responses = result.get("responses", [])
+        if not responses:
+            range_cache.invalidate(sheet_id)
+        for response in responses:
+            updated = response.pop("updatedData", {})
+            range_cache.apply_write(sheet_id, updated.get("range"), updated.get("values"))
+
+
+    def batch_get_values(self, sheet_id, range_names, **options):
+        """
+        Read several ranges, fetching only the ones missing from the range cache.
+        Takes the same options as get_values; reads with a `fields` mask (which
+        applies to the whole batch response) are not cached.
+        """
+        options = read_options(**options)
+        if "fields" in options:
+            return self.sheet.values().batchGet(spreadsheetId=sheet_id, ranges=list(range_names), **options).execute()
+
+        cache_options = tuple(sorted(options.items()))
+        value_ranges = {}
+        missing = []
+        for range_name in range_names:
+            cached = range_cache.get(self.uid, sheet_id, range_name, cache_options)
+            if cached is not None:
+                value_ranges[range_name] = cached
+            elif range_name not in missing:
+                missing.append(range_name)
+
+        if missing:
+            result = (
+                self.sheet.values()
+                .batchGet(spreadsheetId=sheet_id, ranges=missing, **options)
+                .execute()
+            )
+            for range_name, value_range in zip(missing, result.get("valueRanges", [])):
+                value_ranges[range_name] = value_range
+                range_cache.put(self.uid, sheet_id, range_name, value_range, options=cache_options)
+
+        return {
+            "spreadsheetId": sheet_id,
+            "valueRanges": [value_ranges[name] for name in range_names if name in value_ranges],
+        }
+
+
+    def get_metadata(self, sheet_id, refresh=False):
+        """Tabs, gids and grid sizes of a spreadsheet, from the metadata cache when possible."""
+        metadata = None if refresh else metadata_cache.get(self.uid, sheet_id)
+        if metadata is None:
+            response = self.sheet.get(spreadsheetId=sheet_id, fields=METADATA_FIELDS).execute()
+            metadata = SpreadsheetMetadata.from_response(response)
+            metadata_cache.put(self.uid, sheet_id, metadata)
+        return metadata
+
+
+    def get_row_count(self, sheet_id, sheet_name=None):
+        """Number of rows in the grid of a tab (the first tab by default)."""
+        # Rows may have been added by anyone since it was cached
+        tab = self.get_metadata(sheet_id, refresh=True).tab(sheet_name)
+        if tab is None:
+            raise ValueError(f"Sheet {sheet_name} not found in the spreadsheet.")
+        return tab.row_count
+
+
+    def iter_rows(self, sheet_id, range_name, window=None, windows_per_request=1,
+                  value_render_option=None, date_time_render_option=None):
+        """
+        Yield the rows of a range one by one, reading it in windows of `window`
+        rows so memory stays bounded whatever the size of the sheet. Up to
+        `windows_per_request` windows are read per values.batchGet call.
+
+        Bypasses the range cache. Blank rows between data rows are kept as [].
+        Raises ValueError unless `window` and `windows_per_request` are positive ints.
+        """
+        window = EXPORT_WINDOW if window is None else window
+        for name, value in (("window", window), ("windows_per_request", windows_per_request)):
+            if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+                raise ValueError(f"{name} must be a positive integer")
+        options = read_options(value_render_option=value_render_option, date_time_render_option=date_time_render_option)
+        grid = parse_range(range_name)
+        if grid is None:
+            # Named ranges cannot be windowed
+            result = self.sheet.values().get(spreadsheetId=sheet_id, range=range_name, fields="values", **options).execute()
+            yield from result.get("values", [])
+            return
+
+        last_row = self.get_row_count(sheet_id, grid.tab)
+        if grid.last_row is not None:
+            last_row = min(last_row, grid.last_row)
+
+        blank_rows = 0
+        first_row = grid.first_row
+        while first_row <= last_row:
+            ranges = []
+            while first_row <= last_row and len(ranges) < windows_per_request:
+                end_row = min(first_row + window - 1, last_row)
+                if grid.last_col is None and not grid.first_col:
+                    ranges.append(format_range(grid.tab, first_row, end_row))
+                else:
+                    ranges.append(format_range(grid.tab, first_row, end_row, grid.first_col, grid.last_col))
+                first_row = end_row + 1
+
+            result = self.sheet.values().batchGet(
+                spreadsheetId=sheet_id, ranges=ranges, fields="valueRanges(values)", **options
+            ).execute()
+            for requested, value_range in zip(ranges, result.get("valueRanges", [])):
+                requested_grid = parse_range(requested)
+                values = value_range.get("values", [])
+                if values:
+                    yield from ([] for _ in range(blank_rows))
+                    blank_rows = 0
+                    yield from values
+                # The API leaves out trailing blank rows; emit them only if data follows
+                blank_rows += requested_grid.last_row - requested_grid.first_row + 1 - len(values)
 
 
     def conditional_formatting(self, sheet_id, format=[]):
@@ -169,6 +399,9 @@ class Sheet(Auth):
         response = self.sheet.batchUpdate(
             spreadsheetId=sheet_id, body=body
         ).execute()
+        if is_structural(format):
+            metadata_cache.invalidate(sheet_id)
+            range_cache.invalidate(sheet_id)
         return response
 
 
@@ -243,86 +476,133 @@ class Sheet(Auth):
         return updatefilterviewresponse
     
     
-    def find_row(self, sheet_id, search_keyword, range_name = None):
+    def find_row(self, sheet_id, search_keyword, range_name = None, mode = "substring", **options):
         """
         Searches for a keyword (or substring) in any column of the sheet and returns the row number.
         
         Args:
             sheet_id (str): The ID of the Google Sheet.
             search_keyword (str): The keyword or substring to search for.
+            mode (str): "substring" (default), "prefix" or "exact" cell match.
+            options: Read options as for get_values, e.g. value_render_option.
 
         Returns:
             int or None: The row number where the keyword is found, or None if not found.
         """
         try:
-            result = self.sheet.values().get(
-                spreadsheetId=sheet_id,
-                range=range_name if range_name else "A:Z"  
-            ).execute()
-
-            values = result.get("values", [])
-
-            matching_rows = []
-            for i, row in enumerate(values, start=1):
-                for cell in row:
-                    if search_keyword.lower() in str(cell).lower():
-                        matching_rows.append(i)
-                        break  # Move to the next row once a match is found
-
+            entry = self.fetch_entry(sheet_id, range_name if range_name else "A:Z", read_options(**options))
+            matching_rows = sorted({row for row, _ in range_cache.find(entry, search_keyword, mode)})
             return matching_rows if matching_rows else None
         except Exception as e:
             print(f"Error finding row: {e}")
             return None
 
 
-    def find_columns(self, sheet_id, search_keyword):
+    def find_columns(self, sheet_id, search_keyword, mode = "substring", **options):
         """
         Searches for a keyword in any row of the sheet and returns the column indexes where it appears.
         
         Args:
             sheet_id (str): The ID of the Google Sheet.
             search_keyword (str): The keyword or substring to search for.
+            mode (str): "substring" (default), "prefix" or "exact" cell match.
+            options: Read options as for get_values, e.g. value_render_option.
 
         Returns:
             List[str]: Column letters (A, B, C, etc.) where the keyword is found.
         """
         try:
-            result = self.sheet.values().get(
-                spreadsheetId=sheet_id,
-                range="A:Z"  # Fetch all columns
-            ).execute()
-
-            values = result.get("values", [])
+            entry = self.fetch_entry(sheet_id, "A:Z", read_options(**options))  # Fetch all columns
+            column_indexes = sorted({col for _, col in range_cache.find(entry, search_keyword, mode)})
+            return [column_letter(index) for index in column_indexes] if column_indexes else None
+        except Exception as e:
+            return None
 
-            column_indexes = set()
-            for row in values:
-                for col_index, cell in enumerate(row):
-                    if search_keyword.lower() in str(cell).lower():
-                        column_letter = chr(65 + col_index)  # Convert index to A, B, C...
-                        column_indexes.add(column_letter)
 
-            return list(column_indexes) if column_indexes else None
-        except Exception as e:
+    def tag_rows(self, sheet_id, row_numbers, key, value, sheet_name=None):
+        """
+        Attach developer metadata `key`=`value` to whole rows. The tag moves with
+        the row when rows above it are inserted or deleted.
+        """
+        sheet_gid = self.get_sheet_gid(sheet_id, sheet_name)
+        if sheet_gid is None or not row_numbers:
             return None
 
+        requests = []
+        for row_number in sorted(set(row_numbers)):
+            requests.append({
+                "createDeveloperMetadata": {
+                    "developerMetadata": {
+                        "metadataKey": key,
+                        "metadataValue": str(value),
+                        "visibility": "DOCUMENT",
+                        "location": {
+                            "dimensionRange": {
+                                "sheetId": sheet_gid,
+                                "dimension": "ROWS",
+                                "startIndex": row_number - 1,
+                                "endIndex": row_number
+                            }
+                        }
+                    }
+                }
+            })
+        # Metadata only, cached values stay valid
+        return self.sheet.batchUpdate(spreadsheetId=sheet_id, body={"requests": requests}).execute()
+
+
+    def find_tagged_rows(self, sheet_id, key, value, sheet_name=None):
+        """
+        Locate rows tagged with `key`=`value` using values.batchGetByDataFilter,
+        so only the matching rows are transferred.
+
+        Returns:
+            List[Tuple[int, list]]: (row number, row values) pairs in sheet order.
+        """
+        body = {
+            "dataFilters": [{
+                "developerMetadataLookup": {
+                    "metadataKey": key,
+                    "metadataValue": str(value),
+                    "locationType": "ROW"
+                }
+            }],
+            "majorDimension": "ROWS",
+        }
+        result = self.sheet.values().batchGetByDataFilter(
+            spreadsheetId=sheet_id, body=body, fields="valueRanges(valueRange(range,values))"
+        ).execute()
+
+        rows = {}
+        for matched in result.get("valueRanges", []):
+            value_range = matched.get("valueRange", {})
+            range_name = value_range.get("range", "")
+            grid = parse_range(range_name)
+            if grid is None or (sheet_name and split_tab(range_name)[0] != sheet_name):
+                continue
+            values = value_range.get("values", [])
+            last_row = grid.last_row if grid.last_row is not None else grid.first_row + len(values) - 1
+            for row_number in range(grid.first_row, last_row + 1):
+                offset = row_number - grid.first_row
+                rows[row_number] = values[offset] if offset < len(values) else []
+        return sorted(rows.items())
+
 
     def get_sheet_gid(self, sheet_id, sheet_name=None):
         """
         Retrieves the GID (grid ID) of the first sheet in the spreadsheet.
         """
         try:
-            sheet_metadata = self.sheet.get(spreadsheetId=sheet_id).execute()
-            sheets = sheet_metadata.get("sheets", [])
+            metadata = self.get_metadata(sheet_id)
+            if sheet_name and metadata.tab(sheet_name) is None:
+                # The tab may have been added or renamed since the metadata was cached
+                metadata = self.get_metadata(sheet_id, refresh=True)
 
-            if not sheets:
+            if not metadata.tabs:
                 raise ValueError("No sheets found in the spreadsheet.")
 
-            if sheet_name:
-                for sheet in sheets:
-                    if sheet["properties"]["title"] == sheet_name:
-                        return sheet["properties"]["sheetId"]   
-                    
-            return sheets[0]["properties"]["sheetId"] 
+            tab = metadata.tab(sheet_name) if sheet_name else None
+            return (tab or metadata.tab()).gid
         except Exception as e:
             print(f"Error getting sheet GID: {e}")
             return None
@@ -360,10 +640,14 @@ class Sheet(Auth):
                 spreadsheetId=sheet_id,
                 body=request_body
             ).execute()
+            range_cache.invalidate(sheet_id)
+            metadata_cache.resize(sheet_id, sheet_gid, -len(row_numbers))
 
             return response
         except Exception as e:
             print(f"Error deleting rows: {e}")
+            # The cached gid may belong to a tab that no longer exists
+            metadata_cache.invalidate(sheet_id)
             return None
 
 
@@ -379,10 +663,7 @@ class Sheet(Auth):
             List[str]: The header row values or None if not found.
         """
         try:
-            result = self.sheet.values().get(
-                spreadsheetId=sheet_id,
-                range=range_name
-            ).execute()
+            result = self.fetch_range(sheet_id, range_name)
             return result.get("values", [])[0] if result.get("values") else None
         except Exception as e:
             print(f"Error retrieving header: {e}")
@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import OrderedDict
+from google_apis.util.A1 import parse_range
+from google_apis.util.SheetIndex import KeywordIndex, scan
+from utils.constants import get_env_variable
+
+
+class CacheEntry:
+    __slots__ = ("result", "expires_at", "version", "grid", "index", "queries")
+
+    def __init__(self, result, expires_at, version=None, grid=None, index=None):
+        self.result = result
+        self.expires_at = expires_at
+        self.version = version
+        self.grid = grid
+        self.index = index
+        self.queries = 0
+
+
+class RangeCache:
+    """
+    Short-lived cache of Sheets API value ranges, keyed by (uid, sheet_id, range,
+    read options) so a cached read is only ever served to the user who made it,
+    rendered the way it was asked for.
+
+    Our own writes are patched into cached ranges (and their keyword indexes)
+    when the written range can be located and the range was read with default
+    options; anything else is invalidated.
+    Cached results are shared between callers and must not be mutated.
+
+    Keyword indexes cost far more to build than one scan, so a range is only
+    indexed once it is searched a second time, and the cells indexed across
+    all entries are capped at `max_indexed_cells`, least recently used first.
+    """
+
+    def __init__(self, ttl: float = None, max_entries: int = None, max_indexed_cells: int = None):
+        if ttl is None:
+            ttl = float(get_env_variable("GOOGLE_SHEET_CACHE_TTL") or 30)
+        if max_entries is None:
+            max_entries = int(get_env_variable("GOOGLE_SHEET_CACHE_SIZE") or 1000)
+        if max_indexed_cells is None:
+            max_indexed_cells = int(get_env_variable("GOOGLE_SHEET_INDEX_CELLS") or 100000)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_indexed_cells = max_indexed_cells
+        self._entries = OrderedDict()
+        self._by_sheet = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def lookup(self, uid: str, sheet_id: str, range_name: str, options: tuple = ()) -> CacheEntry | None:
+        """Return the entry for a range even when expired, or None."""
+        key = (uid, sheet_id, range_name, options)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def fresh(self, entry: CacheEntry | None) -> bool:
+        return entry is not None and entry.expires_at >= time.monotonic()
+
+    def get(self, uid: str, sheet_id: str, range_name: str, options: tuple = ()):
+        """Return the cached result for a range if it is still fresh."""
+        entry = self.lookup(uid, sheet_id, range_name, options)
+        return entry.result if self.fresh(entry) else None
+
+    def put(self, uid: str, sheet_id: str, range_name: str, result, version: str = None, options: tuple = ()) -> CacheEntry:
+        entry = CacheEntry(result, time.monotonic() + self.ttl, version, parse_range(range_name))
+        if not self.enabled:
+            return entry
+        key = (uid, sheet_id, range_name, options)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._by_sheet.setdefault(sheet_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._forget(self._entries.popitem(last=False)[0])
+        return entry
+
+    def renew(self, uid: str, sheet_id: str, range_name: str, options: tuple = ()) -> None:
+        """Extend a validated entry for another TTL."""
+        with self._lock:
+            entry = self._entries.get((uid, sheet_id, range_name, options))
+            if entry is not None:
+                entry.expires_at = time.monotonic() + self.ttl
+
+    def find(self, entry: CacheEntry, query: str, mode: str = "substring") -> set:
+        """Positions of the cells of a cached range matching `query`, see KeywordIndex."""
+        with self._lock:
+            entry.queries += 1
+            repeated = entry.queries > 1
+        index = self.keyword_index(entry) if repeated else entry.index
+        if index is not None:
+            return index.find(query, mode)
+        return scan(entry.result.get("values", []), query, mode)
+
+    def keyword_index(self, entry: CacheEntry) -> KeywordIndex | None:
+        """
+        The keyword index of a cached range, built on first use, or None when
+        the range alone has more cells than `max_indexed_cells`.
+        """
+        while entry.index is None:
+            result = entry.result
+            values = result.get("values", [])
+            if sum(len(row) for row in values) > self.max_indexed_cells:
+                return None
+            index = KeywordIndex(values)
+            with self._lock:
+                # A write patched the entry while we were building; build again
+                if entry.index is None and entry.result is result:
+                    self._make_room(len(index), entry)
+                    entry.index = index
+        return entry.index
+
+    def _make_room(self, cells: int, keep: CacheEntry) -> None:
+        """Drop the least recently used indexes until `cells` more fit."""
+        indexed = [entry for entry in self._entries.values() if entry.index is not None and entry is not keep]
+        total = sum(len(entry.index) for entry in indexed)
+        for entry in indexed:
+            if total + cells <= self.max_indexed_cells:
+                break
+            total -= len(entry.index)
+            entry.index = None
+
+    def invalidate(self, sheet_id: str) -> None:
+        """Drop every cached range of a spreadsheet, for all users."""
+        with self._lock:
+            for key in self._by_sheet.pop(sheet_id, ()):
+                self._entries.pop(key, None)
+
+    def apply_write(self, sheet_id: str, updated_range: str, values: list) -> None:
+        """
+        Patch a completed write into the cached ranges of a spreadsheet.
+        `values` are the cells as the API rendered them (`updatedData`).
+        Entries the write cannot be mapped onto are dropped.
+        """
+        written = parse_range(updated_range) if updated_range else None
+        with self._lock:
+            for key in list(self._by_sheet.get(sheet_id, ())):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                # Writes come back formatted, so only default reads can be patched
+                if written is None or key[3] or not self._patch(entry, written, values or []):
+                    self._entries.pop(key, None)
+                    self._forget(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_sheet.clear()
+
+    def _patch(self, entry: CacheEntry, written, values: list) -> bool:
+        grid = entry.grid
+        if grid is None or grid.tab is None or written.tab != grid.tab:
+            return False
+        if written.last_row is None or written.last_col is None:
+            return False
+        if entry.result.get("majorDimension", "ROWS") != "ROWS":
+            return False
+
+        first_row = max(written.first_row, grid.first_row)
+        last_row = written.last_row if grid.last_row is None else min(written.last_row, grid.last_row)
+        first_col = max(written.first_col, grid.first_col)
+        last_col = written.last_col if grid.last_col is None else min(written.last_col, grid.last_col)
+        if first_row > last_row or first_col > last_col:
+            # Nothing of this range was touched
+            return True
+
+        rows = list(entry.result.get("values", []))
+        for sheet_row in range(first_row, last_row + 1):
+            source = values[sheet_row - written.first_row] if sheet_row - written.first_row < len(values) else []
+            position = sheet_row - grid.first_row
+            while len(rows) <= position:
+                rows.append([])
+            row = list(rows[position])
+            for sheet_col in range(first_col, last_col + 1):
+                offset = sheet_col - written.first_col
+                cell = source[offset] if offset < len(source) else ""
+                col = sheet_col - grid.first_col
+                while len(row) <= col:
+                    row.append("")
+                row[col] = cell
+                if entry.index is not None:
+                    entry.index.set_cell(position + 1, col, cell)
+            while row and row[-1] == "":
+                row.pop()
+            rows[position] = row
+
+        while rows and not rows[-1]:
+            rows.pop()
+        entry.result = {**entry.result, "values": rows}
+        return True
+
+    def _forget(self, key) -> None:
+        keys = self._by_sheet.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_sheet[key[1]]
+
+
+range_cache = RangeCache()
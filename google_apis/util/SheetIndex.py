@@ -0,0 +1,150 @@
+import bisect
+import threading
+
+
+MODES = ("substring", "prefix", "exact")
+
+
+def scan(values, query: str, mode: str = "substring") -> set:
+    """
+    Positions of the cells of `values` matching `query`, found by a linear
+    scan; the same positions a KeywordIndex over `values` would return.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+    query = str(query).lower()
+    positions = set()
+    for row, cells in enumerate(values or [], start=1):
+        for col, cell in enumerate(cells):
+            key = str(cell).lower()
+            if not key:
+                continue
+            if mode == "exact":
+                found = key == query
+            elif mode == "prefix":
+                found = key.startswith(query)
+            else:
+                found = query in key
+            if found:
+                positions.add((row, col))
+    return positions
+
+
+class KeywordIndex:
+    """
+    Inverted index over the cells of one fetched range: lowercased cell text
+    maps to its (row, column) positions, and 3-grams of that text map to the
+    distinct texts containing them. Rows are 1-based and columns 0-based,
+    both relative to the start of the range.
+
+    Supports exact, prefix and substring queries and can be patched cell by
+    cell when we write to the sheet.
+    """
+
+    NGRAM = 3
+
+    def __init__(self, values=None):
+        self._cells = {}
+        self._row_cols = {}
+        self._postings = {}
+        self._grams = {}
+        self._sorted_keys = None
+        self._lock = threading.RLock()
+        for row, cells in enumerate(values or [], start=1):
+            for col, cell in enumerate(cells):
+                self._add(row, col, cell)
+
+    def __len__(self):
+        return len(self._cells)
+
+    def _grams_of(self, key: str):
+        return {key[i:i + self.NGRAM] for i in range(len(key) - self.NGRAM + 1)}
+
+    def _add(self, row: int, col: int, cell) -> None:
+        key = str(cell).lower()
+        if not key:
+            return
+        self._cells[(row, col)] = key
+        self._row_cols.setdefault(row, set()).add(col)
+        positions = self._postings.get(key)
+        if positions is None:
+            positions = self._postings[key] = set()
+            for gram in self._grams_of(key):
+                self._grams.setdefault(gram, set()).add(key)
+            self._sorted_keys = None
+        positions.add((row, col))
+
+    def _remove(self, row: int, col: int) -> None:
+        key = self._cells.pop((row, col), None)
+        if key is None:
+            return
+        cols = self._row_cols[row]
+        cols.discard(col)
+        if not cols:
+            del self._row_cols[row]
+        positions = self._postings[key]
+        positions.discard((row, col))
+        if not positions:
+            del self._postings[key]
+            for gram in self._grams_of(key):
+                keys = self._grams.get(gram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._grams[gram]
+            self._sorted_keys = None
+
+    def set_cell(self, row: int, col: int, cell) -> None:
+        with self._lock:
+            self._remove(row, col)
+            self._add(row, col, cell)
+
+    def clear_row(self, row: int, first_col: int = 0, last_col: int = None) -> None:
+        with self._lock:
+            for col in list(self._row_cols.get(row, ())):
+                if col >= first_col and (last_col is None or col <= last_col):
+                    self._remove(row, col)
+
+    def _matching_keys(self, query: str, mode: str):
+        if mode == "exact":
+            return [query] if query in self._postings else []
+
+        if mode == "prefix":
+            if self._sorted_keys is None:
+                self._sorted_keys = sorted(self._postings)
+            keys = self._sorted_keys
+            start = bisect.bisect_left(keys, query)
+            end = start
+            while end < len(keys) and keys[end].startswith(query):
+                end += 1
+            return keys[start:end]
+
+        if mode != "substring":
+            raise ValueError(f"Unknown search mode: {mode}")
+        if len(query) < self.NGRAM:
+            return [key for key in self._postings if query in key]
+
+        candidates = None
+        for gram in sorted(self._grams_of(query), key=lambda g: len(self._grams.get(g, ()))):
+            keys = self._grams.get(gram)
+            if not keys:
+                return []
+            candidates = set(keys) if candidates is None else candidates & keys
+            if not candidates:
+                return []
+        return [key for key in candidates if query in key]
+
+    def find(self, query: str, mode: str = "substring") -> set:
+        """Positions of cells whose text matches `query` (case-insensitive)."""
+        query = str(query).lower()
+        with self._lock:
+            positions = set()
+            for key in self._matching_keys(query, mode):
+                positions.update(self._postings[key])
+            return positions
+
+    def rows(self, query: str, mode: str = "substring") -> list:
+        return sorted({row for row, _ in self.find(query, mode)})
+
+    def columns(self, query: str, mode: str = "substring") -> list:
+        return sorted({col for _, col in self.find(query, mode)})
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from utils.constants import get_env_variable
+
+
+# Only what tab resolution needs, instead of every sheet property
+METADATA_FIELDS = "sheets(properties(sheetId,title,index,gridProperties(rowCount,columnCount,frozenRowCount)))"
+
+# batchUpdate requests that add, remove or rename tabs or resize grids
+STRUCTURAL_REQUESTS = frozenset({
+    "addSheet", "deleteSheet", "duplicateSheet", "updateSheetProperties", "copyPaste",
+    "insertDimension", "deleteDimension", "appendDimension", "updateDimensionProperties",
+    "insertRange", "deleteRange", "moveDimension",
+})
+
+Tab = namedtuple("Tab", ["gid", "title", "index", "row_count", "column_count", "header_rows"])
+
+
+class SpreadsheetMetadata:
+    """Tabs of a spreadsheet in display order. `header_rows` is the tab's frozen row count."""
+
+    def __init__(self, tabs):
+        self.tabs = sorted(tabs, key=lambda tab: tab.index)
+        self._by_title = {tab.title: tab for tab in self.tabs}
+
+    @classmethod
+    def from_response(cls, response):
+        tabs = []
+        for sheet in response.get("sheets", []):
+            properties = sheet.get("properties", {})
+            grid = properties.get("gridProperties", {})
+            tabs.append(Tab(
+                gid=properties.get("sheetId"),
+                title=properties.get("title"),
+                index=properties.get("index", 0),
+                row_count=grid.get("rowCount", 0),
+                column_count=grid.get("columnCount", 0),
+                header_rows=grid.get("frozenRowCount", 0),
+            ))
+        return cls(tabs)
+
+    def tab(self, title: str = None) -> Tab | None:
+        """The tab with this title, or the first tab when no title is given."""
+        if title is None:
+            return self.tabs[0] if self.tabs else None
+        return self._by_title.get(title)
+
+    def resized(self, gid, rows: int):
+        """A copy with `rows` added to (or removed from) the row count of a tab."""
+        return SpreadsheetMetadata([
+            tab._replace(row_count=max(tab.row_count + rows, 0)) if tab.gid == gid else tab
+            for tab in self.tabs
+        ])
+
+
+class MetadataCache:
+    """
+    Spreadsheet metadata keyed by (uid, sheet_id), so tab names can be mapped
+    to gids without a spreadsheets.get per call. Entries expire after a TTL
+    since tabs can be changed by other editors; our own structural
+    batchUpdates invalidate them.
+    """
+
+    def __init__(self, ttl: float = None, max_entries: int = None):
+        if ttl is None:
+            ttl = float(get_env_variable("GOOGLE_SHEET_METADATA_TTL") or 300)
+        if max_entries is None:
+            max_entries = int(get_env_variable("GOOGLE_SHEET_METADATA_CACHE_SIZE") or 1000)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, uid: str, sheet_id: str) -> SpreadsheetMetadata | None:
+        with self._lock:
+            entry = self._entries.get((uid, sheet_id))
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._entries[(uid, sheet_id)]
+                return None
+            self._entries.move_to_end((uid, sheet_id))
+            return entry[0]
+
+    def put(self, uid: str, sheet_id: str, metadata: SpreadsheetMetadata) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[(uid, sheet_id)] = (metadata, time.monotonic() + self.ttl)
+            self._entries.move_to_end((uid, sheet_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def resize(self, sheet_id: str, gid, rows: int) -> None:
+        """Apply a known change in row count of a tab, for all users."""
+        with self._lock:
+            for key, (metadata, expires_at) in list(self._entries.items()):
+                if key[1] == sheet_id:
+                    self._entries[key] = (metadata.resized(gid, rows), expires_at)
+
+    def invalidate(self, sheet_id: str) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == sheet_id]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def is_structural(requests) -> bool:
+    return any(name in STRUCTURAL_REQUESTS for request in requests for name in request)
+
+
+metadata_cache = MetadataCache()
@@ -0,0 +1,231 @@
+import numpy as np
+from google_apis.util.A1 import column_letter
+
+
+FILTER_OPERATORS = ("eq", "ne", "gt", "gte", "lt", "lte", "contains", "startswith", "in", "is_null", "not_null")
+AGGREGATIONS = ("count", "sum", "mean", "min", "max")
+
+
+def _to_number(value):
+    try:
+        return float(str(value).replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+def _unique_header(names, width):
+    """
+    Column names for `width` columns: blank names become the column letter and
+    repeats get a suffix ("Amount", "Amount_2", ...) so every name is a key.
+    """
+    names = [str(name).strip() or column_letter(index) for index, name in enumerate(names)]
+    names += [column_letter(index) for index in range(len(names), width)]
+    header, seen = [], set()
+    for name in names:
+        unique, suffix = name, 1
+        while unique in seen:
+            suffix += 1
+            unique = f"{name}_{suffix}"
+        header.append(unique)
+        seen.add(unique)
+    return header
+
+
+# Elementwise Python string ops over object arrays; np.char would copy each
+# column into a fixed-width unicode array as wide as its longest cell
+_text = np.frompyfunc(str, 1, 1)
+_lowercase = np.frompyfunc(lambda cell: str(cell).lower(), 1, 1)
+_contains = np.frompyfunc(lambda cell, keyword: keyword in cell, 2, 1)
+_startswith = np.frompyfunc(lambda cell, prefix: cell.startswith(prefix), 2, 1)
+_within = np.frompyfunc(lambda cell, options: cell in options, 2, 1)
+
+
+def _bools(result):
+    return np.asarray(result, dtype=bool)
+
+
+class SheetSnapshot:
+    """
+    Column-oriented snapshot of a sheet range, built from its header row.
+
+    Every column keeps its cells as an object array (what the sheet shows) and
+    a null mask; columns whose non-empty cells all parse as numbers also get a
+    float64 array (NaN for nulls). Filters, search, sort and group-by work on
+    whole columns at once and return new snapshots that share nothing mutable.
+    """
+
+    def __init__(self, header, cells, nulls, numbers, row_numbers):
+        self.header = header
+        self.cells = cells
+        self.nulls = nulls
+        self.numbers = numbers
+        self.row_numbers = row_numbers
+        self._lowered = {}
+
+    @classmethod
+    def from_values(cls, values, header_row: int = 0, first_row: int = 1):
+        """
+        Build a snapshot from `values` as returned by the Sheets API, using
+        `values[header_row]` as column names. `first_row` is the sheet row of
+        `values[0]`, so every data row keeps its sheet row number. Blank and
+        repeated names are made unique, see `_unique_header`.
+        """
+        values = values or []
+        names = values[header_row] if len(values) > header_row else []
+        rows = values[header_row + 1:]
+        header = _unique_header(names, max([len(names)] + [len(row) for row in rows]))
+
+        cells, nulls, numbers = {}, {}, {}
+        for index, name in enumerate(header):
+            column = np.empty(len(rows), dtype=object)
+            column[:] = [row[index] if index < len(row) else "" for row in rows]
+            null = column == ""
+            cells[name] = column
+            nulls[name] = null
+
+            parsed = [_to_number(cell) for cell in column[~null]]
+            if parsed and all(number is not None for number in parsed):
+                numeric = np.full(len(rows), np.nan)
+                numeric[~null] = parsed
+                numbers[name] = numeric
+
+        row_numbers = np.arange(len(rows)) + first_row + header_row + 1
+        return cls(header, cells, nulls, numbers, row_numbers)
+
+    def __len__(self):
+        return len(self.row_numbers)
+
+    def _column(self, name):
+        if name not in self.cells:
+            raise ValueError(f"Unknown column: {name}")
+        return self.cells[name]
+
+    def _lower(self, name):
+        lowered = self._lowered.get(name)
+        if lowered is None:
+            lowered = _lowercase(self._column(name))
+            self._lowered[name] = lowered
+        return lowered
+
+    def _take(self, selector):
+        return SheetSnapshot(
+            self.header,
+            {name: column[selector] for name, column in self.cells.items()},
+            {name: null[selector] for name, null in self.nulls.items()},
+            {name: numeric[selector] for name, numeric in self.numbers.items()},
+            self.row_numbers[selector],
+        )
+
+    def mask(self, column, operator, value=None):
+        """Boolean row mask for a single condition."""
+        cells = self._column(column)
+        null = self.nulls[column]
+        if operator == "is_null":
+            return null.copy()
+        if operator == "not_null":
+            return ~null
+        if operator == "contains":
+            return _bools(_contains(self._lower(column), str(value).lower()))
+        if operator == "startswith":
+            return _bools(_startswith(self._lower(column), str(value).lower()))
+        if operator == "in":
+            options = frozenset(str(option) for option in (value or []))
+            return _bools(_within(_text(cells), options))
+
+        number = _to_number(value)
+        if column in self.numbers and number is not None:
+            left, right = self.numbers[column], number
+        else:
+            left, right = _text(cells), str(value)
+
+        with np.errstate(invalid="ignore"):
+            if operator == "eq":
+                return _bools(left == right)
+            if operator == "ne":
+                return _bools(left != right) & ~null
+            if operator == "gt":
+                return _bools(left > right)
+            if operator == "gte":
+                return _bools(left >= right)
+            if operator == "lt":
+                return _bools(left < right)
+            if operator == "lte":
+                return _bools(left <= right)
+        raise ValueError(f"Unknown filter operator: {operator}")
+
+    def filter(self, column, operator, value=None):
+        return self._take(self.mask(column, operator, value))
+
+    def search(self, keyword, columns=None):
+        """Rows where any of `columns` (default all) contains `keyword`, case-insensitively."""
+        keyword = str(keyword).lower()
+        found = np.zeros(len(self), dtype=bool)
+        for name in columns or self.header:
+            found |= _bools(_contains(self._lower(name), keyword))
+        return self._take(found)
+
+    def sort(self, column, descending: bool = False):
+        """Stable sort on one column; empty cells always go last."""
+        if column in self.numbers:
+            keys = self.numbers[column]
+            keys = -keys if descending else keys
+            order = np.argsort(keys, kind="stable")
+        else:
+            # Rank the distinct values so a descending sort can negate ranks
+            # and stay stable, as reversing an ascending order would not be
+            _, ranks = np.unique(self._lower(column), return_inverse=True)
+            order = np.argsort(-ranks if descending else ranks, kind="stable")
+            null = self.nulls[column][order]
+            order = np.concatenate([order[~null], order[null]])
+        return self._take(order)
+
+    def group_by(self, column, aggregations=None):
+        """
+        Group rows by the text of `column` and aggregate other columns, e.g.
+        {"amount": "sum", "price": "mean"}. Each group reports its row count.
+        """
+        keys, inverse = np.unique(_text(self._column(column)), return_inverse=True)
+        groups = len(keys)
+        results = {"count": np.bincount(inverse, minlength=groups)}
+
+        for name, aggregation in (aggregations or {}).items():
+            if aggregation not in AGGREGATIONS:
+                raise ValueError(f"Unknown aggregation: {aggregation}")
+            self._column(name)
+            if aggregation == "count":
+                present = ~self.nulls[name]
+                results[f"{name}_count"] = np.bincount(inverse, weights=present, minlength=groups).astype(int)
+                continue
+            if name not in self.numbers:
+                raise ValueError(f"Column {name} is not numeric")
+
+            numbers = self.numbers[name]
+            valid = ~np.isnan(numbers)
+            counts = np.bincount(inverse[valid], minlength=groups)
+            if aggregation in ("sum", "mean"):
+                sums = np.bincount(inverse[valid], weights=numbers[valid], minlength=groups)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    result = sums if aggregation == "sum" else sums / counts
+            else:
+                reducer = np.minimum if aggregation == "min" else np.maximum
+                result = np.full(groups, np.inf if aggregation == "min" else -np.inf)
+                reducer.at(result, inverse[valid], numbers[valid])
+            if aggregation != "sum":
+                result = np.where(counts > 0, result, np.nan)
+            results[f"{name}_{aggregation}"] = result
+
+        rows = []
+        for position, key in enumerate(keys):
+            row = {column: key}
+            for name, result in results.items():
+                value = result[position].item()
+                row[name] = None if isinstance(value, float) and np.isnan(value) else value
+            rows.append(row)
+        return rows
+
+    def head(self, limit: int):
+        return self._take(slice(0, limit))
+
+    def to_rows(self, include_header: bool = True):
+        rows = [list(row) for row in zip(*(self.cells[name] for name in self.header))] if self.header else []
+        return [list(self.header)] + rows if include_header else rows
@@ -0,0 +1,35 @@
+import threading
+from contextlib import contextmanager
+
+
+class SingleFlight:
+    """
+    Per-key in-process locks. Callers holding the same key run one at a time,
+    so the first one does the work and the rest can reuse its result.
+    Locks are dropped once no caller holds or waits on them.
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def lock(self, key):
+        with self._guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    def in_flight(self) -> int:
+        with self._guard:
+            return len(self._locks)
@@ -0,0 +1,113 @@
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from django.db import close_old_connections
+from utils.constants import get_env_variable
+
+
+logger = logging.getLogger('django')
+
+
+class TokenRefresher:
+    """
+    Background scheduler that renews Google access tokens a configurable
+    margin before they expire, so token expiry never lands on a user request.
+
+    Each uid is scheduled at most once; scheduling it again only moves the
+    refresh earlier. Refreshes run on a single daemon thread.
+    """
+
+    def __init__(self, margin: int = None):
+        if margin is None:
+            margin = int(get_env_variable("GOOGLE_TOKEN_REFRESH_MARGIN") or 600)
+        self.margin = margin
+        self._queue = []
+        self._scheduled = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.margin > 0
+
+    def seconds_left(self, expiry: datetime) -> float:
+        """Seconds until a naive UTC expiry (as stored on Credentials) is reached."""
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (expiry - now).total_seconds()
+
+    def schedule(self, uid: str, expiry: datetime, apps: list = None) -> None:
+        """Schedule a refresh for `uid` `margin` seconds before `expiry`."""
+        if not self.enabled or not uid or expiry is None:
+            return
+
+        due = time.monotonic() + max(self.seconds_left(expiry) - self.margin, 0)
+        with self._condition:
+            current = self._scheduled.get(uid)
+            if current and current[0] <= due:
+                return
+            self._scheduled[uid] = (due, tuple(apps or ['all']))
+            heapq.heappush(self._queue, (due, uid))
+            self._start()
+            self._condition.notify()
+
+    def cancel(self, uid: str) -> None:
+        with self._condition:
+            self._scheduled.pop(uid, None)
+
+    def pending(self) -> int:
+        with self._condition:
+            return len(self._scheduled)
+
+    def _start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="google-token-refresher", daemon=True
+            )
+            self._thread.start()
+
+    def _next(self):
+        """Block until a refresh is due and return (uid, apps)."""
+        with self._condition:
+            while True:
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+
+                due, uid = self._queue[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(timeout=delay)
+                    continue
+
+                heapq.heappop(self._queue)
+                entry = self._scheduled.get(uid)
+                # Entries superseded by an earlier schedule or cancelled are skipped
+                if not entry or entry[0] != due:
+                    continue
+                del self._scheduled[uid]
+                return uid, list(entry[1])
+
+    def _run(self) -> None:
+        while True:
+            uid, apps = self._next()
+            try:
+                self._refresh(uid, apps)
+            except Exception as e:
+                logger.error(f"Background token refresh failed for {uid}: {str(e)}")
+            finally:
+                close_old_connections()
+
+    def _refresh(self, uid: str, apps: list) -> None:
+        from google_apis.util.Auth import Auth
+
+        auth = Auth(uid, apps=apps)
+        if auth.creds and auth.creds.expiry and self.seconds_left(auth.creds.expiry) > self.margin:
+            # Another worker already renewed this token
+            return
+        if not auth.refresh_token():
+            logger.info(f"Background token refresh skipped for {uid}")
+
+
+token_refresher = TokenRefresher()
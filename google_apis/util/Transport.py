@@ -0,0 +1,208 @@
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
+from google.auth.transport.requests import Request
+from google_apis.util.RateLimiter import api_name, rate_limiter
+from utils.constants import get_env_variable
+
+
+logger = logging.getLogger('django')
+
+POOL_CONNECTIONS = int(get_env_variable("GOOGLE_HTTP_POOL_CONNECTIONS") or 10)
+POOL_MAXSIZE = int(get_env_variable("GOOGLE_HTTP_POOL_MAXSIZE") or 32)
+TIMEOUT = float(get_env_variable("GOOGLE_HTTP_TIMEOUT") or 60)
+# Status codes that mean the access token should be refreshed and the call retried
+REFRESH_STATUS_CODES = (401,)
+MAX_REFRESH_ATTEMPTS = 2
+# Throttled calls are delayed and resent this many times before the error is returned
+MAX_RATE_LIMIT_RETRIES = int(get_env_variable("GOOGLE_RATE_LIMIT_RETRIES") or 3)
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def batch_size(headers: dict, body) -> int:
+    """Number of API calls a request carries: the parts of a batch request, otherwise one."""
+    content_type = next((value for key, value in headers.items() if key.lower() == "content-type"), "")
+    if not content_type.startswith("multipart/mixed") or "boundary=" not in content_type or not isinstance(body, (str, bytes)):
+        return 1
+    boundary = content_type.split("boundary=", 1)[1].split(";")[0].strip().strip('"')
+    if isinstance(body, str):
+        body = body.encode()
+    # Every part opens with a "--boundary" line; the closing delimiter has a trailing "--"
+    delimiter = re.compile(rb"^--" + re.escape(boundary.encode()) + rb"\r?$", re.MULTILINE)
+    return max(len(delimiter.findall(body)), 1)
+
+
+def get_session() -> requests.Session:
+    """
+    Process-wide keep-alive session shared by every Google API client.
+    urllib3 pools are thread safe, so one session serves all worker threads.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=POOL_CONNECTIONS,
+                    pool_maxsize=POOL_MAXSIZE,
+                    pool_block=False,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+class PooledHttp:
+    """
+    httplib2.Http look-alike that googleapiclient can use as its transport.
+    Requests go through the shared pooled session and are authorized with the
+    bound credentials. `refresh` is called to obtain fresh credentials when the
+    token is invalid or rejected; without it the credentials refresh themselves.
+
+    Calls are paced by the rate limiter under (api, user, project), and
+    throttled calls are delayed and resent instead of failing.
+    """
+
+    def __init__(self, credentials, refresh=None, timeout: float = None, user: str = None, limiter=None):
+        self.credentials = credentials
+        self.timeout = timeout or TIMEOUT
+        self.user = user
+        self.limiter = limiter or rate_limiter
+        self._refresh = refresh
+        self._session = get_session()
+        self._request = Request(session=self._session)
+
+    def refresh_credentials(self) -> None:
+        if self._refresh:
+            self.credentials = self._refresh()
+        else:
+            self.credentials.refresh(self._request)
+
+    def request(
+        self,
+        uri,
+        method="GET",
+        body=None,
+        headers=None,
+        redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+        connection_type=None,
+        _credential_refresh_attempt=0,
+        _rate_limit_attempt=0,
+    ):
+        request_headers = dict(headers) if headers else {}
+        project = getattr(self.credentials, "quota_project_id", None) or getattr(self.credentials, "client_id", None)
+        limit_keys = self.limiter.keys(api_name(uri), self.user, project)
+        self.limiter.acquire(limit_keys, batch_size(request_headers, body))
+
+        if not self.credentials.valid and self._refresh:
+            self.refresh_credentials()
+        self.credentials.before_request(self._request, method, uri, request_headers)
+
+        body_position = body.tell() if hasattr(body, "seek") and hasattr(body, "tell") else None
+
+        response = self._session.request(
+            method,
+            uri,
+            data=body,
+            headers=request_headers,
+            timeout=self.timeout,
+            allow_redirects=method in ("GET", "HEAD") and redirections > 0,
+        )
+
+        if (
+            response.status_code in REFRESH_STATUS_CODES
+            and _credential_refresh_attempt < MAX_REFRESH_ATTEMPTS
+        ):
+            logger.info(f"Refreshing credentials after a {response.status_code} response")
+            self.refresh_credentials()
+            if body_position is not None:
+                body.seek(body_position)
+            return self.request(
+                uri,
+                method,
+                body=body,
+                headers=headers,
+                redirections=redirections,
+                connection_type=connection_type,
+                _credential_refresh_attempt=_credential_refresh_attempt + 1,
+                _rate_limit_attempt=_rate_limit_attempt,
+            )
+
+        if self._is_throttled(response):
+            retry_after = self._retry_after(response)
+            delay = 2 ** _rate_limit_attempt if retry_after is None else retry_after
+            self.limiter.throttle(limit_keys, delay)
+            if _rate_limit_attempt < MAX_RATE_LIMIT_RETRIES:
+                logger.info(f"Delaying call to {api_name(uri)} after a {response.status_code} response")
+                if not limit_keys:
+                    # No bucket holds the retry back, so wait here
+                    time.sleep(min(delay, self.limiter.max_wait))
+                if body_position is not None:
+                    body.seek(body_position)
+                return self.request(
+                    uri,
+                    method,
+                    body=body,
+                    headers=headers,
+                    redirections=redirections,
+                    connection_type=connection_type,
+                    _credential_refresh_attempt=_credential_refresh_attempt,
+                    _rate_limit_attempt=_rate_limit_attempt + 1,
+                )
+        else:
+            self.limiter.succeed(limit_keys)
+
+        return self._to_httplib2(response), response.content
+
+    @staticmethod
+    def _is_throttled(response: requests.Response) -> bool:
+        if response.status_code == 429:
+            return True
+        if response.status_code != 403:
+            return False
+        try:
+            errors = response.json().get("error", {}).get("errors", [])
+        except (ValueError, AttributeError):
+            return False
+        return any(error.get("reason") in RATE_LIMIT_REASONS for error in errors)
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> float | None:
+        """Seconds from a Retry-After header, given either as seconds or as an HTTP date."""
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+    def _to_httplib2(self, response: requests.Response) -> httplib2.Response:
+        info = {
+            key: value
+            for key, value in response.headers.items()
+            # requests already decoded the body, so these no longer describe it
+            if key.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+        }
+        info["status"] = str(response.status_code)
+        result = httplib2.Response(info)
+        result.reason = response.reason
+        return result
+
+    def close(self) -> None:
+        """The pool is shared across requests, so there is nothing to close."""
+        pass
@@ -0,0 +1,187 @@
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from django.db import close_old_connections
+from google_apis.util.A1 import parse_range, format_range
+from utils.constants import get_env_variable
+
+
+logger = logging.getLogger('django')
+
+
+class _Batch:
+    __slots__ = ("rows", "waiters", "deadline", "attempts")
+
+    def __init__(self, deadline: float):
+        self.rows = []
+        self.waiters = []
+        self.deadline = deadline
+        self.attempts = 0
+
+
+def _append_with_sheet(uid, sheet_id, range_name, value_input_option, values):
+    from google_apis.util.Sheet import Sheet
+
+    with Sheet(uid) as sheet:
+        if isinstance(sheet, dict):
+            raise PermissionError(sheet.get("error") or sheet)
+        return sheet.append_values(sheet_id, range_name, value_input_option, values)
+
+
+class AppendBuffer:
+    """
+    Opt-in write-behind buffer for Sheet.append_values. Rows appended to the
+    same (uid, spreadsheet, range, value input option) within `window` seconds
+    are sent as one append; a batch is sent early once it holds `max_rows` rows.
+
+    `append` returns a Future that resolves to that caller's share of the
+    append response, or fails with the error of the whole batch. A failed
+    batch is re-queued up to `retries` times, waiting `backoff` seconds and
+    doubling each time; appends are not idempotent, so a retry after a write
+    that did land duplicates its rows. Batches that still fail are recorded
+    per spreadsheet until `take_failures` is called. Pending rows are flushed
+    on interpreter shutdown.
+    """
+
+    def __init__(self, window: float = None, max_rows: int = None, writer=None,
+                 retries: int = None, backoff: float = None):
+        if window is None:
+            window = float(get_env_variable("GOOGLE_SHEET_APPEND_WINDOW") or 0.5)
+        if max_rows is None:
+            max_rows = int(get_env_variable("GOOGLE_SHEET_APPEND_MAX_ROWS") or 500)
+        if retries is None:
+            retries = int(get_env_variable("GOOGLE_SHEET_APPEND_RETRIES") or 3)
+        if backoff is None:
+            backoff = float(get_env_variable("GOOGLE_SHEET_APPEND_BACKOFF") or 1.0)
+        self.window = window
+        self.max_rows = max_rows
+        self.retries = retries
+        self.backoff = backoff
+        self.writer = writer or _append_with_sheet
+        self._batches = {}
+        self._failures = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def append(self, uid, sheet_id, range_name, value_input_option, values, callback=None) -> Future:
+        """Queue rows for appending; `callback(future)` runs once they are delivered."""
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+
+        key = (uid, sheet_id, range_name, value_input_option)
+        with self._condition:
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = self._batches[key] = _Batch(time.monotonic() + self.window)
+            batch.waiters.append((future, len(batch.rows), len(values)))
+            batch.rows.extend(values)
+            if len(batch.rows) >= self.max_rows:
+                batch.deadline = 0
+            self._start()
+            self._condition.notify()
+        return future
+
+    def pending(self) -> int:
+        """Number of rows waiting to be flushed."""
+        with self._condition:
+            return sum(len(batch.rows) for batch in self._batches.values())
+
+    def take_failures(self, uid, sheet_id) -> list:
+        """Return and forget the batches for this spreadsheet that were given up on."""
+        with self._condition:
+            return self._failures.pop((uid, sheet_id), [])
+
+    def flush(self) -> None:
+        """Send every pending batch now, from the calling thread, retrying in place."""
+        with self._condition:
+            batches = list(self._batches.items())
+            self._batches.clear()
+        for key, batch in batches:
+            while self._deliver(key, batch):
+                time.sleep(self._retry_delay(batch))
+                batch.attempts += 1
+
+    def _start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="google-sheet-append-buffer", daemon=True
+            )
+            self._thread.start()
+
+    def _next(self):
+        """Block until a batch is due and return (key, batch)."""
+        with self._condition:
+            while True:
+                if not self._batches:
+                    self._condition.wait()
+                    continue
+
+                key, batch = min(self._batches.items(), key=lambda item: item[1].deadline)
+                delay = batch.deadline - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(timeout=delay)
+                    continue
+                del self._batches[key]
+                return key, batch
+
+    def _run(self) -> None:
+        while True:
+            key, batch = self._next()
+            try:
+                if self._deliver(key, batch):
+                    self._requeue(key, batch)
+            finally:
+                close_old_connections()
+
+    def _retry_delay(self, batch: _Batch) -> float:
+        return self.backoff * 2 ** batch.attempts
+
+    def _requeue(self, key, batch: _Batch) -> None:
+        """Put a failed batch back ahead of any rows queued for the same range since."""
+        batch.deadline = time.monotonic() + self._retry_delay(batch)
+        batch.attempts += 1
+        with self._condition:
+            queued = self._batches.get(key)
+            if queued is not None:
+                shift = len(batch.rows)
+                batch.rows.extend(queued.rows)
+                batch.waiters.extend((future, offset + shift, count) for future, offset, count in queued.waiters)
+            self._batches[key] = batch
+            self._condition.notify()
+
+    def _deliver(self, key, batch: _Batch) -> bool:
+        """Send one batch. Returns True when it failed and should be retried."""
+        uid, sheet_id, range_name, value_input_option = key
+        try:
+            response = self.writer(uid, sheet_id, range_name, value_input_option, batch.rows)
+        except Exception as e:
+            if batch.attempts < self.retries and not isinstance(e, PermissionError):
+                logger.warning(f"Buffered append of {len(batch.rows)} rows to {sheet_id} failed, retrying: {str(e)}")
+                return True
+            logger.error(f"Buffered append of {len(batch.rows)} rows to {sheet_id} failed: {str(e)}")
+            with self._condition:
+                self._failures.setdefault((uid, sheet_id), []).append(
+                    {"range": range_name, "rows": len(batch.rows), "error": str(e)}
+                )
+            for future, _, _ in batch.waiters:
+                future.set_exception(e)
+            return False
+
+        updates = (response or {}).get("updates", {})
+        written = parse_range(updates.get("updatedRange") or "")
+        for future, offset, count in batch.waiters:
+            result = {"spreadsheetId": sheet_id, "batchedRows": len(batch.rows), "batchRange": updates.get("updatedRange")}
+            if written is not None and count:
+                first_row = written.first_row + offset
+                result["updatedRange"] = format_range(
+                    written.tab, first_row, first_row + count - 1, written.first_col, written.last_col
+                )
+            future.set_result(result)
+        return False
+
+
+append_buffer = AppendBuffer()
+atexit.register(append_buffer.flush)
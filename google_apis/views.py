@@ -1,5 +1,6 @@
 from google_apis.util.Auth import Auth
 from google_apis.util.Doc import Doc
+from google_apis.util.RateLimiter import rate_limiter
 from django.http import JsonResponse
 from django.http.request import HttpRequest
 from django.views.decorators.csrf import csrf_exempt
@@ -145,3 +146,25 @@ def add_content(request: HttpRequest, doc_id: str):
             "message": "Content addition failed"
         })
     
+
+
+@require_GET
+def rate_limits(request: HttpRequest):
+    """
+        Current utilization of a user's Google API rate limit buckets.
+
+        Query Parameters:
+        - `tool_id` (str): The user whose buckets are shown (required)
+    """
+    tool_id = request.GET.get("tool_id")
+    if not tool_id:
+        return JsonResponse({
+            "error": "User ID is required",
+            "status": False,
+            "message": "Rate limit retrieval failed"
+        }, status=400)
+    return JsonResponse({
+        "result": rate_limiter.utilization(tool_id),
+        "status": True,
+        "message": "Rate limits retrieved successfully"
+    })